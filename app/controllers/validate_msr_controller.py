@@ -1,14 +1,163 @@
 """
     Controller to co-ordinate the MSR tests
 """
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator
+from typing import Any
+
+import httpx
+
+from app.model.batch_test_results import BatchTestResults, TargetTestResults
+from app.model.test_data import TestData
+from app.model.test_result import TestResult
+from app.services.blob_store import BlobStore
+from app.services.errors import describe_error, first_error
+from app.services.result_store import ResultStore
+from app.test_scripts.msr_openapi_validator import MsrOpenApiValidator
+
 
 class ValidateMsrController:
     """
-        Co-ordinate the MSR testing
+        Co-ordinate the MSR testing. Endorses a batch of MSRs concurrently, limited
+        both in total and per host so one deployment is not flooded when it hosts
+        several targets. The compiled schemas, the key caches and the pooled
+        connections are process wide, so every endorsement in the batch shares them.
     """
 
-    test_url : str
+    api_path : str
+    max_concurrency : int
+    max_per_host : int
+    result_store : ResultStore | None
+    blob_store : BlobStore | None
+
+    def __init__(self, api_path : str, max_concurrency : int = 8, max_per_host : int = 2,
+                 result_store : ResultStore | None = None, blob_store : BlobStore | None = None):
+        self.api_path = api_path
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.result_store = result_store
+        self.blob_store = blob_store
+
+    async def validate(self, targets : list[TestData]) -> BatchTestResults:
+        """
+        Endorse every target
+        :param targets: The MSRs to test
+        :return: the results of each target, in the order given, and the batch timing
+        """
+        limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits : dict[str, asyncio.Semaphore] = {}
+        for test_data in targets:
+            host_limits.setdefault(self._host(test_data.test_url), asyncio.Semaphore(self.max_per_host))
+
+        start = time.perf_counter()
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(self._validate_target(test_data, limit,
+                                                             host_limits[self._host(test_data.test_url)]))
+                     for test_data in targets]
+        elapsed = time.perf_counter() - start
+
+        results = [task.result() for task in tasks]
+        target_times = [result.elapsed for result in results]
+        passed = sum(1 for result in results if result.success)
+
+        return BatchTestResults(results=results,
+                                passed=passed,
+                                failed=len(results) - passed,
+                                elapsed=elapsed,
+                                target_time=sum(target_times),
+                                mean_elapsed=sum(target_times) / len(target_times) if target_times else 0.0,
+                                max_elapsed=max(target_times, default=0.0))
+
+    async def stream(self, test_data : TestData) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+        """
+        Endorse one target, yielding each test result the moment its test finishes.
+        Closing the iterator cancels the tests that are still running.
+        :param test_data: The MSR to test
+        :return: ("result", result) for each test, then ("summary", totals) or ("error", reason)
+        """
+        results : asyncio.Queue[TestResult] = asyncio.Queue()
+        start = time.perf_counter()
+        task : asyncio.Task | None = None
+        passed = failed = 0
+
+        try:
+            # Bad credentials are reported as an error event like any other failure
+            validator = MsrOpenApiValidator(test_data, self.api_path, self.result_store, self.blob_store)
+            task = asyncio.create_task(validator.validate_msr_async(results.put_nowait))
+
+            while not task.done() or not results.empty():
+                next_result = asyncio.ensure_future(results.get())
+                await asyncio.wait([next_result, task], return_when=asyncio.FIRST_COMPLETED)
+                if not next_result.done():
+                    next_result.cancel()
+                    continue
+
+                result = next_result.result()
+                passed += result.test_success
+                failed += not result.test_success
+                yield "result", {**result.model_dump(), "offset" : time.perf_counter() - start}
+
+            test_results = task.result()
+            yield "summary", {"test_url" : test_data.test_url,
+                              "success" : failed == 0,
+                              "passed" : passed,
+                              "failed" : failed,
+                              "elapsed" : time.perf_counter() - start,
+                              "schema_verdicts" : [verdict.model_dump() for verdict in test_results.schema_verdicts],
+                              "profile" : test_results.profile.model_dump() if test_results.profile is not None else None}
+
+        except Exception as e:
+            logging.warning("Could not test %s: %r", test_data.test_url, first_error(e))
+            yield "error", {"test_url" : test_data.test_url,
+                            "error" : describe_error(e),
+                            "elapsed" : time.perf_counter() - start}
+
+        finally:
+            if task is not None and not task.done():
+                logging.info("Stopped testing %s", test_data.test_url)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+
+    async def _validate_target(self, test_data : TestData, limit : asyncio.Semaphore,
+                               host_limit : asyncio.Semaphore) -> TargetTestResults:
+        """
+        Endorse one target once a slot is free for it and for its host
+        :param test_data: The MSR to test
+        :param limit: The batch wide concurrency limit
+        :param host_limit: The concurrency limit of the target's host
+        :return: the results of the target, or why it could not be tested
+        """
+        queued_at = time.perf_counter()
+        async with host_limit, limit:
+            start = time.perf_counter()
+            try:
+                validator = MsrOpenApiValidator(test_data, self.api_path, self.result_store, self.blob_store)
+                results = await validator.validate_msr_async()
+                return TargetTestResults(test_url=test_data.test_url,
+                                         success=all(result.test_success for result in results.results),
+                                         results=results,
+                                         queued=start - queued_at,
+                                         elapsed=time.perf_counter() - start)
 
-    def __init__(self, test_url : str):
-        self.test_url = test_url
+            except Exception as e:
+                logging.warning("Could not test %s: %r", test_data.test_url, first_error(e))
+                return TargetTestResults(test_url=test_data.test_url,
+                                         success=False,
+                                         error=describe_error(e),
+                                         queued=start - queued_at,
+                                         elapsed=time.perf_counter() - start)
 
+    @staticmethod
+    def _host(test_url : str) -> str:
+        """
+        Return the host and port a target URL connects to
+        :param test_url: The MSR URL
+        :return: the host and port
+        """
+        try:
+            url = httpx.URL(test_url)
+            return f"{url.host}:{url.port or (443 if url.scheme == 'https' else 80)}"
+        except httpx.InvalidURL:
+            return test_url
@@ -0,0 +1,16 @@
+"""
+    The schema for a batch of MSRs to endorse
+"""
+from pydantic import BaseModel, Field
+
+from app.model.test_data import TestData
+
+
+class BatchTestData(BaseModel):
+    """
+        The MSRs to endorse and how many endorsements run at once, in total and against one host
+    """
+
+    targets : list[TestData] = Field(max_length=100)
+    max_concurrency : int = Field(default=8, ge=1, le=32)
+    max_per_host : int = Field(default=2, ge=1, le=8)
@@ -0,0 +1,40 @@
+"""
+    Class to store the test results of a batch of MSRs
+"""
+from pydantic import BaseModel
+
+from app.model.test_results import TestResults
+
+
+class TargetTestResults(BaseModel):
+    """
+        Store the test results of one MSR in a batch
+
+        queued: Seconds spent waiting for a concurrency slot
+        elapsed: Seconds spent running the tests
+        error: Why the tests could not be run, empty when they ran
+    """
+
+    test_url : str
+    success : bool
+    results : TestResults | None = None
+    error : str = ""
+    queued : float = 0.0
+    elapsed : float = 0.0
+
+
+class BatchTestResults(BaseModel):
+    """
+        Store the test results of a batch and the timing across all MSRs
+
+        elapsed: Wall clock seconds for the whole batch
+        target_time: The sum of the seconds each MSR spent running its tests
+    """
+
+    results : list[TargetTestResults] = []
+    passed : int = 0
+    failed : int = 0
+    elapsed : float = 0.0
+    target_time : float = 0.0
+    mean_elapsed : float = 0.0
+    max_elapsed : float = 0.0
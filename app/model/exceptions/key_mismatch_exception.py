@@ -0,0 +1,9 @@
+"""
+    Exception thrown if a private key does not
+    belong to the certificate it is submitted with
+"""
+
+class KeyMismatchException(Exception):
+    """
+        Exception thrown if the public key of a private key differs from that of the certificate
+    """
@@ -0,0 +1,9 @@
+"""
+    Exception thrown if a schema uses a keyword the
+    validator generator cannot compile
+"""
+
+class UnsupportedSchemaException(Exception):
+    """
+        Exception thrown if a schema cannot be compiled to a validation function
+    """
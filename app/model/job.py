@@ -0,0 +1,31 @@
+"""
+    The status of a queued endorsement run
+"""
+from typing import Literal
+
+from pydantic import BaseModel
+
+from app.model.test_results import TestResults
+
+
+class Job(BaseModel):
+    """
+        An endorsement run executed in the background. While the job runs, results
+        holds the tests that have finished so far. Times are seconds since the epoch.
+
+        started_at: When the latest attempt started
+        queue_wait: Seconds between submitting the job and a worker first starting it
+        run_time: Seconds the latest attempt took
+    """
+
+    job_id : str
+    status : Literal["queued", "running", "finished", "failed"]
+    test_url : str
+    results : TestResults = TestResults()
+    error : str = ""
+    attempts : int = 0
+    created_at : float
+    started_at : float | None = None
+    finished_at : float | None = None
+    queue_wait : float | None = None
+    run_time : float | None = None
@@ -0,0 +1,44 @@
+"""
+    The schedule used to poll for the results of a global search
+"""
+from typing import Annotated, Literal
+
+from pydantic import BaseModel, Field
+
+# Bounds that keep a single run from polling for longer than a few minutes
+MAX_DELAY_SECONDS = 60.0
+MAX_ATTEMPTS = 20
+
+Delay = Annotated[float, Field(ge=0, le=MAX_DELAY_SECONDS)]
+
+
+class PollSchedule(BaseModel):
+    """
+        Delays between the retrieve result attempts. The fixed strategy uses the
+        delays as given, the exponential strategy starts at initial_delay and
+        multiplies it by backoff_factor after every attempt, up to max_delay.
+    """
+
+    strategy : Literal["fixed", "exponential"] = "fixed"
+    delays : list[Delay] = Field(default=[3.0, 3.0, 4.0], max_length=MAX_ATTEMPTS)
+    initial_delay : Delay = 0.5
+    backoff_factor : float = Field(default=2.0, ge=1, le=10)
+    max_delay : Delay = 8.0
+    max_attempts : int = Field(default=5, ge=1, le=MAX_ATTEMPTS)
+    stop_when_stable : bool = False
+
+    def get_delays(self) -> list[float]:
+        """
+        Return the delay before each attempt in seconds
+        :return: the list of delays
+        """
+        if self.strategy == "exponential":
+            delays = []
+            delay = min(self.initial_delay, self.max_delay)
+            for _ in range(self.max_attempts):
+                delays.append(delay)
+                # Capping before the next multiplication keeps the delay from overflowing
+                delay = min(delay * self.backoff_factor, self.max_delay)
+            return delays
+
+        return list(self.delays)
@@ -0,0 +1,20 @@
+"""
+    Where the trace and profile of a run were written
+"""
+from pydantic import BaseModel
+
+
+class ProfileReport(BaseModel):
+    """
+        The output of a profiled run
+
+        trace_file: The spans of the run as OpenTelemetry (OTLP) JSON
+        profile_file: The cProfile statistics in pstats format, when the run was profiled
+        note: Why the run was not profiled, when it was asked to be
+    """
+
+    trace_id : str
+    trace_file : str
+    span_count : int
+    profile_file : str | None = None
+    note : str = ""
@@ -0,0 +1,19 @@
+"""
+    Store whether the captured responses conform to one schema version
+"""
+from pydantic import BaseModel
+
+
+class SchemaVerdict(BaseModel):
+    """
+        One row of the verdict matrix: the responses captured by the tests,
+        validated against one schema version
+
+        verdicts: Whether each test's response conforms, by test name
+        failure_reasons: Why a response does not conform, for the tests that failed
+    """
+
+    schema_version : str
+    conforms : bool
+    verdicts : dict[str, bool] = {}
+    failure_reasons : dict[str, str] = {}
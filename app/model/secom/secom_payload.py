@@ -0,0 +1,131 @@
+"""
+    Field order specification shared by the Secom dictionary and the signing payload
+"""
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+
+def _same(value : Any) -> Any:
+    return value
+
+
+class SecomField(NamedTuple):
+    """
+        One field of a Secom object, in signing payload order
+
+        attribute: The name of the attribute on the object
+        secom_key: The key used in the Secom dictionary
+        to_payload: Renders the value as a payload segment, None to leave the field out of
+                    the payload. The renderer may return None to drop the segment and its separator.
+        to_secom: Converts the value for the Secom dictionary
+        include_none: Add the key to the Secom dictionary even when the value is None
+        mutable: The value can change without being reassigned (lists and nested objects)
+    """
+
+    attribute : str
+    secom_key : str
+    to_payload : Callable[[Any], str | None] | None
+    to_secom : Callable[[Any], Any] = _same
+    include_none : bool = False
+    mutable : bool = False
+
+
+class SecomPayloadObject:
+    """
+        Base class for Secom objects that are signed. The signing payload and the Secom
+        dictionary are both built from _secom_fields in one pass and cached until
+        one of the fields is assigned or a list or nested object in them changes.
+    """
+
+    _secom_fields : tuple[SecomField, ...] = ()
+    _secom_field_names : frozenset[str] = frozenset()
+    _secom_cache : tuple[tuple, str, bytes, dict] | None = None
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._secom_field_names = frozenset(field.attribute for field in cls._secom_fields)
+
+    def __setattr__(self, name : str, value : Any) -> None:
+        object.__setattr__(self, name, value)
+        if name in self._secom_field_names:
+            object.__setattr__(self, "_secom_cache", None)
+
+    def _mutable_state(self) -> tuple:
+        """
+        Capture the parts of the fields that can change without an assignment
+        :return: a tuple that compares equal while those parts are unchanged
+        """
+        state = []
+        for field in self._secom_fields:
+            if field.mutable:
+                value = getattr(self, field.attribute)
+                if isinstance(value, SecomPayloadObject):
+                    state.append(value._render())
+                elif isinstance(value, list):
+                    state.append(tuple(value))
+                else:
+                    state.append(value)
+        return tuple(state)
+
+    def _render(self) -> tuple[tuple, str, bytes, dict]:
+        """
+        Build the signing payload and the Secom dictionary, reusing the cached
+        result while the fields are unchanged
+        :return: the mutable state, the payload as a string and as bytes, and the dictionary
+        """
+        state = self._mutable_state()
+        cache = self._secom_cache
+        if cache is not None and cache[0] == state:
+            return cache
+
+        segments : list[str] = []
+        dictionary : dict[str, Any] = {}
+
+        for field in self._secom_fields:
+            value = getattr(self, field.attribute)
+
+            if field.to_payload is not None:
+                segment = field.to_payload(value)
+                if segment is not None:
+                    segments.append(segment)
+
+            if value is not None or field.include_none:
+                dictionary[field.secom_key] = field.to_secom(value)
+
+        payload = ".".join(segments)
+        cache = (state, payload, payload.encode('utf-8'), dictionary)
+        object.__setattr__(self, "_secom_cache", cache)
+        return cache
+
+    def payload_to_string(self) -> str:
+        """
+        Return the signing payload as a string
+        :return: The contents of the object in signing order
+        """
+        return self._render()[1]
+
+    def payload_to_bytes(self) -> bytes:
+        """
+        Return the signing payload as bytes for signature generation
+        :return: The contents of the object in signing order
+        """
+        return self._render()[2]
+
+    def to_secom_dict(self) -> dict[str, Any]:
+        """
+            Convert the object to Secom compatible dict
+        """
+        return dict(self._render()[3])
+
+
+def optional(render : Callable[[Any], str]) -> Callable[[Any], str]:
+    """
+    Wrap a renderer so None values become an empty segment
+    :param render: Renders a value that is not None
+    :return: the wrapped renderer
+    """
+    return lambda value: render(value) if value is not None else ""
+
+
+def lower(value : Any) -> str:
+    return str(value).lower()
@@ -3,28 +3,28 @@
 """
 from datetime import datetime
 from app.model.secom.secom_constants import SecomConstants as sc
+from app.model.secom.secom_payload import SecomField, SecomPayloadObject, lower
 
-class SecomEnvelope:
+
+def _certificates_payload(certificates : list[str]) -> str:
+    return "[" + ".".join(certificates) + "]" if certificates else "]"
+
+
+class SecomEnvelope(SecomPayloadObject):
 
     envelope_signature_certificate : list[str] = [""]
     envelope_root_certificate_thumbprint : str = "asd"
     envelope_signature_time : datetime = datetime.now()
     envelope_signature_reference : str = "asdf"
 
-    def payload_to_bytes(self) -> bytes:
-        """
-        Return the envelope as bytes
-        :return: The contents of the envelope as bytes
-        """
-        payload = ""
-
-        payload += "["
-        for certificate in self.envelope_signature_certificate:
-            payload += certificate + "."
-        payload = payload[:-1] + "]."
-
-        payload += self.envelope_root_certificate_thumbprint + "."
-        payload += str(int(self.envelope_signature_time.timestamp())) + "."
-        payload += self.envelope_signature_reference.lower()
-
-        return bytes(payload, encoding='utf-8')
\ No newline at end of file
+    _secom_fields = (
+        SecomField("envelope_signature_certificate", "envelopeSignatureCertificate",
+                   _certificates_payload, list, include_none=True, mutable=True),
+        SecomField("envelope_root_certificate_thumbprint", "envelopeRootCertificateThumbprint",
+                   str, include_none=True),
+        SecomField("envelope_signature_time", "envelopeSignatureTime",
+                   lambda time: str(int(time.timestamp())),
+                   lambda time: time.strftime(sc.DATETIME_FORMAT_v2), include_none=True),
+        SecomField("envelope_signature_reference", "envelopeSignatureReference",
+                   lower, include_none=True),
+    )
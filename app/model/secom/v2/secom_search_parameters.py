@@ -2,9 +2,21 @@
     Implementation of the Secom Search Parameters object
 """
 from app.model.secom.enums.data_product_type import DataProductType
+from app.model.secom.secom_payload import SecomField, SecomPayloadObject, lower, optional
 
 
-class SecomSearchParameters:
+def _keywords_payload(keywords : list[str] | None) -> str | None:
+    if keywords is None:
+        return ""
+
+    # An empty list adds no segment at all
+    if not keywords:
+        return None
+
+    return ".".join(keyword.lower() for keyword in keywords)
+
+
+class SecomSearchParameters(SecomPayloadObject):
     """
         Secom Search Parameters class implementation
     """
@@ -25,6 +37,27 @@ class SecomSearchParameters:
     unlocode : str | None
     endpoint_uri : str | None
 
+    # The organisation ID is sent but is not part of the signing payload
+    _secom_fields = (
+        SecomField("name", "name", optional(str)),
+        SecomField("status", "status", optional(str)),
+        SecomField("version", "version", optional(lower)),
+        SecomField("keywords", "keywords", _keywords_payload, list, mutable=True),
+        SecomField("description", "description", optional(lower)),
+        SecomField("data_product_type", "dataProductType",
+                   optional(lambda data_product_type: data_product_type.name.lower()),
+                   lambda data_product_type: data_product_type.name),
+        SecomField("specification_id", "specificationId", optional(lower)),
+        SecomField("design_id", "designId", optional(lower)),
+        SecomField("instance_id", "instanceId", optional(lower)),
+        SecomField("organization_id", "organizationId", None),
+        SecomField("mmsi", "mmsi", optional(lower)),
+        SecomField("imo", "imo", optional(lower)),
+        SecomField("service_type", "serviceType", optional(lower)),
+        SecomField("unlocode", "unlocode", optional(lower)),
+        SecomField("endpoint_uri", "endpointUri", optional(lower)),
+    )
+
 
     def __init__(self, **filters) -> None:
         self.name = filters.get("name", None)
@@ -42,100 +75,3 @@ class SecomSearchParameters:
         self.service_type = filters.get("service_type", None)
         self.unlocode = filters.get("unlocode", None)
         self.endpoint_uri =  filters.get("endpoint_uri", None)
-
-
-    def to_secom_dict(self) -> dict[str, str | list[str]]:
-        """
-            Convert object to a Secom capatible dictionary
-        """
-
-        dictionary : dict[str, str | list[str]] = {}
-
-        if self.name is not None:
-            dictionary["name"] = self.name
-
-        if self.status is not None:
-            dictionary["status"] = self.status
-
-        if self.version is not None:
-            dictionary["version"] = self.version
-
-        if self.keywords is not None:
-            dictionary["keywords"] = self.keywords
-
-        if self.description is not None:
-            dictionary["description"] = self.description
-
-        if self.data_product_type is not None:
-            dictionary["dataProductType"] = self.data_product_type.name
-
-        if self.specification_id is not None:
-            dictionary["specificationId"] = self.specification_id
-
-        if self.design_id is not None:
-            dictionary["designId"] = self.design_id
-
-        if self.instance_id is not None:
-            dictionary["instanceId"] = self.instance_id
-
-        if self.organization_id is not None:
-            dictionary["organizationId"] = self.organization_id
-
-        if self.mmsi is not None:
-            dictionary["mmsi"] = self.mmsi
-
-        if self.imo is not None:
-            dictionary["imo"] = self.imo
-
-        if self.service_type is not None:
-            dictionary["serviceType"] = self.service_type
-
-        if self.unlocode is not None:
-            dictionary["unlocode"] = self.unlocode
-
-        if self.endpoint_uri is not None:
-            dictionary["endpointUri"] = self.endpoint_uri
-
-        return dictionary
-
-    def payload_to_bytes(self) -> bytes:
-        """
-        Generate the payload as a string for signature generation
-        :return: a byte string
-        """
-
-        payload = ""
-        payload += self.name if self.name is not None else ""
-        payload += "."
-        payload += self.status if self.status is not None else ""
-        payload += "."
-        payload += self.version.lower() if self.version is not None else ""
-        payload += "."
-
-        if self.keywords is not None:
-            for keyword in self.keywords:
-                payload += keyword.lower() + "."
-        else:
-            payload += "."
-
-        payload += self.description.lower() if self.description is not None else ""
-        payload += "."
-        payload += self.data_product_type.name.lower() if self.data_product_type is not None else ""
-        payload += "."
-        payload += self.specification_id.lower() if self.specification_id is not None else ""
-        payload += "."
-        payload += self.design_id.lower() if self.design_id is not None else ""
-        payload += "."
-        payload += self.instance_id.lower() if self.instance_id is not None else ""
-        payload += "."
-        payload += self.mmsi.lower() if self.mmsi is not None else ""
-        payload += "."
-        payload += self.imo.lower() if self.imo is not None else ""
-        payload += "."
-        payload += self.service_type.lower() if self.service_type is not None else ""
-        payload += "."
-        payload += self.unlocode.lower() if self.unlocode is not None else ""
-        payload += "."
-        payload += self.endpoint_uri.lower() if self.endpoint_uri is not None else ""
-
-        return bytes(payload, encoding='utf-8')
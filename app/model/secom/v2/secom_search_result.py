@@ -9,11 +9,10 @@ class SecomSearchResult:
         Secom Search Result class
     """
 
+    __slots__ = ("service_instance",)
+
     service_instance : list[ServiceInstance]
 
     def __init__(self, results : dict) -> None:
 
-        self.service_instance = []
-
-        for result in results["serviceInstance"]:
-            self.service_instance.append(ServiceInstance(result))
\ No newline at end of file
+        self.service_instance = [ServiceInstance(result) for result in results["serviceInstance"]]
@@ -1,61 +1,86 @@
 """
     Implementation of the Secom Search Result
 """
+from collections.abc import Callable
+from typing import Any
 from uuid import UUID
 
 from app.model.secom.enums.data_product_type import DataProductType
 
+_missing = object()
+
+
+class _ResultField:
+    """
+        Reads a field from the underlying search result only when it is accessed
+    """
+
+    __slots__ = ("key", "default")
+
+    def __init__(self, key : str, default : Callable[[], Any]) -> None:
+        self.key = key
+        self.default = default
+
+    def __get__(self, instance : "ServiceInstance | None", owner : type) -> Any:
+        if instance is None:
+            return self
+
+        value = instance._result.get(self.key, _missing)
+        return self.default() if value is _missing else value
+
 
 class ServiceInstance:
     """
-        Secom Search Result class
+        Secom Search Result class. The instance keeps a reference to the decoded
+        search result and converts each field lazily, so large fields such as
+        instance_as_xml and coverage_area cost nothing unless they are read.
     """
-    transaction_id : UUID
-    instance_id : str
-    version : str
-    name : str
-    status : str
-    description : str
-    data_product_type : list[DataProductType] | None
-    organization_id : str
-    endpoint_uri : str
-    endpoint_type : str
-    keywords : list[str]
-    unlocode : list[str]
-    implements_designs : str
-    api_doc : str
-    coverage_area : list[str]
-    instance_as_xml : str
-    imo : int
-    mmsi : int
-    certificates : list[str]
-    source_msr : str
-    unsupported_params : list[str]
+
+    __slots__ = ("_result", "_transaction_id", "_data_product_type")
+
+    instance_id = _ResultField("instanceId", str)
+    version = _ResultField("version", str)
+    name = _ResultField("name", str)
+    status = _ResultField("status", str)
+    description = _ResultField("description", str)
+    organization_id = _ResultField("organizationId", str)
+    endpoint_uri = _ResultField("endpointUri", str)
+    endpoint_type = _ResultField("endpointType", str)
+    keywords = _ResultField("keywords", list)
+    unlocode = _ResultField("unlocode", list)
+    implements_designs = _ResultField("implementsDesigns", str)
+    api_doc = _ResultField("apiDoc", str)
+    coverage_area = _ResultField("coverageArea", list)
+    instance_as_xml = _ResultField("instanceAsXml", str)
+    imo = _ResultField("imo", int)
+    mmsi = _ResultField("mmsi", int)
+    certificates = _ResultField("certificates", list)
+    source_msr = _ResultField("sourceMSR", str)
+    unsupported_params = _ResultField("unsupportedParams", list)
 
     def __init__(self, result : dict) -> None:
-        transaction_id = result.get("transactionId", "")
-        if transaction_id is not None and transaction_id != "":
-            self.transaction_id = UUID(transaction_id)
-        self.instance_id = result.get("instanceId", "")
-        self.version = result.get("version", "")
-        self.name = result.get("name", "")
-        self.status = result.get("status", "")
-        self.description = result.get("description", "")
-
-        data_product_types = result.get("dataProductTypes", [])
-        for data_product_type in data_product_types:
-            self.data_product_type.append(DataProductType[data_product_type])
-        self.organization_id = result.get("organizationId", "")
-        self.endpoint_uri = result.get("endpointUri", "")
-        self.endpoint_type = result.get("endpointType", "")
-        self.keywords = result.get("keywords", [])
-        self.unlocode = result.get("unlocode", [])
-        self.implements_designs = result.get("implementsDesigns", "")
-        self.api_doc = result.get("apiDoc", "")
-        self.coverage_area = result.get("coverageArea", [])
-        self.instance_as_xml = result.get("instanceAsXml", "")
-        self.imo = result.get("imo", 0)
-        self.mmsi = result.get("mmsi", 0)
-        self.certificates = result.get("certificates", [])
-        self.source_msr = result.get("sourceMSR", "")
-        self.unsupported_params = result.get("unsupportedParams", [])
\ No newline at end of file
+        self._result = result
+        self._transaction_id = None
+        self._data_product_type = None
+
+    @property
+    def transaction_id(self) -> UUID:
+        """
+        The transaction id parsed as a UUID. Raises AttributeError when the
+        result has no transaction id, so hasattr can be used to check for one.
+        """
+        if self._transaction_id is None:
+            transaction_id = self._result.get("transactionId", "")
+            if transaction_id is None or transaction_id == "":
+                raise AttributeError("transaction_id")
+            self._transaction_id = UUID(transaction_id)
+
+        return self._transaction_id
+
+    @property
+    def data_product_type(self) -> list[DataProductType]:
+        if self._data_product_type is None:
+            self._data_product_type = [DataProductType[data_product_type]
+                                       for data_product_type in self._result.get("dataProductTypes", None) or []]
+
+        return self._data_product_type
@@ -0,0 +1,37 @@
+"""
+    Endorsement runs kept in the result history
+"""
+from pydantic import BaseModel
+
+
+class StoredTestResult(BaseModel):
+    """
+        A test result as kept in the history. The response is not kept, only its
+        reference in the blob store when it was stored there.
+    """
+
+    test_key : str
+    test_name : str
+    test_success : bool
+    failure_reason : str = ""
+    elapsed : float | None = None
+    response_ref : str | None = None
+
+
+class StoredRun(BaseModel):
+    """
+        An endorsement run kept in the history. started_at is seconds since the epoch.
+
+        certificate_fingerprint: SHA-256 of the client certificate the run used
+        schema_hash: SHA-256 of the OpenAPI schema file the responses were validated against
+    """
+
+    run_id : int
+    test_url : str
+    certificate_fingerprint : str
+    schema_hash : str
+    started_at : float
+    elapsed : float
+    passed : int
+    failed : int
+    results : list[StoredTestResult] = []
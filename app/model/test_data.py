@@ -2,10 +2,49 @@
     The schema for the data package
 """
 
-from pydantic import BaseModel
+from pathlib import Path
+from typing import Literal
+
+from pydantic import BaseModel, Field, field_validator
+
+from app.model.poll_schedule import PollSchedule
+
+SCHEMA_DIRECTORY = Path(__file__).resolve().parent.parent / "schema"
+
+# How the responses appear in the test results: in full, with lists cut to their
+# first item and long strings shortened, or not at all
+ResponseMode = Literal["inline", "truncate", "omit"]
+
+# Whether a run is traced, and whether it is also profiled with cProfile
+ProfileMode = Literal["off", "trace", "cprofile"]
+
+
+def schema_version_path(schema_version : str) -> str:
+    """
+    Return the path of the OpenAPI schema file for a schema version
+    :param schema_version: The name of a schema file in app/schema, without the extension
+    :return: the path of the schema file
+    """
+    return str(SCHEMA_DIRECTORY / f"{schema_version}.json")
+
 
 class TestData(BaseModel):
     test_url : str
     certificate : str
     private_key : str
-    root_certificate : str
\ No newline at end of file
+    root_certificate : str
+    max_concurrency : int = Field(default=4, ge=1, le=32)
+    poll_schedule : PollSchedule = PollSchedule()
+    stream_results : bool = False
+    schema_versions : list[str] = []
+    response_mode : ResponseMode = "inline"
+    profiling : ProfileMode = "off"
+
+    @field_validator("schema_versions")
+    @classmethod
+    def check_schema_versions(cls, schema_versions : list[str]) -> list[str]:
+        available = sorted(path.stem for path in SCHEMA_DIRECTORY.glob("*.json"))
+        for schema_version in schema_versions:
+            if schema_version not in available:
+                raise ValueError(f"Unknown schema version {schema_version}, expected one of {available}")
+        return schema_versions
@@ -7,12 +7,22 @@ from pydantic import BaseModel
 class TestResult(BaseModel):
     """
         Store a single test result
+
+        test_key: The name of the test in the test graph. Unlike test_name it does not
+                  include values specific to the target, so it identifies the test across runs.
+        elapsed: Seconds the test took, once it has run
+        timings: Seconds spent in each phase of the test, such as tls or schema_validate
+        response_ref: The reference of the full response in the blob store, when it is kept there
     """
 
     test_name : str
     test_success : bool
     full_response : dict
     failure_reason : str = ""
+    test_key : str | None = None
+    elapsed : float | None = None
+    timings : dict[str, float] = {}
+    response_ref : str | None = None
 
     def to_dict(self) -> dict:
         return vars(self)
\ No newline at end of file
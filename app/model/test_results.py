@@ -3,6 +3,8 @@
 """
 from pydantic import BaseModel
 
+from app.model.profile_report import ProfileReport
+from app.model.schema_verdict import SchemaVerdict
 from app.model.test_result import TestResult
 
 
@@ -12,7 +14,13 @@ class TestResults(BaseModel):
     """
 
     results : list[TestResult] = []
+    schema_verdicts : list[SchemaVerdict] = []
+    profile : ProfileReport | None = None
 
     def to_dict(self) -> dict:
         dictionary = { "results" : [result.to_dict() for result in self.results]}
+        if self.schema_verdicts:
+            dictionary["schema_verdicts"] = [verdict.model_dump() for verdict in self.schema_verdicts]
+        if self.profile is not None:
+            dictionary["profile"] = self.profile.model_dump()
         return dictionary
@@ -0,0 +1,21 @@
+"""
+    One interval of the history of a test
+"""
+from pydantic import BaseModel
+
+
+class TestTrendPoint(BaseModel):
+    """
+        The pass rate and latency of a test over an interval of time
+
+        bucket_start: Start of the interval in seconds since the epoch
+        runs: The number of times the test ran in the interval
+        passed: How many of those runs passed
+    """
+
+    bucket_start : float
+    runs : int
+    passed : int
+    pass_rate : float
+    mean_elapsed : float | None = None
+    max_elapsed : float | None = None
@@ -0,0 +1,186 @@
+"""
+    Content addressed storage for response bodies
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any
+
+_REFERENCE = re.compile(r"[0-9a-f]{64}")
+
+# The number of references remembered as stored before the memory is cleared
+_KNOWN_LIMIT = 65536
+
+# Seconds between refreshes of the modification time of a value that is stored again
+_TOUCH_INTERVAL = 3600.0
+
+# Starts the encoding of an object with split lists, followed by the JSON list of
+# their keys and a newline. Neither byte appears in a compact JSON encoding, so no
+# value stored as it is can be mistaken for one that was split.
+_SPLIT_HEADER = b"\x00"
+
+
+class BlobStore:
+    """
+        Stores JSON values once each, compressed, under the SHA-256 of their
+        canonical encoding.
+
+        The lists named in split_keys are stored item by item, and the object that
+        holds them keeps the references of its items in their place, with the keys
+        of the split lists recorded in a header ahead of its JSON. The searches of a
+        run return overlapping lists of service instances, so each instance is kept
+        once however many responses and runs include it, even when the responses differ.
+
+        Each value is a file under path, in a subdirectory named after the first two
+        characters of its reference, written atomically so readers never see part of
+        a value. Storing a value again refreshes the modification time of its file at
+        most once an hour, so prune can tell the values a run is still storing from
+        those no run has stored for a while.
+    """
+
+    path : str
+    split_keys : frozenset[str]
+    compression_level : int
+
+    _known : dict[str, float]
+    _lock : threading.Lock
+
+    def __init__(self, path : str, split_keys : tuple[str, ...] = ("serviceInstance",),
+                 compression_level : int = 6) -> None:
+        """
+        Open the store, creating its directory when it does not exist
+        :param path: The directory the values are kept in
+        :param split_keys: The keys of object members whose lists are stored item by item
+        :param compression_level: The zlib compression level, from 1 (fastest) to 9 (smallest)
+        """
+        self.path = path
+        self.split_keys = frozenset(split_keys)
+        self.compression_level = compression_level
+        self._known = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, mode=0o700, exist_ok=True)
+
+    def put(self, value : Any) -> str:
+        """
+        Store a value unless it is already stored
+        :param value: A JSON serialisable value
+        :return: the reference of the value
+        """
+        split = sorted(key for key in self.split_keys if isinstance(value, dict) and isinstance(value.get(key), list))
+        if split:
+            value = {key : [self.put(item) for item in member] if key in split else member
+                     for key, member in value.items()}
+
+        encoded = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode()
+        if split:
+            encoded = _SPLIT_HEADER + json.dumps(split, ensure_ascii=False).encode() + b"\n" + encoded
+        reference = hashlib.sha256(encoded).hexdigest()
+        now = time.time()
+        with self._lock:
+            if now - self._known.get(reference, float("-inf")) < _TOUCH_INTERVAL:
+                return reference
+
+        path = self._path(reference)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(descriptor, "wb") as file:
+                    file.write(zlib.compress(encoded, self.compression_level))
+                os.replace(temporary_path, path)
+            except BaseException:
+                os.unlink(temporary_path)
+                raise
+
+        with self._lock:
+            if len(self._known) >= _KNOWN_LIMIT:
+                self._known.clear()
+            self._known[reference] = now
+        return reference
+
+    def get(self, reference : str) -> Any | None:
+        """
+        Return a stored value with its split lists put back together
+        :param reference: The reference of the value
+        :return: the value, or None when no value is stored under the reference
+        """
+        if not _REFERENCE.fullmatch(reference):
+            return None
+
+        stored = self._read(reference)
+        if stored is None:
+            return None
+
+        split, value = stored
+        for key in split:
+            value[key] = [self.get(item) for item in value[key]]
+        return value
+
+    def prune(self, keep : set[str], grace : float = 86400.0) -> int:
+        """
+        Remove the values that are not reachable from the references to keep and
+        have not been stored for grace seconds, so values a run has just stored but
+        not yet recorded are kept. The items of a kept value are kept with it.
+        :param keep: The references still in use
+        :param grace: Seconds since a value was last stored before it may be removed, more than an hour
+        :return: the number of values removed
+        """
+        reachable = set()
+        for reference in keep:
+            if reference in reachable or not _REFERENCE.fullmatch(reference):
+                continue
+            reachable.add(reference)
+
+            stored = self._read(reference)
+            if stored is not None:
+                split, value = stored
+                for key in split:
+                    reachable.update(value[key])
+
+        cutoff = time.time() - grace
+        removed = 0
+        for directory in os.scandir(self.path):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                reference = entry.name.removesuffix(".json.z")
+                if reference in reachable or entry.stat().st_mtime >= cutoff:
+                    continue
+                try:
+                    os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += entry.name.endswith(".json.z")
+
+        with self._lock:
+            self._known.clear()
+        return removed
+
+    def _read(self, reference : str) -> tuple[list[str], Any] | None:
+        """
+        Read a stored value as it was written
+        :param reference: The reference of the value
+        :return: the keys of its split lists, which hold item references, and the value,
+                 or None when no value is stored under the reference
+        """
+        try:
+            with open(self._path(reference), "rb") as file:
+                encoded = zlib.decompress(file.read())
+        except FileNotFoundError:
+            return None
+
+        if not encoded.startswith(_SPLIT_HEADER):
+            return [], json.loads(encoded)
+
+        header, _, encoded = encoded[len(_SPLIT_HEADER):].partition(b"\n")
+        return json.loads(header), json.loads(encoded)
+
+    def _path(self, reference : str) -> str:
+        return os.path.join(self.path, reference[:2], f"{reference}.json.z")
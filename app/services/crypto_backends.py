@@ -0,0 +1,146 @@
+"""
+    ECDSA signing and verification backends used by PKIServices
+"""
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any
+
+import ecdsa
+from ecdsa import BadSignatureError
+from ecdsa.util import sigencode_der, sigdecode_der
+
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.types import PublicKeyTypes
+
+
+class CryptoBackend(ABC):
+    """
+        Signs and verifies DER encoded ECDSA signatures. Hash functions are
+        identified by their hashlib name, e.g. sha3_384 or sha384.
+    """
+
+    name : str
+
+    @abstractmethod
+    def load_signing_key(self, private_key_pem : bytes, hash_name : str) -> Any:
+        """
+        Parse a PEM encoded private key
+        :param private_key_pem: The PEM encoded private key
+        :param hash_name: The hash function the key will sign with
+        :return: the backend specific signing key
+        """
+
+    @abstractmethod
+    def sign(self, signing_key : Any, data : bytes, hash_name : str) -> bytes:
+        """
+        Sign the data
+        :param signing_key: A key returned by load_signing_key
+        :param data: The data to sign
+        :param hash_name: The hash function to sign with
+        :return: the DER encoded signature
+        """
+
+    @abstractmethod
+    def load_verifying_key(self, public_key : PublicKeyTypes) -> Any:
+        """
+        Convert a public key taken from an X.509 certificate
+        :param public_key: The public key of the certificate
+        :return: the backend specific verifying key
+        """
+
+    @abstractmethod
+    def verify(self, verifying_key : Any, data : bytes, signature : bytes, hash_name : str) -> bool:
+        """
+        Verify a DER encoded signature
+        :param verifying_key: A key returned by load_verifying_key
+        :param data: The signed data
+        :param signature: The DER encoded signature
+        :param hash_name: The hash function the data was signed with
+        :return: True if the signature is valid
+        """
+
+
+class CryptographyBackend(CryptoBackend):
+    """
+        OpenSSL backed implementation using the cryptography library
+    """
+
+    name = "cryptography"
+
+    _hashes : dict[str, type[hashes.HashAlgorithm]] = {
+        "sha3_384" : hashes.SHA3_384,
+        "sha384" : hashes.SHA384,
+        "sha3_256" : hashes.SHA3_256,
+        "sha256" : hashes.SHA256,
+    }
+
+    def _algorithm(self, hash_name : str) -> ec.ECDSA:
+        return ec.ECDSA(self._hashes[hash_name]())
+
+    def load_signing_key(self, private_key_pem : bytes, hash_name : str) -> ec.EllipticCurvePrivateKey:
+        private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+        if not isinstance(private_key, ec.EllipticCurvePrivateKey):
+            raise ValueError("Only elliptic curve private keys are supported")
+        return private_key
+
+    def sign(self, signing_key : ec.EllipticCurvePrivateKey, data : bytes, hash_name : str) -> bytes:
+        return signing_key.sign(data, self._algorithm(hash_name))
+
+    def load_verifying_key(self, public_key : PublicKeyTypes) -> ec.EllipticCurvePublicKey:
+        if not isinstance(public_key, ec.EllipticCurvePublicKey):
+            raise ValueError("Only elliptic curve certificates are supported")
+        return public_key
+
+    def verify(self, verifying_key : ec.EllipticCurvePublicKey, data : bytes, signature : bytes, hash_name : str) -> bool:
+        try:
+            verifying_key.verify(signature, data, self._algorithm(hash_name))
+            return True
+        except InvalidSignature:
+            return False
+
+
+class EcdsaBackend(CryptoBackend):
+    """
+        Pure Python implementation using the ecdsa package, kept for cross-checking
+    """
+
+    name = "ecdsa"
+
+    def load_signing_key(self, private_key_pem : bytes, hash_name : str) -> ecdsa.SigningKey:
+        return ecdsa.SigningKey.from_pem(private_key_pem.decode('utf-8'), hashfunc=getattr(hashlib, hash_name))
+
+    def sign(self, signing_key : ecdsa.SigningKey, data : bytes, hash_name : str) -> bytes:
+        return signing_key.sign(data, hashfunc=getattr(hashlib, hash_name), sigencode=sigencode_der)
+
+    def load_verifying_key(self, public_key : PublicKeyTypes) -> ecdsa.VerifyingKey:
+        return ecdsa.VerifyingKey.from_pem(public_key.public_bytes(serialization.Encoding.PEM,
+                                                                   serialization.PublicFormat.SubjectPublicKeyInfo))
+
+    def verify(self, verifying_key : ecdsa.VerifyingKey, data : bytes, signature : bytes, hash_name : str) -> bool:
+        try:
+            return verifying_key.verify(signature=signature,
+                                        data=data,
+                                        hashfunc=getattr(hashlib, hash_name),
+                                        sigdecode=sigdecode_der)
+        except BadSignatureError:
+            return False
+
+
+_backends : dict[str, CryptoBackend] = {
+    CryptographyBackend.name : CryptographyBackend(),
+    EcdsaBackend.name : EcdsaBackend(),
+}
+
+
+def get_crypto_backend(name : str = CryptographyBackend.name) -> CryptoBackend:
+    """
+    Return the crypto backend with the given name
+    :param name: cryptography (the default) or ecdsa
+    :return: the shared backend instance
+    """
+    try:
+        return _backends[name]
+    except KeyError as e:
+        raise ValueError(f"Unknown crypto backend: {name}") from e
@@ -0,0 +1,24 @@
+"""
+    Reporting the errors that stop an endorsement run
+"""
+
+
+def first_error(error : BaseException) -> BaseException:
+    """
+    Return the first underlying error rather than the task groups around it
+    :param error: The error raised by a run
+    :return: the first error that is not an exception group
+    """
+    while isinstance(error, BaseExceptionGroup) and error.exceptions:
+        error = error.exceptions[0]
+    return error
+
+
+def describe_error(error : BaseException) -> str:
+    """
+    Describe why a run could not finish
+    :param error: The error raised by a run, which may be an exception group
+    :return: the type and message of the first underlying error
+    """
+    error = first_error(error)
+    return f"{type(error).__name__}: {error}"
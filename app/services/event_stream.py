@@ -0,0 +1,32 @@
+"""
+    Encode events for a streamed response as NDJSON or Server-Sent Events
+"""
+import json
+from typing import Any
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def negotiate_media_type(accept : str | None) -> str:
+    """
+    Choose the event format from an Accept header
+    :param accept: The Accept header of the request, if any
+    :return: SSE_MEDIA_TYPE when the client accepts it, otherwise NDJSON_MEDIA_TYPE
+    """
+    media_types = [part.split(";")[0].strip().lower() for part in (accept or "").split(",")]
+    return SSE_MEDIA_TYPE if SSE_MEDIA_TYPE in media_types else NDJSON_MEDIA_TYPE
+
+
+def encode_event(media_type : str, event : str, data : dict[str, Any]) -> bytes:
+    """
+    Encode one event. An NDJSON line carries the event name in its "event" field.
+    :param media_type: NDJSON_MEDIA_TYPE or SSE_MEDIA_TYPE
+    :param event: The event name
+    :param data: The event data
+    :return: the encoded event
+    """
+    if media_type == SSE_MEDIA_TYPE:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+    return (json.dumps({"event" : event, **data}) + "\n").encode()
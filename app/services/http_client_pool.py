@@ -0,0 +1,186 @@
+"""
+    Pooled keep-alive HTTP clients shared between endorsement runs
+"""
+import asyncio
+import ssl
+import weakref
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import urlsplit
+
+import certifi
+import httpx
+
+from app.services.phase_timings import trace_http
+
+
+@dataclass
+class _PooledClient:
+    """
+        A client for one target and client certificate, with its connection counters
+    """
+
+    client : httpx.AsyncClient
+    requests : int = 0
+    connections : int = 0
+    handshakes : int = 0
+    leases : int = 0
+
+
+class HttpClientPool:
+    """
+        Hands out one httpx client per (target host, client credentials fingerprint)
+        so the connections and TLS handshakes are reused across the tests in a run
+        and across runs against the same MSR. The fingerprint covers both the
+        certificate and the private key, so a client authenticated with one key is
+        never handed to a caller that only knows the certificate. Clients are bound
+        to the event loop that created them, and once more than max_clients are
+        pooled on a loop the least recently used ones that no run holds are closed.
+    """
+
+    max_clients : int = 64
+    max_connections : int = 20
+    max_keepalive_connections : int = 10
+    keepalive_expiry : float = 30.0
+
+    # CA certificates trusted for MSR server certificates besides the certifi
+    # bundle, for MSRs on a private PKI such as the benchmark stub
+    ca_file : str | None = None
+
+    _clients : "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, OrderedDict[tuple[str, str | None], _PooledClient]]" = \
+        weakref.WeakKeyDictionary()
+
+    @classmethod
+    def configure(cls, max_clients : int | None = None,
+                  max_connections : int | None = None,
+                  max_keepalive_connections : int | None = None,
+                  keepalive_expiry : float | None = None,
+                  ca_file : str | None = None) -> None:
+        """
+        Set the pool sizes and trusted CAs used for clients created from now on
+        :param max_clients: The maximum number of clients kept per event loop
+        :param max_connections: The maximum number of connections per target
+        :param max_keepalive_connections: The maximum number of idle connections kept per target
+        :param keepalive_expiry: Seconds an idle connection is kept open
+        :param ca_file: A PEM file of CA certificates also trusted for MSR server certificates
+        :return: None
+        """
+        if max_clients is not None:
+            cls.max_clients = max_clients
+        if max_connections is not None:
+            cls.max_connections = max_connections
+        if max_keepalive_connections is not None:
+            cls.max_keepalive_connections = max_keepalive_connections
+        if keepalive_expiry is not None:
+            cls.keepalive_expiry = keepalive_expiry
+        if ca_file is not None:
+            cls.ca_file = ca_file
+
+    @classmethod
+    @asynccontextmanager
+    async def lease(cls, url : str,
+                    certificate : tuple[str, str] | None = None,
+                    fingerprint : str | None = None) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        Hold the pooled client for the target of the URL. A held client is never
+        evicted, the pool is trimmed back to max_clients once it is released.
+        :param url: Any URL on the target MSR
+        :param certificate: Paths of the client certificate and private key, None for anonymous requests
+        :param fingerprint: Fingerprint identifying the client certificate together with its private key
+        :return: the shared client
+        """
+        parts = urlsplit(url)
+        key = (f"{parts.scheme}://{parts.netloc}", fingerprint if certificate is not None else None)
+        clients = cls._clients.setdefault(asyncio.get_running_loop(), OrderedDict())
+
+        pooled = clients.get(key)
+        if pooled is None or pooled.client.is_closed:
+            pooled = cls._create_client(certificate)
+            clients[key] = pooled
+        clients.move_to_end(key)
+
+        pooled.leases += 1
+        try:
+            yield pooled.client
+        finally:
+            pooled.leases -= 1
+            await cls._evict(clients)
+
+    @classmethod
+    async def _evict(cls, clients : "OrderedDict[tuple[str, str | None], _PooledClient]") -> None:
+        """
+        Close the least recently used clients that are not held until at most
+        max_clients are left, or only held clients are over the limit
+        :param clients: The clients of the running event loop
+        :return: None
+        """
+        idle = [key for key, pooled in clients.items() if pooled.leases == 0]
+        for key in idle[:max(len(clients) - cls.max_clients, 0)]:
+            await clients.pop(key).client.aclose()
+
+    @classmethod
+    def _create_client(cls, certificate : tuple[str, str] | None) -> _PooledClient:
+        """
+        Create a client, counting its requests, new connections and TLS handshakes,
+        and timing the network phases of each request for the test that sends it
+        :param certificate: Paths of the client certificate and private key
+        :return: the new pooled client
+        """
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        if cls.ca_file is not None:
+            ssl_context.load_verify_locations(cafile=cls.ca_file)
+        if certificate is not None:
+            ssl_context.load_cert_chain(*certificate)
+
+        pooled : _PooledClient
+
+        async def trace(event_name : str, info : dict[str, Any]) -> None:
+            trace_http(event_name, info)
+            if event_name == "connection.connect_tcp.complete":
+                pooled.connections += 1
+            elif event_name == "connection.start_tls.complete":
+                pooled.handshakes += 1
+
+        async def on_request(request : httpx.Request) -> None:
+            pooled.requests += 1
+            request.extensions["trace"] = trace
+
+        client = httpx.AsyncClient(verify=ssl_context,
+                                   limits=httpx.Limits(max_connections=cls.max_connections,
+                                                       max_keepalive_connections=cls.max_keepalive_connections,
+                                                       keepalive_expiry=cls.keepalive_expiry),
+                                   event_hooks={"request" : [on_request]})
+        pooled = _PooledClient(client=client)
+        return pooled
+
+    @classmethod
+    def stats(cls) -> dict[str, dict[str, int]]:
+        """
+        Return the connection counters for every pooled client
+        :return: a dictionary keyed by target and certificate fingerprint
+        """
+        stats : dict[str, dict[str, int]] = {}
+        for clients in list(cls._clients.values()):
+            for (target, fingerprint), pooled in clients.items():
+                entry = stats.setdefault(f"{target} [{fingerprint or 'anonymous'}]",
+                                         {"requests" : 0, "connections" : 0, "reused" : 0,
+                                          "tls_handshakes" : 0})
+                entry["requests"] += pooled.requests
+                entry["connections"] += pooled.connections
+                entry["reused"] += pooled.requests - pooled.connections
+                entry["tls_handshakes"] += pooled.handshakes
+
+        return stats
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """
+        Close every client created on the running event loop
+        :return: None
+        """
+        clients = cls._clients.pop(asyncio.get_running_loop(), {})
+        for pooled in clients.values():
+            await pooled.client.aclose()
@@ -0,0 +1,72 @@
+"""
+    Adapters exposing httpx requests and responses to openapi_core
+"""
+from urllib.parse import parse_qs
+
+import httpx
+from openapi_core.datatypes import RequestParameters
+from werkzeug.datastructures import Headers
+from werkzeug.datastructures import ImmutableMultiDict
+
+from app.services.msr_response import MsrResponse, ParsedBody
+
+
+class HttpxOpenAPIRequest:
+    """
+        Converts an httpx request to an OpenAPI request
+    """
+
+    def __init__(self, request : httpx.Request) -> None:
+        self.request = request
+        self.parameters = RequestParameters(
+            query=ImmutableMultiDict(parse_qs(request.url.query.decode())),
+            header=Headers(dict(request.headers)),
+            cookie=ImmutableMultiDict(),
+        )
+
+    @property
+    def host_url(self) -> str:
+        return f"{self.request.url.scheme}://{self.request.url.netloc.decode()}"
+
+    @property
+    def path(self) -> str:
+        return self.request.url.path
+
+    @property
+    def method(self) -> str:
+        return self.request.method.lower()
+
+    @property
+    def body(self) -> bytes | None:
+        return self.request.content or None
+
+    @property
+    def content_type(self) -> str:
+        return str(self.request.headers.get("Content-Type")
+                   or self.request.headers.get("Accept"))
+
+
+class HttpxOpenAPIResponse:
+    """
+        Converts an MSR response to an OpenAPI response. The data is handed over
+        as a ParsedBody so the validator reuses the already decoded JSON.
+    """
+
+    def __init__(self, response : MsrResponse) -> None:
+        self.response = response
+
+    @property
+    def data(self) -> ParsedBody:
+        return ParsedBody(self.response)
+
+    @property
+    def status_code(self) -> int:
+        return int(self.response.status_code)
+
+    @property
+    def content_type(self) -> str:
+        return str(self.response.headers.get("Content-Type", ""))
+
+    @property
+    def headers(self) -> Headers:
+        return Headers(dict(self.response.headers))
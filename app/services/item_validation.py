@@ -0,0 +1,129 @@
+"""
+    Validation of array items against a component schema on a pool of worker processes
+"""
+import asyncio
+import os
+from concurrent.futures import Future
+from typing import Any
+
+from app.services.openapi_registry import OpenApiRegistry
+from app.services.worker_pool import get_worker_pool
+
+
+def _validate_items(api_path : str, schema_name : str, first_index : int,
+                    items : list[Any]) -> list[tuple[int, str]]:
+    """
+        Validate consecutive array items against a component schema. Runs in a
+        worker process, so it only takes and returns picklable values.
+
+        :param api_path: The absolute path of the OpenAPI schema file
+        :param schema_name: The name of the schema under #/components/schemas
+        :param first_index: The array index of the first item
+        :param items: The decoded items
+        :return: (index, message) for every error found
+    """
+    validator = OpenApiRegistry.get_compiled_validator(api_path, schema_name)
+
+    errors = []
+    for index, item in enumerate(items, first_index):
+        for path, message in validator(item):
+            location = "".join(f"[{part}]" if isinstance(part, int) else f".{part}" for part in path)
+            errors.append((index, f"{location.lstrip('.')}: {message}" if location else message))
+
+    return errors
+
+
+class ItemValidation:
+    """
+        Validates the items of an array against one component schema. Items can be
+        submitted in several batches, for example as a streamed array is decoded.
+        The first inline_threshold items are validated in this process, the rest
+        are collected into chunks of chunk_size and sent to the worker pool, the
+        last one when the errors are asked for. Every error is kept with the index
+        of its item rather than stopping at the first one.
+    """
+
+    api_path : str
+    schema_name : str
+    chunk_size : int
+    inline_threshold : int
+    count : int
+    inline_count : int
+    pool_count : int
+
+    _errors : list[tuple[int, str]]
+    _futures : list[Future]
+    _pending : list[Any]
+
+    def __init__(self, api_path : str, schema_name : str, chunk_size : int = 64, inline_threshold : int = 32) -> None:
+        """
+        Create a new validation
+        :param api_path: The path of the OpenAPI schema file
+        :param schema_name: The name of the schema under #/components/schemas
+        :param chunk_size: The maximum number of items sent to a worker at a time
+        :param inline_threshold: The number of items validated in this process before the pool is used
+        """
+        self.api_path = os.path.abspath(api_path)
+        self.schema_name = schema_name
+        self.chunk_size = chunk_size
+        self.inline_threshold = inline_threshold
+        self.count = 0
+        self.inline_count = 0
+        self.pool_count = 0
+        self._errors = []
+        self._futures = []
+        self._pending = []
+
+    def submit(self, items : list[Any]) -> None:
+        """
+        Validate the next items of the array
+        :param items: The items, following on from those already submitted
+        """
+        inline = items[:max(self.inline_threshold - self.count, 0)]
+        if inline:
+            self._errors.extend(_validate_items(self.api_path, self.schema_name, self.count, inline))
+            self.count += len(inline)
+            self.inline_count += len(inline)
+
+        start = len(inline)
+        if self._pending:
+            # Top up the items collected from earlier batches first
+            start += self.chunk_size - len(self._pending)
+            self._pending.extend(items[len(inline):start])
+            if len(self._pending) < self.chunk_size:
+                return
+            self._send(self._pending)
+            self._pending = []
+
+        for start in range(start, len(items), self.chunk_size):
+            chunk = items[start:start + self.chunk_size]
+            if len(chunk) < self.chunk_size:
+                self._pending = chunk
+            else:
+                self._send(chunk)
+
+    async def errors(self) -> list[tuple[int, str]]:
+        """
+        Send the items still collected to the pool and wait for the workers to finish
+        :return: (index, message) for every error found, in array order
+        """
+        if self._pending:
+            self._send(self._pending)
+            self._pending = []
+
+        if self._futures:
+            futures, self._futures = self._futures, []
+            for chunk in await asyncio.gather(*(asyncio.wrap_future(future) for future in futures)):
+                self._errors.extend(chunk)
+
+        return sorted(self._errors)
+
+    def _send(self, chunk : list[Any]) -> None:
+        """
+        Send the next items of the array to the worker pool
+        :param chunk: The items, following on from those already validated or sent
+        """
+        self._futures.append(get_worker_pool().submit(_validate_items, self.api_path, self.schema_name,
+                                                      self.count, chunk))
+        self.count += len(chunk)
+        self.pool_count += len(chunk)
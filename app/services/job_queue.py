@@ -0,0 +1,164 @@
+"""
+    Run queued endorsement jobs on a bounded pool of workers
+"""
+import asyncio
+import logging
+import sqlite3
+
+from app.model.job import Job
+from app.model.test_data import TestData
+from app.model.test_result import TestResult
+from app.services.blob_store import BlobStore
+from app.services.errors import describe_error, first_error
+from app.services.job_store import ClaimedJob, JobStore
+from app.services.result_store import ResultStore
+from app.test_scripts.msr_openapi_validator import MsrOpenApiValidator
+
+
+class JobQueue:
+    """
+        Runs the jobs of a JobStore with at most workers endorsements at a time. The
+        store is polled every poll_interval seconds, and at once when a job is
+        submitted. A running job's lease is renewed every lease / 3 seconds, so a job
+        whose process died is picked up again once its lease expires. A job that
+        fails in any way is marked failed without stopping its worker.
+    """
+
+    store : JobStore
+    api_path : str
+    workers : int
+    poll_interval : float
+    lease : float
+    max_attempts : int
+    result_store : ResultStore | None
+    blob_store : BlobStore | None
+
+    _wakeup : asyncio.Event | None
+    _tasks : list[asyncio.Task]
+
+    def __init__(self, store : JobStore, api_path : str, workers : int = 4, poll_interval : float = 5.0,
+                 lease : float = 120.0, max_attempts : int = 3, result_store : ResultStore | None = None,
+                 blob_store : BlobStore | None = None) -> None:
+        """
+        Create a new queue
+        :param store: The store the jobs are kept in
+        :param api_path: The path of the OpenAPI schema file
+        :param workers: The maximum number of jobs run at a time
+        :param poll_interval: Seconds between checks of the store for waiting jobs
+        :param lease: Seconds a job may go without a renewed lease before it is run again
+        :param max_attempts: The number of times a job is started before it is given up
+        :param result_store: The history finished jobs are added to
+        :param blob_store: The store the responses of the tests are kept in
+        """
+        self.store = store
+        self.api_path = api_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.result_store = result_store
+        self.blob_store = blob_store
+        self._wakeup = None
+        self._tasks = []
+
+    def start(self) -> None:
+        """
+        Start the workers on the running event loop
+        """
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"job-worker-{index}") for index in range(self.workers)]
+
+    async def stop(self) -> None:
+        """
+        Stop the workers. Jobs they were running keep their status and are run
+        again once their lease expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, test_data : TestData) -> Job:
+        """
+        Queue an endorsement
+        :param test_data: The endorsement to run
+        :return: the queued job
+        """
+        job = await asyncio.to_thread(self.store.create, test_data)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job
+
+    async def get(self, job_id : str) -> Job | None:
+        """
+        Return a job with the results recorded so far
+        :param job_id: The job id
+        :return: the job, or None when there is no job with the id
+        """
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def _worker(self) -> None:
+        """
+        Run waiting jobs one at a time until cancelled
+        """
+        while True:
+            try:
+                claimed = await asyncio.to_thread(self.store.claim, self.lease, self.max_attempts)
+            except sqlite3.Error:
+                logging.exception("Could not claim a job")
+                claimed = None
+
+            if claimed is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except TimeoutError:
+                    pass
+                continue
+
+            # Another worker may be idle and able to take the next job
+            self._wakeup.set()
+            try:
+                await self._run_job(claimed)
+            except Exception as e:
+                logging.exception("Job %s failed", claimed.job_id)
+                try:
+                    await asyncio.to_thread(self.store.fail, claimed.job_id, claimed.lease_owner,
+                                            describe_error(e))
+                except sqlite3.Error:
+                    logging.exception("Could not mark job %s failed", claimed.job_id)
+
+    async def _run_job(self, claimed : ClaimedJob) -> None:
+        """
+        Run a job and record its results. Updates are dropped once another worker
+        has claimed the job.
+        :param claimed: The job and its lease owner
+        """
+        job_id, lease_owner, test_data = claimed
+
+        async def record_result(result : TestResult) -> None:
+            await asyncio.to_thread(self.store.add_result, job_id, lease_owner, result)
+
+        async def renew_lease() -> None:
+            while True:
+                await asyncio.sleep(self.lease / 3)
+                try:
+                    await asyncio.to_thread(self.store.renew, job_id, lease_owner, self.lease)
+                except sqlite3.Error:
+                    logging.exception("Could not renew the lease of job %s", job_id)
+
+        logging.info(f"Job {job_id}: testing {test_data.test_url}")
+        renewal = asyncio.create_task(renew_lease())
+        try:
+            validate_msr = MsrOpenApiValidator(test_data, self.api_path, self.result_store, self.blob_store)
+            results = await validate_msr.validate_msr_async(record_result)
+        except Exception as e:
+            logging.warning("Job %s could not test %s: %r", job_id, test_data.test_url, first_error(e))
+            recorded = await asyncio.to_thread(self.store.fail, job_id, lease_owner, describe_error(e))
+        else:
+            recorded = await asyncio.to_thread(self.store.finish, job_id, lease_owner, results)
+        finally:
+            renewal.cancel()
+
+        if not recorded:
+            logging.warning("Job %s was claimed by another worker, its results are dropped", job_id)
@@ -0,0 +1,257 @@
+"""
+    SQLite store for the background endorsement jobs
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import NamedTuple
+from uuid import uuid4
+
+from pydantic import ValidationError
+
+from app.model.job import Job
+from app.model.profile_report import ProfileReport
+from app.model.schema_verdict import SchemaVerdict
+from app.model.test_data import TestData
+from app.model.test_result import TestResult
+from app.model.test_results import TestResults
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    test_url TEXT NOT NULL,
+    request TEXT,
+    results TEXT NOT NULL DEFAULT '[]',
+    schema_verdicts TEXT NOT NULL DEFAULT '[]',
+    profile TEXT,
+    error TEXT NOT NULL DEFAULT '',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    claimed_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    lease_until REAL,
+    lease_owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created_at ON jobs (status, created_at);
+"""
+
+
+class ClaimedJob(NamedTuple):
+    """
+        A job handed to a worker
+
+        job_id: The job id
+        lease_owner: Identifies this claim, the worker passes it with every update
+        test_data: The endorsement to run
+    """
+
+    job_id : str
+    lease_owner : str
+    test_data : TestData
+
+
+class JobStore:
+    """
+        Persists jobs in a local SQLite database so queued and interrupted jobs
+        survive a restart. A running job holds a lease that its worker renews; a
+        job whose lease has expired was interrupted and is handed out again. Each
+        claim has its own lease owner, and updates from a worker whose lease has
+        been claimed by another are ignored.
+
+        The request, which includes the client private key, is only kept until
+        the job has finished. The database file is readable by its owner only.
+    """
+
+    path : str
+
+    _connection : sqlite3.Connection
+    _lock : threading.Lock
+
+    def __init__(self, path : str) -> None:
+        """
+        Open the store, creating the database when it does not exist
+        :param path: The path of the SQLite database file
+        """
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).touch(mode=0o600, exist_ok=True)
+        os.chmod(path, 0o600)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+        # Stores written by earlier versions lack the later columns
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")]
+        for column, column_type in (("profile", "TEXT"), ("lease_owner", "TEXT"), ("claimed_at", "REAL")):
+            if column not in columns:
+                self._connection.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def create(self, test_data : TestData) -> Job:
+        """
+        Queue a new job
+        :param test_data: The endorsement to run
+        :return: the queued job
+        """
+        job_id = str(uuid4())
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (job_id, status, test_url, request, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                (job_id, test_data.test_url, test_data.model_dump_json(), time.time()))
+        return self.get(job_id)
+
+    def claim(self, lease : float, max_attempts : int) -> ClaimedJob | None:
+        """
+        Hand the oldest waiting job to a worker. Interrupted jobs are retried from the
+        start until they have been attempted max_attempts times, then marked failed.
+        A job whose stored request cannot be read is marked failed rather than handed out.
+        :param lease: Seconds the worker has to renew the lease before the job is handed out again
+        :param max_attempts: The number of times a job is started before it is given up
+        :return: the claimed job, or None when no job is waiting
+        """
+        while True:
+            now = time.time()
+            lease_owner = str(uuid4())
+            with self._lock:
+                row = self._connection.execute(
+                    "UPDATE jobs SET status = 'running', claimed_at = COALESCE(claimed_at, ?), started_at = ?, "
+                    "lease_until = ?, lease_owner = ?, attempts = attempts + 1, results = '[]' "
+                    "WHERE job_id = (SELECT job_id FROM jobs "
+                    "                WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                    "                ORDER BY created_at LIMIT 1) "
+                    "RETURNING job_id, request, attempts",
+                    (now, now, now + lease, lease_owner, now)).fetchone()
+
+            if row is None:
+                return None
+
+            job_id, request, attempts = row
+            if attempts > max_attempts:
+                self.fail(job_id, lease_owner, f"Job was interrupted {attempts - 1} times")
+                continue
+
+            try:
+                return ClaimedJob(job_id, lease_owner, TestData.model_validate_json(request or ""))
+            except ValidationError as e:
+                self.fail(job_id, lease_owner, f"The stored request is invalid: {e}")
+
+    def renew(self, job_id : str, lease_owner : str, lease : float) -> bool:
+        """
+        Extend the lease of a running job
+        :param job_id: The job id
+        :param lease_owner: The lease owner of the claim
+        :param lease: Seconds from now until the lease expires
+        :return: False when the job is no longer held by this claim
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET lease_until = ? WHERE job_id = ? AND status = 'running' AND lease_owner = ?",
+                (time.time() + lease, job_id, lease_owner))
+        return cursor.rowcount > 0
+
+    def add_result(self, job_id : str, lease_owner : str, result : TestResult) -> bool:
+        """
+        Record a result of a running job as soon as its test finishes
+        :param job_id: The job id
+        :param lease_owner: The lease owner of the claim
+        :param result: The test result
+        :return: False when the job is no longer held by this claim
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET results = json_insert(results, '$[#]', json(?)) "
+                "WHERE job_id = ? AND status = 'running' AND lease_owner = ?",
+                (result.model_dump_json(), job_id, lease_owner))
+        return cursor.rowcount > 0
+
+    def finish(self, job_id : str, lease_owner : str, results : TestResults) -> bool:
+        """
+        Record the results of a finished job and drop its request
+        :param job_id: The job id
+        :param lease_owner: The lease owner of the claim
+        :param results: The test results
+        :return: False when the job is no longer held by this claim
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'finished', results = ?, schema_verdicts = ?, profile = ?, "
+                "request = NULL, finished_at = ?, lease_until = NULL "
+                "WHERE job_id = ? AND status = 'running' AND lease_owner = ?",
+                (json.dumps([result.model_dump() for result in results.results]),
+                 json.dumps([verdict.model_dump() for verdict in results.schema_verdicts]),
+                 results.profile.model_dump_json() if results.profile is not None else None,
+                 time.time(), job_id, lease_owner))
+        return cursor.rowcount > 0
+
+    def fail(self, job_id : str, lease_owner : str, error : str) -> bool:
+        """
+        Record why a job failed and drop its request. Results recorded so far are kept.
+        :param job_id: The job id
+        :param lease_owner: The lease owner of the claim
+        :param error: The reason
+        :return: False when the job is no longer held by this claim
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, request = NULL, finished_at = ?, "
+                "lease_until = NULL WHERE job_id = ? AND status = 'running' AND lease_owner = ?",
+                (error, time.time(), job_id, lease_owner))
+        return cursor.rowcount > 0
+
+    def prune(self, before : float) -> int:
+        """
+        Remove the finished and failed jobs that ended before a time, with their results
+        :param before: Jobs that ended before this time, in seconds since the epoch, are removed
+        :return: the number of jobs removed
+        """
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM jobs WHERE status IN ('finished', 'failed') AND finished_at < ?", (before,))
+        return cursor.rowcount
+
+    def get(self, job_id : str) -> Job | None:
+        """
+        Return a job with the results recorded so far
+        :param job_id: The job id
+        :return: the job, or None when there is no job with the id
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, status, test_url, results, schema_verdicts, profile, error, attempts, created_at, "
+                "claimed_at, started_at, finished_at "
+                "FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+        if row is None:
+            return None
+
+        (job_id, status, test_url, results, schema_verdicts, profile, error, attempts,
+         created_at, claimed_at, started_at, finished_at) = row
+        return Job(job_id=job_id,
+                   status=status,
+                   test_url=test_url,
+                   results=TestResults(results=[TestResult(**result) for result in json.loads(results)],
+                                       schema_verdicts=[SchemaVerdict(**verdict)
+                                                        for verdict in json.loads(schema_verdicts)],
+                                       profile=ProfileReport.model_validate_json(profile)
+                                       if profile is not None else None),
+                   error=error,
+                   attempts=attempts,
+                   created_at=created_at,
+                   started_at=started_at,
+                   finished_at=finished_at,
+                   queue_wait=claimed_at - created_at if claimed_at is not None else None,
+                   run_time=finished_at - started_at if finished_at is not None and started_at is not None else None)
+
+    def close(self) -> None:
+        """
+        Close the database
+        """
+        with self._lock:
+            self._connection.close()
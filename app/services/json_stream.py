@@ -0,0 +1,208 @@
+"""
+    Incremental decoding of a JSON object with one large array member
+"""
+import codecs
+import json
+import re
+from typing import Any
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+_START = 0
+_KEY = 1
+_COLON = 2
+_VALUE = 3
+_AFTER_VALUE = 4
+_ITEM = 5
+_AFTER_ITEM = 6
+_DONE = 7
+
+_incomplete = object()
+
+
+class JsonArrayStream:
+    """
+        Decodes a JSON object fed in chunks and returns the items of one array
+        member as soon as each is complete. The other members of the object are
+        collected in envelope, and so is the array member itself when its value
+        is not an array. Only the item being decoded is held in memory.
+
+        Values are decoded with json.JSONDecoder.raw_decode. When a value is cut
+        off at the end of a chunk the decoder waits until the pending text has
+        doubled before trying again, so a large item is not re-scanned per chunk.
+    """
+
+    array_key : str
+    envelope : dict[str, Any]
+    count : int
+    streamed : bool
+
+    def __init__(self, array_key : str) -> None:
+        """
+        Create a new stream
+        :param array_key: The member of the object to return item by item
+        """
+        self.array_key = array_key
+        self.envelope = {}
+        self.count = 0
+        self.streamed = False
+
+        self._decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buffer = ""
+        self._pos = 0
+        self._pending : list[str] = []
+        self._pending_length = 0
+        self._retry_length = 0
+        self._state = _START
+        self._key : str | None = None
+        self._eof = False
+
+    def feed(self, chunk : bytes) -> list[Any]:
+        """
+        Add the next chunk of the body
+        :param chunk: The raw bytes
+        :return: the array items completed by this chunk
+        """
+        text = self._text_decoder.decode(chunk)
+        if not text:
+            return []
+
+        self._pending.append(text)
+        self._pending_length += len(text)
+
+        # Wait for more text before retrying a value that was cut off
+        if len(self._buffer) - self._pos + self._pending_length < self._retry_length:
+            return []
+
+        return self._parse()
+
+    def close(self) -> list[Any]:
+        """
+        Mark the end of the body
+        :return: the array items still pending
+        """
+        self._pending.append(self._text_decoder.decode(b"", final=True))
+        self._eof = True
+        items = self._parse()
+
+        if self._state != _DONE:
+            raise ValueError(f"Incomplete JSON document, expected more data at offset {self._pos}")
+
+        return items
+
+    def _parse(self) -> list[Any]:
+        """
+        Consume as much of the buffered text as possible
+        :return: the completed array items
+        """
+        if self._pending:
+            self._buffer = self._buffer[self._pos:] + "".join(self._pending)
+            self._pos = 0
+            self._pending = []
+            self._pending_length = 0
+        self._retry_length = 0
+
+        items = []
+        buffer = self._buffer
+
+        while True:
+            self._pos = _WHITESPACE.match(buffer, self._pos).end()
+            if self._pos >= len(buffer):
+                break
+
+            char = buffer[self._pos]
+            state = self._state
+
+            if state == _START:
+                self._expect(char, "{")
+                self._state = _KEY
+            elif state == _KEY:
+                if char == "}":
+                    self._pos += 1
+                    self._state = _DONE
+                    continue
+                self._expect(char, '"', advance=False)
+                decoded = self._decode()
+                if decoded is _incomplete:
+                    break
+                self._key = decoded
+                self._state = _COLON
+            elif state == _COLON:
+                self._expect(char, ":")
+                self._state = _VALUE
+            elif state == _VALUE:
+                if self._key == self.array_key and char == "[":
+                    self._pos += 1
+                    self.streamed = True
+                    self._state = _ITEM
+                    continue
+                decoded = self._decode()
+                if decoded is _incomplete:
+                    break
+                self.envelope[self._key] = decoded
+                self._state = _AFTER_VALUE
+            elif state == _AFTER_VALUE:
+                if char == ",":
+                    self._pos += 1
+                    self._state = _KEY
+                else:
+                    self._expect(char, "}")
+                    self._state = _DONE
+            elif state == _ITEM:
+                if char == "]" and self.count == 0:
+                    self._pos += 1
+                    self._state = _AFTER_VALUE
+                    continue
+                decoded = self._decode()
+                if decoded is _incomplete:
+                    break
+                items.append(decoded)
+                self.count += 1
+                self._state = _AFTER_ITEM
+            elif state == _AFTER_ITEM:
+                if char == ",":
+                    self._pos += 1
+                    self._state = _ITEM
+                else:
+                    self._expect(char, "]")
+                    self._state = _AFTER_VALUE
+            else:
+                raise ValueError(f"Extra data after the JSON document at offset {self._pos}")
+
+        return items
+
+    def _expect(self, char : str, expected : str, advance : bool = True) -> None:
+        """
+        Check the next character is the expected one
+        :param char: The next character
+        :param expected: The character the grammar requires
+        :param advance: Consume the character
+        """
+        if char != expected:
+            raise ValueError(f"Expected '{expected}' at offset {self._pos}, found '{char}'")
+        if advance:
+            self._pos += 1
+
+    def _decode(self) -> Any:
+        """
+        Decode the value at the current position
+        :return: the value, or _incomplete when the buffer ends before the value does
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if self._eof:
+                raise
+            self._retry_length = 2 * (len(self._buffer) - self._pos)
+            return _incomplete
+
+        # A number at the end of the buffer, or before a fraction or exponent
+        # that is still cut off, may continue in the next chunk
+        if not self._eof and isinstance(value, (int, float)) and not isinstance(value, bool) \
+                and (end == len(self._buffer) or self._buffer[end] in ".eE"):
+            self._retry_length = len(self._buffer) - self._pos + 1
+            return _incomplete
+
+        self._pos = end
+        return value
@@ -0,0 +1,78 @@
+"""
+    Bounded least recently used cache for parsed key material
+"""
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class LruCache(Generic[T]):
+    """
+        Thread safe LRU cache that evicts the least recently used entry once
+        maxsize entries are stored
+    """
+
+    maxsize : int
+    hits : int
+    misses : int
+
+    _entries : OrderedDict[Hashable, T]
+    _lock : threading.Lock
+
+    def __init__(self, maxsize : int = 128) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key : Hashable, factory : Callable[[], T]) -> T:
+        """
+        Return the cached value for the key, creating it on a miss
+        :param key: The cache key
+        :param factory: Builds the value when it is not cached
+        :return: the cached value
+        """
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.misses += 1
+
+        value = factory()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def stats(self) -> dict[str, int | float]:
+        """
+        Return the cache counters
+        :return: a dictionary with the hits, misses, hit rate and size
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits" : self.hits,
+            "misses" : self.misses,
+            "hit_rate" : self.hits / lookups if lookups else 0.0,
+            "size" : len(self._entries),
+            "maxsize" : self.maxsize
+        }
+
+    def clear(self) -> None:
+        """
+        Drop every entry and reset the counters
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
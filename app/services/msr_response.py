@@ -0,0 +1,116 @@
+"""
+    MSR response wrapper that decodes the body at most once
+"""
+import json
+from typing import Any
+
+import httpx
+from openapi_core.deserializing.media_types.util import json_loads, plain_loads
+
+from app.services.phase_timings import phase
+
+_not_decoded = object()
+
+
+class MsrResponse:
+    """
+        Wraps an httpx response so the status checks, the OpenAPI validator,
+        the model classes and the stored test result all share one decoded body
+    """
+
+    __slots__ = ("response", "_json", "_decoded")
+
+    response : httpx.Response
+
+    def __init__(self, response : httpx.Response, decoded : Any = _not_decoded) -> None:
+        """
+        Wrap a response
+        :param response: The httpx response
+        :param decoded: The body when it has already been decoded, for example
+                        from a streamed response whose content was never buffered
+        """
+        self.response = response
+        self._decoded = decoded is not _not_decoded
+        self._json = decoded if self._decoded else None
+
+    @property
+    def request(self) -> httpx.Request:
+        return self.response.request
+
+    @property
+    def status_code(self) -> int:
+        return self.response.status_code
+
+    @property
+    def headers(self) -> httpx.Headers:
+        return self.response.headers
+
+    @property
+    def body(self) -> memoryview:
+        """
+        The raw body as a read only view, without copying it
+        """
+        return memoryview(self.response.content)
+
+    @property
+    def text(self) -> str:
+        return self.response.text
+
+    def json(self) -> Any:
+        """
+        Decode the body as JSON the first time it is needed
+        :return: the decoded body
+        """
+        if not self._decoded:
+            with phase("json_decode"):
+                self._json = json.loads(self.response.content)
+            self._decoded = True
+
+        return self._json
+
+    def to_full_response(self) -> dict:
+        """
+        Return the body in the form stored on a test result
+        :return: the decoded body if it is a JSON object, otherwise the body text
+        """
+        try:
+            decoded = self.json()
+        except ValueError:
+            return { "serverResponse" : self.text }
+
+        return decoded if isinstance(decoded, dict) else { "serverResponse" : decoded }
+
+
+class ParsedBody:
+    """
+        The response data handed to openapi_core. It carries the MsrResponse so the
+        media type deserializers below can return the already decoded body.
+    """
+
+    __slots__ = ("response",)
+
+    def __init__(self, response : MsrResponse) -> None:
+        self.response = response
+
+    def __bool__(self) -> bool:
+        return self.response._decoded or len(self.response.response.content) > 0
+
+
+def _parsed_json_loads(value : ParsedBody | bytes, **parameters : str) -> Any:
+    if isinstance(value, ParsedBody):
+        return value.response.json()
+    return json_loads(value, **parameters)
+
+
+def _parsed_plain_loads(value : ParsedBody | bytes, **parameters : str) -> Any:
+    if isinstance(value, ParsedBody):
+        value = value.response.response.content
+    return plain_loads(value, **parameters)
+
+
+# Registered with openapi_core so validation reuses the decoded body
+PARSED_BODY_DESERIALIZERS = {
+    "application/json" : _parsed_json_loads,
+    "text/json" : _parsed_json_loads,
+    "text/plain" : _parsed_plain_loads,
+}
@@ -0,0 +1,246 @@
+"""
+    Process wide registry of compiled OpenAPI specifications
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from openapi_core import Config, OpenAPI
+from openapi_core.validation.schemas import oas30_read_schema_validators_factory, oas31_schema_validators_factory
+from openapi_core.validation.schemas.validators import SchemaValidator
+
+from app.model.exceptions.unsupported_schema_exception import UnsupportedSchemaException
+from app.services.msr_response import PARSED_BODY_DESERIALIZERS
+from app.services.schema_compiler import SchemaValidationFunction, load_validators
+
+
+@dataclass
+class _RegistryEntry:
+    """
+        A compiled specification and the file state it was built from
+    """
+
+    open_api : OpenAPI
+    mtime_ns : int
+    size : int
+    content_hash : str
+    schema_validators : dict[str, SchemaValidator] = field(default_factory=dict)
+    compiled_validators : dict[str, SchemaValidationFunction] | None = None
+    schema_fingerprints : dict[str, str] = field(default_factory=dict)
+
+
+class OpenApiRegistry:
+    """
+        Loads each OpenAPI schema file once and shares the compiled specification
+        between requests. The file is checked on every lookup and the specification
+        is rebuilt only when its content has changed. The generated validation
+        functions are cached in compiled_cache_dir by the hash of the file content.
+        The directory is created with mode 0700, and the cached modules are only
+        imported while it and they are owned by this user and writable by no other.
+    """
+
+    compiled_cache_dir : str = "./data/validators"
+
+    _entries : dict[str, _RegistryEntry] = {}
+    _lock : threading.Lock = threading.Lock()
+
+    hits : int = 0
+    misses : int = 0
+    reloads : int = 0
+
+    @classmethod
+    def get(cls, api_path : str) -> OpenAPI:
+        """
+        Return the compiled specification for the given schema file
+        :param api_path: The path of the OpenAPI schema file
+        :return: the compiled OpenAPI specification
+        """
+        key = os.path.abspath(api_path)
+        stat = os.stat(key)
+
+        entry = cls._entries.get(key)
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            cls.hits += 1
+            return entry.open_api
+
+        with cls._lock:
+            # Another thread may have reloaded the file while we waited
+            entry = cls._entries.get(key)
+            stat = os.stat(key)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                cls.hits += 1
+                return entry.open_api
+
+            with open(key, "rb") as f:
+                content = f.read()
+            content_hash = hashlib.sha256(content).hexdigest()
+
+            # The file was touched but the content is unchanged
+            if entry is not None and entry.content_hash == content_hash:
+                cls._entries[key] = _RegistryEntry(entry.open_api, stat.st_mtime_ns, stat.st_size, content_hash,
+                                                   entry.schema_validators, entry.compiled_validators,
+                                                   entry.schema_fingerprints)
+                cls.hits += 1
+                return entry.open_api
+
+            open_api = OpenAPI.from_dict(json.loads(content),
+                                         config=Config(extra_media_type_deserializers=PARSED_BODY_DESERIALIZERS),
+                                         base_uri=Path(key).as_uri())
+
+            if entry is not None:
+                cls.reloads += 1
+                logging.info("Reloaded OpenAPI schema %s (%s)", key, content_hash)
+            else:
+                logging.info("Loaded OpenAPI schema %s (%s)", key, content_hash)
+
+            cls.misses += 1
+            cls._entries[key] = _RegistryEntry(open_api, stat.st_mtime_ns, stat.st_size, content_hash)
+            return open_api
+
+    @classmethod
+    def get_schema_validator(cls, api_path : str, schema_name : str) -> SchemaValidator:
+        """
+        Return a validator for one of the component schemas, built once per schema file
+        :param api_path: The path of the OpenAPI schema file
+        :param schema_name: The name of the schema under #/components/schemas
+        :return: a validator whose validate method raises on an invalid value
+        """
+        open_api = cls.get(api_path)
+        entry = cls._entries[os.path.abspath(api_path)]
+
+        validator = entry.schema_validators.get(schema_name)
+        if validator is None:
+            if open_api.spec["openapi"].startswith("3.0"):
+                factory = oas30_read_schema_validators_factory
+            else:
+                factory = oas31_schema_validators_factory
+            validator = factory.create(open_api.spec / "components" / "schemas" / schema_name)
+            entry.schema_validators[schema_name] = validator
+
+        return validator
+
+    @classmethod
+    def get_schema_fingerprint(cls, api_path : str, schema_name : str) -> str:
+        """
+        Return a hash of a component schema and every component it references. Schema
+        files whose fingerprints match define the schema identically, so a value only
+        needs validating against one of them.
+        :param api_path: The path of the OpenAPI schema file
+        :param schema_name: The name of the schema under #/components/schemas
+        :return: the fingerprint as a hex string
+        """
+        open_api = cls.get(api_path)
+        entry = cls._entries[os.path.abspath(api_path)]
+
+        fingerprint = entry.schema_fingerprints.get(schema_name)
+        if fingerprint is None:
+            schemas = open_api.spec.contents().get("components", {}).get("schemas", {})
+            closure = {}
+
+            def collect(name : str) -> None:
+                if name not in closure:
+                    closure[name] = schemas.get(name)
+                    references(closure[name])
+
+            def references(node : object) -> None:
+                if isinstance(node, dict):
+                    reference = node.get("$ref")
+                    if isinstance(reference, str) and reference.startswith("#/components/schemas/"):
+                        collect(reference.rsplit("/", 1)[-1])
+                    for child in node.values():
+                        references(child)
+                elif isinstance(node, list):
+                    for child in node:
+                        references(child)
+
+            collect(schema_name)
+
+            fingerprint = hashlib.sha256(json.dumps(closure, sort_keys=True).encode()).hexdigest()
+            entry.schema_fingerprints[schema_name] = fingerprint
+
+        return fingerprint
+
+    @classmethod
+    def get_compiled_validators(cls, api_path : str) -> dict[str, SchemaValidationFunction]:
+        """
+        Return the generated validation functions for the schema file. The module is
+        loaded from compiled_cache_dir, and generated only the first time the file
+        content is seen.
+        :param api_path: The path of the OpenAPI schema file
+        :return: the validation functions by component schema name
+        """
+        open_api = cls.get(api_path)
+        key = os.path.abspath(api_path)
+        entry = cls._entries[key]
+
+        if entry.compiled_validators is None:
+            with cls._lock:
+                if entry.compiled_validators is None:
+                    try:
+                        entry.compiled_validators = load_validators(
+                            open_api.spec.contents(),
+                            entry.content_hash,
+                            oas31_schema_validators_factory.get_format_checker(),
+                            cls.compiled_cache_dir,
+                            source=os.path.basename(key))
+                    except UnsupportedSchemaException as e:
+                        logging.info("Not compiling OpenAPI schema %s: %s", key, e)
+                        entry.compiled_validators = {}
+
+        return entry.compiled_validators
+
+    @classmethod
+    def get_compiled_validator(cls, api_path : str, schema_name : str) -> SchemaValidationFunction:
+        """
+        Return the generated validation function for a component schema, or one backed
+        by openapi_core when the schema could not be compiled
+        :param api_path: The path of the OpenAPI schema file
+        :param schema_name: The name of the schema under #/components/schemas
+        :return: a function returning (path, message) for every error in a value
+        """
+        validator = cls.get_compiled_validators(api_path).get(schema_name)
+        if validator is not None:
+            return validator
+
+        schema_validator = cls.get_schema_validator(api_path, schema_name)
+        return lambda value: [(tuple(error.absolute_path), error.message)
+                              for error in schema_validator.validator.iter_errors(value)]
+
+    @classmethod
+    def get_content_hash(cls, api_path : str) -> str:
+        """
+        Return the SHA256 hash of the schema file currently loaded
+        :param api_path: The path of the OpenAPI schema file
+        :return: the content hash as a hex string
+        """
+        cls.get(api_path)
+        return cls._entries[os.path.abspath(api_path)].content_hash
+
+    @classmethod
+    def stats(cls) -> dict[str, int]:
+        """
+        Return the cache counters
+        :return: a dictionary of the hit, miss and reload counts
+        """
+        return {
+            "hits" : cls.hits,
+            "misses" : cls.misses,
+            "reloads" : cls.reloads,
+            "schemas" : len(cls._entries)
+        }
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Drop every compiled specification and reset the counters
+        :return: None
+        """
+        with cls._lock:
+            cls._entries = {}
+            cls.hits = 0
+            cls.misses = 0
+            cls.reloads = 0
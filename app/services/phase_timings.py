@@ -0,0 +1,124 @@
+"""
+    Per test breakdown of where the time of a test goes
+"""
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+PHASES = ("sign", "connect", "tls", "ttfb", "download", "json_decode", "schema_validate", "model_build")
+
+# httpcore trace spans and the phase each one counts towards. Connecting includes
+# the DNS lookup, which httpcore does not trace separately; the time to first byte
+# runs from sending the request headers until the response headers have arrived.
+_HTTP_PHASES = {
+    "connection.connect_tcp" : "connect",
+    "connection.start_tls" : "tls",
+    "http11.send_request_headers" : "ttfb",
+    "http11.send_request_body" : "ttfb",
+    "http11.receive_response_headers" : "ttfb",
+    "http11.receive_response_body" : "download",
+    "http2.send_request_headers" : "ttfb",
+    "http2.send_request_body" : "ttfb",
+    "http2.receive_response_headers" : "ttfb",
+    "http2.receive_response_body" : "download",
+}
+
+
+class PhaseTimings:
+    """
+        Seconds spent in each phase of a test. Phases may nest, for example the
+        decoding of a streamed body happens while it downloads; the time of the
+        inner phase is then taken off the outer one, so the phases never count the
+        same time twice.
+    """
+
+    phases : dict[str, float]
+
+    _open : dict[Any, tuple[float, float]]
+    _counted : float
+
+    def __init__(self) -> None:
+        self.phases = {}
+        self._open = {}
+        self._counted = 0.0
+
+    def begin(self, key : Any) -> None:
+        """
+        Start timing a span
+        :param key: Identifies the span until it ends
+        """
+        self._open[key] = (time.perf_counter(), self._counted)
+
+    def end(self, key : Any, phase : str) -> None:
+        """
+        Stop timing a span and add its time, less that of the spans inside it, to a phase
+        :param key: The key the span was started with
+        :param phase: The phase the span counts towards
+        """
+        started = self._open.pop(key, None)
+        if started is None:
+            return
+
+        start, counted = started
+        elapsed = time.perf_counter() - start - (self._counted - counted)
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+        self._counted += elapsed
+
+
+_current_timings : ContextVar[PhaseTimings | None] = ContextVar("phase_timings", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[PhaseTimings]:
+    """
+    Collect the phases timed in this context, including the tasks and threads it starts
+    :return: the timings, complete once the block exits
+    """
+    timings = PhaseTimings()
+    token = _current_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _current_timings.reset(token)
+
+
+@contextmanager
+def phase(name : str) -> Iterator[None]:
+    """
+    Time a block as one of the phases, when the timings of a test are being collected
+    :param name: The phase
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        yield
+        return
+
+    key = object()
+    timings.begin(key)
+    try:
+        yield
+    finally:
+        timings.end(key, name)
+
+
+def trace_http(event_name : str, _info : dict[str, Any]) -> None:
+    """
+    Time the network phases of a request from the httpcore trace events
+    :param event_name: The trace event, such as connection.start_tls.started
+    :param _info: The event details
+    """
+    timings = _current_timings.get()
+    if timings is None:
+        return
+
+    span, _, stage = event_name.rpartition(".")
+    phase_name = _HTTP_PHASES.get(span)
+    if phase_name is None:
+        return
+
+    if stage == "started":
+        timings.begin(span)
+    elif stage in ("complete", "failed"):
+        timings.end(span, phase_name)
@@ -1,25 +1,114 @@
 """
     Service used to generate signatures and certificate hashes
 """
+import asyncio
 import base64
 from datetime import datetime
 import logging
-from hashlib import sha3_384, sha384
+from hashlib import sha3_384, sha256
 from collections.abc import Callable
+from typing import Any
 import tempfile
 from tempfile import TemporaryDirectory
 
 from cryptography.x509 import load_pem_x509_certificate
-from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat, load_pem_private_key
 import cryptography.hazmat.primitives.hashes as hashes
 
-import ecdsa
-from ecdsa import BadSignatureError
-from ecdsa.util import sigencode_der, sigdecode_der
-
+from app.model.exceptions.key_mismatch_exception import KeyMismatchException
 from app.model.exceptions.signature_validation_exception import SignatureValidationException
 from app.model.secom.v2.secom_envelope import SecomEnvelope
+from app.services.crypto_backends import CryptoBackend, get_crypto_backend
+from app.services.key_cache import LruCache
+from app.services.profiling import traced
+from app.services.worker_pool import get_worker_pool
+
+# Parsed signing keys shared by every PKIServices instance, keyed by key fingerprint
+_signing_key_cache : LruCache[Any] = LruCache(maxsize=64)
+
+# Verifying keys shared by every PKIServices instance, keyed by certificate fingerprint
+_verifying_key_cache : LruCache[Any] = LruCache(maxsize=512)
+
+# Whether a private key belongs to its certificate, keyed by the fingerprint of both
+_key_pair_cache : LruCache[bool] = LruCache(maxsize=64)
+
+# Hash function used by each signature scheme accepted by get_validate_function
+_scheme_hash_names : dict[str, str] = {
+    "ecdsa-384-sha3" : "sha3_384",
+    "ecdsa-384-sha2" : "sha384",
+}
+
+def _is_key_pair(certificate : bytes, private_key : bytes) -> bool:
+    """
+        Check that a private key belongs to a certificate
+
+        :param certificate: The PEM encoded certificate
+        :param private_key: The PEM encoded private key
+        :return: True if both hold the same public key
+    """
+    certificate_key = load_pem_x509_certificate(certificate).public_key()
+    private_public_key = load_pem_private_key(private_key, password=None).public_key()
+    return (certificate_key.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+            == private_public_key.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo))
+
+
+def _load_verifying_key(certificate : bytes, crypto_backend : CryptoBackend) -> Any:
+    """
+        Return the verifying key for a certificate, parsing the certificate
+        only the first time it is seen
+
+        :param certificate: The certificate in PEM format, with or without the PEM headers
+        :param crypto_backend: The backend the key is used with
+        :return: The backend specific verifying key
+    """
+    def load_verifying_key() -> Any:
+        if "-----BEGIN CERTIFICATE-----"  not in certificate.decode():
+            x509_cert = load_pem_x509_certificate(b"-----BEGIN CERTIFICATE-----" +
+                                                certificate +
+                                                b"-----END CERTIFICATE-----")
+        else:
+            x509_cert = load_pem_x509_certificate(certificate)
+
+        return crypto_backend.load_verifying_key(x509_cert.public_key())
+
+    return _verifying_key_cache.get_or_create((sha256(certificate).digest(), crypto_backend.name),
+                                              load_verifying_key)
+
+
+def _verify_group(backend_name : str, hash_name : str, certificates : tuple[bytes, ...],
+                  entries : list[tuple[int, bytes, str]]) -> list[tuple[int, bool]]:
+    """
+        Verify signatures that share the same certificates and hash function.
+        Runs in the worker processes, so the keys are loaded once per group.
+
+        :param backend_name: The name of the crypto backend
+        :param hash_name: The hash function the data was signed with
+        :param certificates: The certificates any of which may have made the signatures
+        :param entries: The index, payload and hex signature of each item
+        :return: The index and verdict of each item
+    """
+    crypto_backend = get_crypto_backend(backend_name)
+
+    verifying_keys = []
+    for certificate in certificates:
+        try:
+            verifying_keys.append(_load_verifying_key(certificate, crypto_backend))
+        except ValueError as e:
+            logging.error("Could not load certificate: %s", str(e))
+
+    verdicts = []
+    for index, data, signature in entries:
+        try:
+            signature_bytes = bytes.fromhex(signature)
+        except ValueError:
+            verdicts.append((index, False))
+            continue
+
+        verdicts.append((index, any(crypto_backend.verify(verifying_key, data, signature_bytes, hash_name)
+                                    for verifying_key in verifying_keys)))
+
+    return verdicts
 
 
 class PKIServices:
@@ -32,33 +121,51 @@ class PKIServices:
     root_ca_fingerprint_hash_algorithm : str
     public_key : str
     private_key : str
+    client_certificate_fingerprint : str
+    client_credentials_fingerprint : str
     private_key_password : str | None
     digital_signature_reference : hashes.HashAlgorithm = sha3_384
     protection_scheme = "SECOM"
+    crypto_backend : CryptoBackend
 
     # Private variables
     _temp_folder : TemporaryDirectory
+    _signing_key : Any
+    _signature_certificate : str
 
-    def __init__(self, public_cert : str, private_cert : str, root_cert : str) -> None:
+    def __init__(self, public_cert : str, private_cert : str, root_cert : str,
+                 crypto_backend : CryptoBackend | None = None) -> None:
         """
         Create a new instance of PKIServices
         :param public_cert: The public certificate string
         :param private_cert: The private certificate string
         :param root_cert: The root certificate string
+        :param crypto_backend: The backend used to sign and verify, defaults to the OpenSSL backed one
         """
+        self.crypto_backend = crypto_backend if crypto_backend is not None else get_crypto_backend()
 
         self._tempfolder = tempfile.TemporaryDirectory(delete=False)
 
         self.public_key = self._tempfolder.name + "/public_cert.pem"
+        public_cert_bytes = base64.b64decode(public_cert)
         with open(self.public_key, "wb") as f:
-            f.write(base64.b64decode(public_cert))
+            f.write(public_cert_bytes)
 
         self.private_key = self._tempfolder.name + "/private_cert.pem"
+        private_cert_bytes = base64.b64decode(private_cert)
         with open(self.private_key, "wb") as f:
-            f.write(base64.b64decode(private_cert))
+            f.write(private_cert_bytes)
 
-        self.root_ca_cert = base64.b64decode(root_cert)
-        self.root_ca_fingerprint, self.root_ca_fingerprint_hash_algorithm = self.calculate_ca_certificate_fingerprint()
+        try:
+            self._load_key_material(public_cert_bytes, private_cert_bytes)
+
+            self.root_ca_cert = base64.b64decode(root_cert)
+            self.root_ca_fingerprint, self.root_ca_fingerprint_hash_algorithm = \
+                self.calculate_ca_certificate_fingerprint()
+        except Exception:
+            # Do not leave the key behind in the temporary folder
+            self.cleanup()
+            raise
 
         logging.info(f"Temp folder: {self._tempfolder.name}")
 
@@ -78,6 +185,36 @@ class PKIServices:
         return root_ca_fingerprint, root_ca_fingerprint_hash_algorithm
 
 
+    def _load_key_material(self, public_cert : bytes, private_cert : bytes) -> None:
+        """
+            Parse the signing key and the envelope certificate once so that
+            signing needs no file access. The private key must belong to the
+            certificate, as the pooled mTLS clients are shared by every caller
+            presenting the same certificate and key.
+
+            :param public_cert: The PEM encoded public certificate
+            :param private_cert: The PEM encoded private key
+            :raises KeyMismatchException: if the private key does not belong to the certificate
+        """
+        self.client_certificate_fingerprint = sha256(public_cert).hexdigest()
+        self.client_credentials_fingerprint = sha256(public_cert + b"\0" + private_cert).hexdigest()
+
+        if not _key_pair_cache.get_or_create(self.client_credentials_fingerprint,
+                                             lambda: _is_key_pair(public_cert, private_cert)):
+            raise KeyMismatchException("The private key does not belong to the certificate")
+
+        hash_name = self.digital_signature_reference().name
+        key_fingerprint = (sha256(private_cert).hexdigest(), hash_name, self.crypto_backend.name)
+
+        self._signing_key = _signing_key_cache.get_or_create(
+            key_fingerprint,
+            lambda: self.crypto_backend.load_signing_key(private_cert, hash_name))
+
+        self._signature_certificate = (public_cert.decode('utf-8').replace("\n", "")
+                                       .replace("-----BEGIN CERTIFICATE-----", "")
+                                       .replace("-----END CERTIFICATE-----", ""))
+
+
     def get_data_signature(self, data : bytes) -> str:
         """
             Generate a signature from the private key using the given hash function
@@ -85,13 +222,12 @@ class PKIServices:
             :param data: The data to sign
             :return: The signature as a hex string
         """
-        with open(self.private_key, encoding='utf-8') as private_key_file:
-            signing_key = ecdsa.SigningKey.from_pem(private_key_file.read(), hashfunc=self.digital_signature_reference)
-            signature = signing_key.sign(data, sigencode=sigencode_der)
+        signature = self.crypto_backend.sign(self._signing_key, data, self.digital_signature_reference().name)
 
         return signature.hex()
 
 
+    @traced("PKIServices.sign_envelope_object")
     def sign_envelope_object(self, envelope : SecomEnvelope) -> tuple[SecomEnvelope, str]:
         """
         Sign the envelope object using the private key
@@ -101,23 +237,30 @@ class PKIServices:
         # Populate the envelope
         envelope.envelope_root_certificate_thumbprint = self.root_ca_fingerprint
         logging.info("Root CA fingerprint: %s", self.root_ca_fingerprint)
-        envelope.envelope_signature_certificate = []
-        with open(self.public_key, "r") as f:
-            envelope.envelope_signature_certificate.append(f.read().replace("\n", "")
-                                                           .replace("-----BEGIN CERTIFICATE-----", "")
-                                                           .replace("-----END CERTIFICATE-----", ""))
+        envelope.envelope_signature_certificate = [self._signature_certificate]
 
         envelope.envelope_signature_time = datetime.now()
         envelope.envelope_signature_reference = self.digital_signature_reference().name
 
         # Get the signature and the signature reference
-        signature = self.get_data_signature(envelope.payload_to_bytes())
+        payload = envelope.payload_to_bytes()
+        signature = self.get_data_signature(payload)
         logging.info("-----------------------------------------")
-        logging.info("Payload: %s", envelope.payload_to_bytes())
+        logging.info("Payload: %s", payload)
         logging.info("Signature: %s", signature)
         logging.info("-----------------------------------------")
         return envelope, signature
 
+    def _get_verifying_key(self, certificate : bytes) -> Any:
+        """
+            Return the cached verifying key for a certificate
+
+            :param certificate: The certificate in PEM format, with or without the PEM headers
+            :return: The backend specific verifying key
+        """
+        return _load_verifying_key(certificate, self.crypto_backend)
+
+
     def verify_ecdsa_384_sha3_data_signature(self, data : bytes,
                               certificates : list[bytes] | bytes,
                               signature : str) -> bool:
@@ -131,37 +274,23 @@ class PKIServices:
 
             for certificate in certificates:
 
-                if "-----BEGIN CERTIFICATE-----"  not in certificate.decode(): # type: ignore
-                    x509_cert = load_pem_x509_certificate(b"-----BEGIN CERTIFICATE-----" +
-                                                        certificate + # type: ignore
-                                                        b"-----END CERTIFICATE-----")
-                else:
-                    x509_cert = load_pem_x509_certificate(certificate) # type: ignore
-
-                public_key = x509_cert.public_key()
-
-                verify_key = ecdsa.VerifyingKey.from_pem(
-                                            public_key.public_bytes(serialization.Encoding.PEM,
-                                            serialization.PublicFormat.SubjectPublicKeyInfo)
-                                            )
+                verify_key = self._get_verifying_key(certificate) # type: ignore
 
                 logging.info("Signature in hex: %s", signature)
 
                 if isinstance(data, str):
                     data = data.encode()
 
-                valid = verify_key.verify(signature=bytes.fromhex(signature),
-                                          data=data,
-                                          hashfunc=sha3_384,
-                                          sigdecode=sigdecode_der)
+                valid = self.crypto_backend.verify(verify_key, data, bytes.fromhex(signature), "sha3_384")
 
                 if not valid:
                     logging.error("Data could not be validated")
-                else:
-                    logging.info("Data signature is valid")
-                    return valid
+                    raise SignatureValidationException("Data signature is invalid")
 
-        except BadSignatureError as e:
+                logging.info("Data signature is valid")
+                return valid
+
+        except ValueError as e:
             logging.error("Exception: %s", str(e))
             raise SignatureValidationException from e
 
@@ -181,37 +310,23 @@ class PKIServices:
 
             for certificate in certificates:
 
-                if "-----BEGIN CERTIFICATE-----"  not in certificate.decode(): # type: ignore
-                    x509_cert = load_pem_x509_certificate(b"-----BEGIN CERTIFICATE-----" +
-                                                        certificate + # type: ignore
-                                                        b"-----END CERTIFICATE-----")
-                else:
-                    x509_cert = load_pem_x509_certificate(certificate) # type: ignore
-
-                public_key = x509_cert.public_key()
-
-                verify_key = ecdsa.VerifyingKey.from_pem(
-                                            public_key.public_bytes(serialization.Encoding.PEM,
-                                            serialization.PublicFormat.SubjectPublicKeyInfo)
-                                            )
+                verify_key = self._get_verifying_key(certificate) # type: ignore
 
                 logging.info("Signature in hex: %s", signature)
 
                 if isinstance(data, str):
                     data = data.encode()
 
-                valid = verify_key.verify(signature=bytes.fromhex(signature),
-                                          data=data,
-                                          hashfunc=sha384,
-                                          sigdecode=sigdecode_der)
+                valid = self.crypto_backend.verify(verify_key, data, bytes.fromhex(signature), "sha384")
 
                 if not valid:
                     logging.error("Data could not be validated")
-                else:
-                    logging.info("Data signature is valid")
-                    return valid
+                    raise SignatureValidationException("Data signature is invalid")
+
+                logging.info("Data signature is valid")
+                return valid
 
-        except BadSignatureError as e:
+        except ValueError as e:
             logging.error("Exception: %s", str(e))
             raise SignatureValidationException from e
 
@@ -233,6 +348,52 @@ class PKIServices:
                 return self.verify_ecdsa_384_sha3_data_signature
 
 
+    async def verify_data_signatures(self, items : list[tuple[bytes, list[bytes] | bytes, str, str]],
+                                     chunk_size : int = 64,
+                                     inline_threshold : int = 32) -> list[bool]:
+        """
+            Verify many signatures at once. Items are grouped by certificates and
+            signature scheme so each key is loaded once per group, and the groups
+            are split into chunks that run on a pool of worker processes. The event
+            loop keeps running while the workers verify.
+
+            :param items: Tuples of (data, certificates, hex signature, signature scheme)
+            :param chunk_size: The maximum number of items sent to a worker at a time
+            :param inline_threshold: Batches smaller than this are verified in this process
+            :return: A verdict for each item in the order given, True if any of its
+                     certificates verifies the signature
+        """
+        groups : dict[tuple[str, tuple[bytes, ...]], list[tuple[int, bytes, str]]] = {}
+        for index, (data, certificates, signature, scheme) in enumerate(items):
+            if isinstance(certificates, bytes):
+                certificates = [certificates]
+            if isinstance(data, str):
+                data = data.encode()
+
+            hash_name = _scheme_hash_names.get(scheme, "sha3_384")
+            groups.setdefault((hash_name, tuple(certificates)), []).append((index, data, signature))
+
+        chunks = [(hash_name, certificates, entries[start:start + chunk_size])
+                  for (hash_name, certificates), entries in groups.items()
+                  for start in range(0, len(entries), chunk_size)]
+
+        if len(items) < inline_threshold:
+            chunk_verdicts = [_verify_group(self.crypto_backend.name, hash_name, certificates, entries)
+                              for hash_name, certificates, entries in chunks]
+        else:
+            pool = get_worker_pool()
+            futures = [pool.submit(_verify_group, self.crypto_backend.name, hash_name, certificates, entries)
+                       for hash_name, certificates, entries in chunks]
+            chunk_verdicts = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+
+        verdicts = [False] * len(items)
+        for chunk in chunk_verdicts:
+            for index, valid in chunk:
+                verdicts[index] = valid
+
+        return verdicts
+
+
     def get_client_certificate(self) -> tuple[str, str]:
         """
             Returns the certificate as a tuple containing the 
@@ -251,6 +412,26 @@ class PKIServices:
         self.private_key = private_key
         self.private_key_password = private_key_password
 
+        with open(public_key, "rb") as public_key_file, open(private_key, "rb") as private_key_file:
+            public_cert_bytes = public_key_file.read()
+            self._load_key_material(public_cert_bytes, private_key_file.read())
+
+
+    @staticmethod
+    def signing_key_cache_stats() -> dict[str, int | float]:
+        """
+            Returns the hit and miss counters of the signing key cache
+        """
+        return _signing_key_cache.stats()
+
+
+    @staticmethod
+    def verifying_key_cache_stats() -> dict[str, int | float]:
+        """
+            Returns the hit and miss counters of the verifying key cache
+        """
+        return _verifying_key_cache.stats()
+
     def cleanup(self):
         """
         Remove the temporary folder
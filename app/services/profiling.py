@@ -0,0 +1,270 @@
+"""
+    Opt-in trace spans and profiles of endorsement runs
+"""
+import cProfile
+import functools
+import inspect
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections.abc import Callable
+from contextlib import nullcontext
+from contextvars import ContextVar, Token
+from typing import Any
+
+from app.model.profile_report import ProfileReport
+
+# Returned by span() when the run is not being traced, so a disabled span costs
+# one context variable lookup
+_NO_SPAN = nullcontext()
+
+# Only one cProfile profiler can be active in a process at a time
+_profiler_lock = threading.Lock()
+
+
+class _RunTrace:
+    """
+        The spans finished so far in one traced run
+    """
+
+    trace_id : str
+    spans : list[dict[str, Any]]
+
+    def __init__(self) -> None:
+        self.trace_id = secrets.token_hex(16)
+        self.spans = []
+
+
+_current_trace : ContextVar[_RunTrace | None] = ContextVar("run_trace", default=None)
+_current_span_id : ContextVar[str | None] = ContextVar("span_id", default=None)
+
+
+class _Span:
+    """
+        Records one span of the current trace, as a child of the span it starts in
+    """
+
+    __slots__ = ("trace", "name", "attributes", "span_id", "parent_span_id", "start", "token")
+
+    def __init__(self, trace : _RunTrace, name : str, attributes : dict[str, Any]) -> None:
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = None
+        self.start = 0
+        self.token : Token | None = None
+
+    def __enter__(self) -> "_Span":
+        self.parent_span_id = _current_span_id.get()
+        self.token = _current_span_id.set(self.span_id)
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        end = time.time_ns()
+        _current_span_id.reset(self.token)
+        span = {
+            "traceId" : self.trace.trace_id,
+            "spanId" : self.span_id,
+            "name" : self.name,
+            "kind" : 1,
+            "startTimeUnixNano" : str(self.start),
+            "endTimeUnixNano" : str(end),
+            "attributes" : [_attribute(key, value) for key, value in self.attributes.items()],
+            "status" : {"code" : 1},
+        }
+        if self.parent_span_id is not None:
+            span["parentSpanId"] = self.parent_span_id
+        if exception is not None:
+            span["status"] = {"code" : 2, "message" : f"{type(exception).__name__}: {exception}"}
+
+        # list.append is atomic, so spans finishing in worker threads need no lock
+        self.trace.spans.append(span)
+
+
+def _attribute(key : str, value : Any) -> dict[str, Any]:
+    """
+    Encode a span attribute as OTLP JSON
+    :param key: The attribute name
+    :param value: The attribute value
+    :return: the encoded attribute
+    """
+    if isinstance(value, bool):
+        return {"key" : key, "value" : {"boolValue" : value}}
+    if isinstance(value, int):
+        return {"key" : key, "value" : {"intValue" : str(value)}}
+    if isinstance(value, float):
+        return {"key" : key, "value" : {"doubleValue" : value}}
+    return {"key" : key, "value" : {"stringValue" : str(value)}}
+
+
+def span(name : str, **attributes : Any) -> Any:
+    """
+    Time a block as a span of the current trace. Does nothing when the run is not traced.
+    :param name: The span name
+    :param attributes: Attributes of the span
+    :return: a context manager
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name, attributes)
+
+
+def traced(name : str, *argument_names : str) -> Callable[[Callable], Callable]:
+    """
+    Decorate a function or coroutine function so each call is a span of the current
+    trace. When the run is not traced the call costs one context variable lookup more.
+    :param name: The span name
+    :param argument_names: Arguments of the function recorded as attributes of the span
+    :return: the decorator
+    """
+    def decorate(function : Callable) -> Callable:
+        signature = inspect.signature(function)
+
+        def attributes(args : tuple, kwargs : dict) -> dict[str, Any]:
+            arguments = signature.bind(*args, **kwargs).arguments
+            return {argument : arguments[argument] for argument in argument_names if argument in arguments}
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args : Any, **kwargs : Any) -> Any:
+                trace = _current_trace.get()
+                if trace is None:
+                    return await function(*args, **kwargs)
+                with _Span(trace, name, attributes(args, kwargs)):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args : Any, **kwargs : Any) -> Any:
+            trace = _current_trace.get()
+            if trace is None:
+                return function(*args, **kwargs)
+            with _Span(trace, name, attributes(args, kwargs)):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+class RunProfile:
+    """
+        Traces an endorsement run while the block is active, and with the
+        "cprofile" mode also profiles it. The spans of the run, including those
+        in the tasks and threads it starts, are written as OpenTelemetry (OTLP
+        JSON) to <trace id>.json in output_directory, and the profile in pstats
+        format, which snakeviz, flameprof and gprof2dot read, to <trace id>.prof.
+
+        The profile is not limited to the run: from Python 3.12 cProfile covers
+        every thread of the process, before that only the event loop, and either
+        way it includes other requests served while the run is active. Only one run
+        at a time is profiled; a second one gets only its spans.
+    """
+
+    output_directory : str = "./data/profiles"
+
+    mode : str
+    root_name : str
+    attributes : dict[str, Any]
+
+    _trace : _RunTrace
+    _trace_token : Token | None
+    _root : _Span | None
+    _profiler : cProfile.Profile | None
+    _note : str
+
+    def __init__(self, mode : str, root_name : str, **attributes : Any) -> None:
+        """
+        Create a profile
+        :param mode: "trace" for spans, "cprofile" for spans and a profile
+        :param root_name: The name of the span around the whole run
+        :param attributes: Attributes of the root span
+        """
+        self.mode = mode
+        self.root_name = root_name
+        self.attributes = attributes
+        self._trace = _RunTrace()
+        self._trace_token = None
+        self._root = None
+        self._profiler = None
+        self._note = ""
+
+    def __enter__(self) -> "RunProfile":
+        self._trace_token = _current_trace.set(self._trace)
+        self._root = _Span(self._trace, self.root_name, self.attributes)
+        self._root.__enter__()
+
+        if self.mode == "cprofile":
+            if _profiler_lock.acquire(blocking=False):
+                self._profiler = cProfile.Profile()
+                try:
+                    self._profiler.enable()
+                except ValueError as e:
+                    # Another profiler, such as a debugger's, is already active
+                    _profiler_lock.release()
+                    self._profiler = None
+                    self._note = f"Not profiled: {e}"
+            else:
+                self._note = "Not profiled: another run was being profiled"
+        return self
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        if self._profiler is not None:
+            self._profiler.disable()
+            _profiler_lock.release()
+
+        self._root.__exit__(exception_type, exception, traceback)
+        _current_trace.reset(self._trace_token)
+
+    @classmethod
+    def prune(cls, before : float) -> int:
+        """
+        Remove the traces and profiles written before a time
+        :param before: Files last written before this time, in seconds since the epoch, are removed
+        :return: the number of files removed
+        """
+        if not os.path.isdir(cls.output_directory):
+            return 0
+
+        removed = 0
+        for entry in os.scandir(cls.output_directory):
+            if entry.is_file() and entry.name.endswith((".json", ".prof")) and entry.stat().st_mtime < before:
+                try:
+                    os.unlink(entry.path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def write(self) -> ProfileReport:
+        """
+        Write the spans, and the profile if there is one, once the block has exited
+        :return: where they were written
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+
+        trace_file = os.path.join(self.output_directory, f"{self._trace.trace_id}.json")
+        with open(trace_file, "w") as file:
+            json.dump({"resourceSpans" : [{
+                "resource" : {"attributes" : [_attribute("service.name", "msr-validator")]},
+                "scopeSpans" : [{"scope" : {"name" : __name__}, "spans" : self._trace.spans}],
+            }]}, file)
+
+        profile_file = None
+        if self._profiler is not None:
+            profile_file = os.path.join(self.output_directory, f"{self._trace.trace_id}.prof")
+            self._profiler.dump_stats(profile_file)
+
+        logging.info("Wrote the trace of %s to %s", self.root_name, trace_file)
+        return ProfileReport(trace_id=self._trace.trace_id,
+                             trace_file=trace_file,
+                             span_count=len(self._trace.spans),
+                             profile_file=profile_file,
+                             note=self._note)
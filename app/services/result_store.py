@@ -0,0 +1,248 @@
+"""
+    SQLite history of endorsement runs
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from app.model.stored_run import StoredRun, StoredTestResult
+from app.model.test_results import TestResults
+from app.model.test_trend_point import TestTrendPoint
+
+# Each result row repeats the target and start time of its run, so the trend
+# queries are answered from the covering indexes alone, without reading the runs
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS targets (
+    target_id INTEGER PRIMARY KEY,
+    test_url TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY,
+    target_id INTEGER NOT NULL REFERENCES targets (target_id),
+    certificate_fingerprint TEXT NOT NULL,
+    schema_hash TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    elapsed REAL NOT NULL,
+    passed INTEGER NOT NULL,
+    failed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_target_started_at ON runs (target_id, started_at);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL REFERENCES runs (run_id),
+    position INTEGER NOT NULL,
+    target_id INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    test_key TEXT NOT NULL,
+    test_name TEXT NOT NULL,
+    test_success INTEGER NOT NULL,
+    failure_reason TEXT NOT NULL,
+    elapsed REAL,
+    response_ref TEXT,
+    PRIMARY KEY (run_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS results_test_trend ON results (test_key, started_at, test_success, elapsed);
+CREATE INDEX IF NOT EXISTS results_target_test_trend
+    ON results (target_id, test_key, started_at, test_success, elapsed);
+"""
+
+_RUN_COLUMNS = ("runs.run_id, targets.test_url, runs.certificate_fingerprint, runs.schema_hash, runs.started_at, "
+                "runs.elapsed, runs.passed, runs.failed")
+
+
+class ResultStore:
+    """
+        Keeps every endorsement run and its test results in a local SQLite database,
+        keyed by target URL, client certificate fingerprint, schema hash and start
+        time. The responses themselves are not kept, only their references in the
+        blob store. Indexed for the latest run of
+        each MSR and for the pass rate and latency of a test over time.
+    """
+
+    path : str
+
+    _connection : sqlite3.Connection
+    _lock : threading.Lock
+
+    def __init__(self, path : str) -> None:
+        """
+        Open the store, creating the database when it does not exist
+        :param path: The path of the SQLite database file
+        """
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).touch(mode=0o600, exist_ok=True)
+        os.chmod(path, 0o600)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+        # Histories written before the responses were kept have no references
+        columns = [row[1] for row in self._connection.execute("PRAGMA table_info(results)")]
+        if "response_ref" not in columns:
+            self._connection.execute("ALTER TABLE results ADD COLUMN response_ref TEXT")
+
+    def record(self, test_url : str, certificate_fingerprint : str, schema_hash : str, started_at : float,
+               elapsed : float, test_results : TestResults) -> int:
+        """
+        Add a finished run to the history
+        :param test_url: The URL of the MSR
+        :param certificate_fingerprint: SHA-256 of the client certificate used
+        :param schema_hash: SHA-256 of the OpenAPI schema file used
+        :param started_at: When the run started, in seconds since the epoch
+        :param elapsed: Seconds the run took
+        :param test_results: The results of the run
+        :return: the run id
+        """
+        test_url = self._target_url(test_url)
+        passed = sum(1 for result in test_results.results if result.test_success)
+
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN")
+            try:
+                cursor.execute("INSERT OR IGNORE INTO targets (test_url) VALUES (?)", (test_url,))
+                target_id = cursor.execute("SELECT target_id FROM targets WHERE test_url = ?",
+                                           (test_url,)).fetchone()[0]
+                run_id = cursor.execute(
+                    "INSERT INTO runs (target_id, certificate_fingerprint, schema_hash, started_at, elapsed, "
+                    "passed, failed) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (target_id, certificate_fingerprint, schema_hash, started_at, elapsed,
+                     passed, len(test_results.results) - passed)).lastrowid
+                cursor.executemany(
+                    "INSERT INTO results (run_id, position, target_id, started_at, test_key, test_name, "
+                    "test_success, failure_reason, elapsed, response_ref) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, position, target_id, started_at, result.test_key or result.test_name, result.test_name,
+                      result.test_success, result.failure_reason, result.elapsed, result.response_ref)
+                     for position, result in enumerate(test_results.results)])
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+        return run_id
+
+    def latest_runs(self) -> list[StoredRun]:
+        """
+        Return the latest run of every MSR, without the test results
+        :return: the runs, most recent first
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {_RUN_COLUMNS} FROM targets JOIN runs ON runs.run_id = "
+                "(SELECT run_id FROM runs WHERE runs.target_id = targets.target_id ORDER BY started_at DESC LIMIT 1) "
+                "ORDER BY runs.started_at DESC").fetchall()
+
+        return [self._run(row) for row in rows]
+
+    def latest_run(self, test_url : str) -> StoredRun | None:
+        """
+        Return the latest run of an MSR with its test results
+        :param test_url: The URL of the MSR
+        :return: the run, or None when the MSR has not been tested
+        """
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT {_RUN_COLUMNS} FROM targets JOIN runs ON runs.target_id = targets.target_id "
+                "WHERE targets.test_url = ? ORDER BY runs.started_at DESC LIMIT 1",
+                (self._target_url(test_url),)).fetchone()
+            if row is None:
+                return None
+
+            results = self._connection.execute(
+                "SELECT test_key, test_name, test_success, failure_reason, elapsed, response_ref FROM results "
+                "WHERE run_id = ? ORDER BY position", (row[0],)).fetchall()
+
+        run = self._run(row)
+        run.results = [StoredTestResult(test_key=test_key, test_name=test_name, test_success=test_success,
+                                        failure_reason=failure_reason, elapsed=elapsed, response_ref=response_ref)
+                       for test_key, test_name, test_success, failure_reason, elapsed, response_ref in results]
+        return run
+
+    def test_trend(self, test_key : str, test_url : str | None = None, since : float | None = None,
+                   until : float | None = None, bucket : float = 86400.0) -> list[TestTrendPoint]:
+        """
+        Return the pass rate and latency of a test over time
+        :param test_key: The name of the test in the test graph
+        :param test_url: Only include runs against this MSR
+        :param since: Only include runs started at or after this time
+        :param until: Only include runs started before this time
+        :param bucket: The length of each interval in seconds
+        :return: a point for each interval the test ran in, oldest first
+        """
+        if bucket <= 0:
+            raise ValueError("bucket must be positive")
+
+        conditions = ["test_key = :test_key", "started_at >= :since", "started_at < :until"]
+        if test_url is not None:
+            conditions.insert(0, "target_id = (SELECT target_id FROM targets WHERE test_url = :test_url)")
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT CAST(started_at / :bucket AS INTEGER) AS bucket_index, COUNT(*), SUM(test_success), "
+                "AVG(elapsed), MAX(elapsed) FROM results "
+                f"WHERE {' AND '.join(conditions)} GROUP BY bucket_index ORDER BY bucket_index",
+                {"test_key" : test_key, "bucket" : bucket,
+                 "test_url" : self._target_url(test_url) if test_url is not None else None,
+                 "since" : since if since is not None else float("-inf"),
+                 "until" : until if until is not None else float("inf")}).fetchall()
+
+        return [TestTrendPoint(bucket_start=bucket_index * bucket, runs=runs, passed=passed, pass_rate=passed / runs,
+                               mean_elapsed=mean_elapsed, max_elapsed=max_elapsed)
+                for bucket_index, runs, passed, mean_elapsed, max_elapsed in rows]
+
+    def prune(self, before : float) -> int:
+        """
+        Remove the runs started before a time, with their test results
+        :param before: Runs started before this time, in seconds since the epoch, are removed
+        :return: the number of runs removed
+        """
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN")
+            try:
+                cursor.execute("DELETE FROM results WHERE run_id IN (SELECT run_id FROM runs WHERE started_at < ?)",
+                               (before,))
+                removed = cursor.execute("DELETE FROM runs WHERE started_at < ?", (before,)).rowcount
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+        return removed
+
+    def response_refs(self) -> set[str]:
+        """
+        Return the blob store references of the responses the history still refers to
+        :return: the references
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT DISTINCT response_ref FROM results WHERE response_ref IS NOT NULL").fetchall()
+
+        return {response_ref for (response_ref,) in rows}
+
+    def close(self) -> None:
+        """
+        Close the database
+        """
+        with self._lock:
+            self._connection.close()
+
+    @staticmethod
+    def _target_url(test_url : str) -> str:
+        """
+        Return the URL an MSR is kept under, which ends with a slash like the base URL of its tests
+        :param test_url: The URL of the MSR
+        :return: the URL of the MSR ending with a slash
+        """
+        return test_url if test_url.endswith("/") else test_url + "/"
+
+    @staticmethod
+    def _run(row : tuple) -> StoredRun:
+        run_id, test_url, certificate_fingerprint, schema_hash, started_at, elapsed, passed, failed = row
+        return StoredRun(run_id=run_id, test_url=test_url, certificate_fingerprint=certificate_fingerprint,
+                         schema_hash=schema_hash, started_at=started_at, elapsed=elapsed, passed=passed, failed=failed)
@@ -0,0 +1,91 @@
+"""
+    Periodic removal of old runs, responses, jobs and profiles
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+
+from app.services.blob_store import BlobStore
+from app.services.job_store import JobStore
+from app.services.profiling import RunProfile
+from app.services.result_store import ResultStore
+
+
+class Retention:
+    """
+        Keeps the history, the stored responses, the finished jobs and the profiles to
+        max_age seconds. Every interval seconds the runs started before then are
+        removed from the result store, then the responses no remaining run refers
+        to, the jobs that ended before then, and the traces and profiles written
+        before then. Responses stored within the last grace seconds are kept, as
+        their run may not have been recorded yet.
+    """
+
+    result_store : ResultStore
+    blob_store : BlobStore
+    job_store : JobStore | None
+    max_age : float
+    interval : float
+    grace : float
+
+    _task : asyncio.Task | None
+
+    def __init__(self, result_store : ResultStore, blob_store : BlobStore, job_store : JobStore | None = None,
+                 max_age : float = 30 * 86400.0, interval : float = 3600.0, grace : float = 86400.0) -> None:
+        """
+        Create a new retention policy
+        :param result_store: The history of the runs
+        :param blob_store: The store the responses of the runs are kept in
+        :param job_store: The store the background jobs are kept in
+        :param max_age: Seconds runs, responses, jobs and profiles are kept for
+        :param interval: Seconds between prunes
+        :param grace: Seconds since a response was last stored before it may be removed
+        """
+        self.result_store = result_store
+        self.blob_store = blob_store
+        self.job_store = job_store
+        self.max_age = max_age
+        self.interval = interval
+        self.grace = grace
+        self._task = None
+
+    def prune(self) -> dict[str, int]:
+        """
+        Remove everything older than max_age
+        :return: the number of runs, responses, jobs and profile files removed
+        """
+        before = time.time() - self.max_age
+        runs = self.result_store.prune(before)
+        responses = self.blob_store.prune(self.result_store.response_refs(), self.grace)
+        jobs = self.job_store.prune(before) if self.job_store is not None else 0
+        profiles = RunProfile.prune(before)
+
+        logging.info("Removed %d runs, %d responses, %d jobs and %d profile files", runs, responses, jobs, profiles)
+        return {"runs" : runs, "responses" : responses, "jobs" : jobs, "profiles" : profiles}
+
+    def start(self) -> None:
+        """
+        Prune now and every interval seconds on the running event loop
+        """
+        self._task = asyncio.create_task(self._run(), name="retention")
+
+    async def stop(self) -> None:
+        """
+        Stop pruning
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        """
+        Prune until cancelled
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.prune)
+            except (OSError, sqlite3.Error):
+                logging.exception("Could not remove old runs and responses")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,364 @@
+"""
+    Generates specialised Python validation functions from OpenAPI 3.1 component schemas
+"""
+import hashlib
+import importlib.util
+import logging
+import os
+import stat
+import tempfile
+from collections.abc import Callable
+from types import ModuleType
+from typing import Any
+
+from jsonschema import FormatChecker
+
+from app.model.exceptions.unsupported_schema_exception import UnsupportedSchemaException
+
+# Bump when the generated code changes so cached modules are rebuilt
+GENERATOR_VERSION = 1
+
+# The schemas compiled for the MSR endorsement tests
+COMPILED_SCHEMAS = ("SearchResult", "ServiceInstanceObject", "ServiceInstanceStatus",
+                    "MaritimeServiceType", "SearchFilterObject")
+
+_SCHEMA_REF = "#/components/schemas/"
+
+# Keywords that only annotate a schema and never make a value invalid
+_ANNOTATIONS = frozenset({"description", "default", "example", "examples", "title", "deprecated",
+                          "readOnly", "writeOnly", "xml", "externalDocs", "$comment"})
+
+_SUPPORTED = frozenset({"$ref", "type", "enum", "minLength", "pattern", "format",
+                        "required", "properties", "additionalProperties", "items"}) | _ANNOTATIONS
+
+# The draft 2020-12 type checks used by openapi_core for OpenAPI 3.1
+_TYPE_CHECKS = {
+    "string" : "isinstance({0}, str)",
+    "object" : "isinstance({0}, dict)",
+    "array" : "isinstance({0}, list)",
+    "boolean" : "isinstance({0}, bool)",
+    "null" : "{0} is None",
+    "number" : "(isinstance({0}, (int, float)) and not isinstance({0}, bool))",
+    "integer" : "((isinstance({0}, int) and not isinstance({0}, bool)) or (isinstance({0}, float) and {0}.is_integer()))",
+}
+
+# A validation function returns (path, message) for every error in the value
+SchemaValidationFunction = Callable[[Any], list[tuple[tuple, str]]]
+
+
+class _Generator:
+    """
+        Writes one function per component schema. Property and item schemas are
+        inlined into the function of the component that contains them, and $ref
+        becomes a call to the function of the referenced component.
+    """
+
+    def __init__(self, components : dict[str, Any]) -> None:
+        self.components = components
+        self.constants : list[str] = []
+        self.functions : dict[str, list[str]] = {}
+        self._lines : list[str] = []
+        self._counter = 0
+
+    def _name(self, prefix : str) -> str:
+        self._counter += 1
+        return f"{prefix}{self._counter}"
+
+    def _constant(self, prefix : str, expression : str) -> str:
+        name = self._name(f"_{prefix}_")
+        self.constants.append(f"{name} = {expression}")
+        return name
+
+    def _emit(self, indent : int, line : str) -> None:
+        self._lines.append("    " * indent + line)
+
+    def add(self, schema_name : str) -> None:
+        """
+        Generate the function for a component schema and the components it references.
+        Nothing is kept when the schema or one of its references cannot be compiled.
+        :param schema_name: The name of the schema under #/components/schemas
+        """
+        functions = dict(self.functions)
+        constants = list(self.constants)
+        try:
+            self._add(schema_name)
+        except UnsupportedSchemaException:
+            self.functions = functions
+            self.constants = constants
+            self._lines = []
+            raise
+
+    def _add(self, schema_name : str) -> None:
+        if schema_name in self.functions:
+            return
+        if schema_name not in self.components:
+            raise UnsupportedSchemaException(f"Unknown schema {schema_name}")
+
+        # Reserve the name first so recursive references terminate
+        self.functions[schema_name] = []
+        lines, self._lines = self._lines, []
+        self._emit(0, f"def _validate_{schema_name}(value, path, errors):")
+        self._schema(self.components[schema_name], "value", [], 1)
+        self._emit(1, "return errors")
+        self.functions[schema_name], self._lines = self._lines, lines
+
+    def _schema(self, schema : Any, value : str, path : list[str], indent : int) -> None:
+        """
+        Write the checks of one schema
+        :param schema: The schema
+        :param value: The name of the variable holding the value
+        :param path: The expressions of the path elements below the function's path
+        :param indent: The indentation level
+        """
+        if schema is True or schema == {}:
+            return
+        if not isinstance(schema, dict):
+            raise UnsupportedSchemaException(f"Unsupported schema {schema!r}")
+
+        unsupported = set(schema) - _SUPPORTED
+        if unsupported:
+            raise UnsupportedSchemaException(f"Unsupported keywords {sorted(unsupported)}")
+
+        path_expression = f"path + ({', '.join(path)},)" if path else "path"
+
+        def error(level : int, message : str) -> None:
+            self._emit(level, f"errors.append(({path_expression}, {message}))")
+
+        if "$ref" in schema:
+            reference = schema["$ref"]
+            if not isinstance(reference, str) or not reference.startswith(_SCHEMA_REF):
+                raise UnsupportedSchemaException(f"Unsupported reference {reference!r}")
+            self._add(reference[len(_SCHEMA_REF):])
+            self._emit(indent, f"_validate_{reference[len(_SCHEMA_REF):]}({value}, {path_expression}, errors)")
+
+        if "type" in schema:
+            types = schema["type"] if isinstance(schema["type"], list) else [schema["type"]]
+            if any(name not in _TYPE_CHECKS for name in types):
+                raise UnsupportedSchemaException(f"Unsupported type {schema['type']!r}")
+            check = " or ".join(_TYPE_CHECKS[name].format(value) for name in types)
+            names = ", ".join(repr(name) for name in types)
+            self._emit(indent, f"if not ({check}):")
+            error(indent + 1, f"repr({value}) + {' is not of type ' + names!r}")
+
+        if "enum" in schema:
+            enum = schema["enum"]
+            if not isinstance(enum, list) or not all(isinstance(item, str) for item in enum):
+                raise UnsupportedSchemaException("Only enums of strings are supported")
+            members = self._constant("enum", f"frozenset({enum!r})")
+            self._emit(indent, f"if not (isinstance({value}, str) and {value} in {members}):")
+            error(indent + 1, f"repr({value}) + {' is not one of ' + repr(enum)!r}")
+
+        if "minLength" in schema:
+            message = " should be non-empty" if schema["minLength"] == 1 else " is too short"
+            self._emit(indent, f"if isinstance({value}, str) and len({value}) < {int(schema['minLength'])}:")
+            error(indent + 1, f"repr({value}) + {message!r}")
+
+        if "pattern" in schema:
+            pattern = self._constant("pattern", f"re.compile({schema['pattern']!r})")
+            self._emit(indent, f"if isinstance({value}, str) and not {pattern}.search({value}):")
+            error(indent + 1, f"repr({value}) + {' does not match ' + repr(schema['pattern'])!r}")
+
+        if "format" in schema:
+            self._emit(indent, f"if not _format_checker.conforms({value}, {schema['format']!r}):")
+            error(indent + 1, f"repr({value}) + {' is not a ' + repr(schema['format'])!r}")
+
+        if any(keyword in schema for keyword in ("required", "properties", "additionalProperties")):
+            self._object(schema, value, path, indent, error)
+
+        if "items" in schema:
+            if not isinstance(schema["items"], dict):
+                raise UnsupportedSchemaException("Only schema items are supported")
+            index = self._name("i")
+            item = self._name("v")
+            self._emit(indent, f"if isinstance({value}, list):")
+            self._emit(indent + 1, f"for {index}, {item} in enumerate({value}):")
+            before = len(self._lines)
+            self._schema(schema["items"], item, path + [index], indent + 2)
+            if len(self._lines) == before:
+                self._emit(indent + 2, "pass")
+
+    def _object(self, schema : dict, value : str, path : list[str], indent : int,
+                error : Callable[[int, str], None]) -> None:
+        """
+        Write the required, properties and additionalProperties checks of a schema
+        """
+        properties = schema.get("properties", {})
+        additional = schema.get("additionalProperties", True)
+        self._emit(indent, f"if isinstance({value}, dict):")
+        start = len(self._lines)
+
+        if schema.get("required"):
+            required = self._constant("required", repr(tuple(schema["required"])))
+            key = self._name("k")
+            self._emit(indent + 1, f"for {key} in {required}:")
+            self._emit(indent + 2, f"if {key} not in {value}:")
+            error(indent + 3, f"repr({key}) + ' is a required property'")
+
+        for name, property_schema in properties.items():
+            item = self._name("v")
+            self._emit(indent + 1, f"{item} = {value}.get({name!r}, _missing)")
+            self._emit(indent + 1, f"if {item} is not _missing:")
+            before = len(self._lines)
+            self._schema(property_schema, item, path + [repr(name)], indent + 2)
+            if len(self._lines) == before:
+                self._emit(indent + 2, "pass")
+
+        if additional is not True and additional != {}:
+            names = self._constant("properties", f"frozenset({list(properties)!r})")
+            extras = self._name("extras")
+            self._emit(indent + 1, f"{extras} = [key for key in {value} if key not in {names}]")
+            if additional is False:
+                self._emit(indent + 1, f"if {extras}:")
+                error(indent + 2, f"_additional_properties_message({extras})")
+            elif isinstance(additional, dict):
+                key = self._name("k")
+                self._emit(indent + 1, f"for {key} in {extras}:")
+                before = len(self._lines)
+                self._schema(additional, f"{value}[{key}]", path + [key], indent + 2)
+                if len(self._lines) == before:
+                    self._emit(indent + 2, "pass")
+            else:
+                raise UnsupportedSchemaException(f"Unsupported additionalProperties {additional!r}")
+
+        if len(self._lines) == start:
+            self._emit(indent + 1, "pass")
+
+
+def generate_validators(spec : dict, schema_names : tuple[str, ...] = COMPILED_SCHEMAS,
+                        source : str = "") -> str:
+    """
+    Generate the source of a module with a validation function per schema. A schema that
+    uses keywords the generator does not support is left out so the caller can fall back
+    to openapi_core for it.
+    :param spec: The OpenAPI 3.1 document
+    :param schema_names: The component schemas to compile
+    :param source: A description of the document, written in the module header
+    :return: the module source
+    """
+    if not str(spec.get("openapi", "")).startswith("3.1"):
+        raise UnsupportedSchemaException("Only OpenAPI 3.1 documents can be compiled")
+
+    generator = _Generator(spec.get("components", {}).get("schemas", {}))
+    compiled = []
+    for schema_name in schema_names:
+        try:
+            generator.add(schema_name)
+            compiled.append(schema_name)
+        except UnsupportedSchemaException:
+            pass
+
+    lines = [f"# Generated from {source} by app/services/schema_compiler.py. Do not edit.",
+             "import re",
+             "",
+             "_missing = object()",
+             "_format_checker = None",
+             "",
+             "",
+             "def _additional_properties_message(extras):",
+             "    verb = 'was' if len(extras) == 1 else 'were'",
+             "    unexpected = ', '.join(repr(extra) for extra in sorted(extras, key=str))",
+             "    return f'Additional properties are not allowed ({unexpected} {verb} unexpected)'",
+             "",
+             ""]
+    lines.extend(generator.constants)
+    for function in generator.functions.values():
+        lines.extend(["", ""])
+        lines.extend(function)
+
+    lines.extend(["", "", "VALIDATORS = {"])
+    for schema_name in compiled:
+        lines.append(f"    {schema_name!r} : lambda value: _validate_{schema_name}(value, (), []),")
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def load_validators(spec : dict, content_hash : str, format_checker : FormatChecker,
+                    cache_dir : str, schema_names : tuple[str, ...] = COMPILED_SCHEMAS,
+                    source : str = "") -> dict[str, SchemaValidationFunction]:
+    """
+    Return the compiled validation functions for a document, generating the module
+    only when no module for the same document, schemas and generator is cached
+    :param spec: The OpenAPI 3.1 document
+    :param content_hash: The SHA256 hash of the document file
+    :param format_checker: The format checker used by openapi_core for the document
+    :param cache_dir: The directory holding the generated modules
+    :param schema_names: The component schemas to compile
+    :param source: A description of the document, written in the module header
+    :return: the validation functions by schema name
+    """
+    key = hashlib.sha256(f"{content_hash}:{GENERATOR_VERSION}:{','.join(schema_names)}".encode()).hexdigest()[:32]
+    module_name = f"_msr_validators_{key}"
+    module_path = os.path.join(cache_dir, module_name + ".py")
+
+    if not _is_private_directory(cache_dir):
+        logging.warning("Not caching the generated validators, %s is not a directory only this user can write",
+                        cache_dir)
+        module = _import_source(module_name, generate_validators(spec, schema_names, source))
+    else:
+        if not os.path.exists(module_path):
+            module_source = generate_validators(spec, schema_names, source)
+            file_handle, temporary_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+            with os.fdopen(file_handle, "w") as f:
+                f.write(module_source)
+            os.replace(temporary_path, module_path)
+
+        if _is_private_file(module_path):
+            module = _import_file(module_name, module_path)
+        else:
+            logging.warning("Not importing %s, it is not a file only this user can write", module_path)
+            module = _import_source(module_name, generate_validators(spec, schema_names, source))
+
+    module._format_checker = format_checker
+    return dict(module.VALIDATORS)
+
+
+def _is_private_directory(path : str) -> bool:
+    """
+    Create the cache directory with mode 0700 if it is missing, and check that it is
+    a real directory owned by this user that no other user can write to
+    :param path: The directory
+    :return: True if modules in it can be trusted
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    status = os.lstat(path)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid():
+        return False
+
+    if stat.S_IMODE(status.st_mode) & 0o077:
+        os.chmod(path, 0o700)
+    return True
+
+
+def _is_private_file(path : str) -> bool:
+    """
+    Check that a cached module is a regular file owned by this user that no other user can write to
+    :param path: The file
+    :return: True if the module can be imported
+    """
+    status = os.lstat(path)
+    return stat.S_ISREG(status.st_mode) and status.st_uid == os.getuid() and not status.st_mode & 0o022
+
+
+def _import_source(module_name : str, module_source : str) -> ModuleType:
+    """
+    Create a module from generated source without writing it to disk
+    :param module_name: The name to give the module
+    :param module_source: The generated source
+    :return: the module
+    """
+    module = ModuleType(module_name)
+    exec(compile(module_source, f"<{module_name}>", "exec"), module.__dict__)
+    return module
+
+
+def _import_file(module_name : str, module_path : str) -> ModuleType:
+    """
+    Import a module from a file outside the package
+    :param module_name: The name to give the module
+    :param module_path: The path of the source file
+    :return: the module
+    """
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
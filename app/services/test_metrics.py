@@ -0,0 +1,117 @@
+"""
+    Latency histograms of the tests in the Prometheus text format
+"""
+import threading
+
+from app.model.test_result import TestResult
+
+# The default Prometheus latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Histogram:
+    """
+        A Prometheus histogram with one series per combination of label values
+    """
+
+    name : str
+    description : str
+    label_names : tuple[str, ...]
+
+    _series : dict[tuple[str, ...], list[float]]
+
+    def __init__(self, name : str, description : str, label_names : tuple[str, ...]) -> None:
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self._series = {}
+
+    def observe(self, labels : tuple[str, ...], value : float) -> None:
+        """
+        Count a value
+        :param labels: The label values, in the order of label_names
+        :param value: The value
+        """
+        # The bucket counts, followed by the sum and the count of the values
+        series = self._series.setdefault(labels, [0.0] * (len(BUCKETS) + 2))
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> list[str]:
+        """
+        Render the histogram
+        :return: the lines of the text format
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            separator = "," if label_text else ""
+            for bound, count in zip(BUCKETS, series):
+                lines.append(f'{self.name}_bucket{{{label_text}{separator}le="{bound}"}} {count:g}')
+            lines.append(f'{self.name}_bucket{{{label_text}{separator}le="+Inf"}} {series[-1]:g}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {series[-2]!r}")
+            lines.append(f"{self.name}_count{{{label_text}}} {series[-1]:g}")
+        return lines
+
+
+def _escape(value : str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class TestMetrics:
+    """
+        Aggregates the timings of every test run in this process: the duration of
+        each test, the seconds spent in each of its phases and whether it passed.
+        Each worker process of the server keeps its own metrics.
+    """
+
+    _lock : threading.Lock = threading.Lock()
+    _durations : _Histogram = _Histogram("msr_test_duration_seconds",
+                                         "Seconds each endorsement test took", ("test",))
+    _phases : _Histogram = _Histogram("msr_test_phase_seconds",
+                                      "Seconds endorsement tests spent in each phase", ("test", "phase"))
+    _outcomes : dict[tuple[str, str], int] = {}
+
+    @classmethod
+    def observe(cls, result : TestResult) -> None:
+        """
+        Add a finished test
+        :param result: The test result
+        :return: None
+        """
+        test = result.test_key or result.test_name
+        with cls._lock:
+            if result.elapsed is not None:
+                cls._durations.observe((test,), result.elapsed)
+            for phase_name, seconds in result.timings.items():
+                cls._phases.observe((test, phase_name), seconds)
+            outcome = (test, "passed" if result.test_success else "failed")
+            cls._outcomes[outcome] = cls._outcomes.get(outcome, 0) + 1
+
+    @classmethod
+    def render(cls) -> str:
+        """
+        Render the metrics in the Prometheus text exposition format
+        :return: the metrics
+        """
+        with cls._lock:
+            lines = cls._durations.render() + cls._phases.render()
+            lines.extend(["# HELP msr_test_results_total Endorsement tests run, by outcome",
+                          "# TYPE msr_test_results_total counter"])
+            lines.extend(f'msr_test_results_total{{test="{_escape(test)}",outcome="{outcome}"}} {count}'
+                         for (test, outcome), count in sorted(cls._outcomes.items()))
+        return "\n".join(lines) + "\n"
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Forget every test counted so far
+        :return: None
+        """
+        with cls._lock:
+            cls._durations = _Histogram(cls._durations.name, cls._durations.description, cls._durations.label_names)
+            cls._phases = _Histogram(cls._phases.name, cls._phases.description, cls._phases.label_names)
+            cls._outcomes = {}
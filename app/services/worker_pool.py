@@ -0,0 +1,26 @@
+"""
+    The pool of worker processes shared by the CPU bound services
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Spawned once and shared by item validation and batch signature verification,
+# so the service runs one worker per CPU rather than one per CPU for each of them
+_worker_pool : ProcessPoolExecutor | None = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> ProcessPoolExecutor:
+    """
+        Return the shared worker pool, creating it on first use. The workers keep
+        the schema validators and verifying keys they build between tasks.
+
+        :return: the worker pool
+    """
+    global _worker_pool
+
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+        return _worker_pool
@@ -1,22 +1,44 @@
+import asyncio
+import inspect
 import json
-from time import sleep
+import logging
+import sqlite3
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import AsyncExitStack, nullcontext
+from pathlib import Path
+from typing import Any
 from uuid import uuid4
 
-import requests
+import httpx
 
 from openapi_core import OpenAPI
-from openapi_core.contrib.requests import RequestsOpenAPIRequest, RequestsOpenAPIResponse
-from openapi_core.validation.response.exceptions import InvalidData
-from requests import RequestException
+from openapi_core.exceptions import OpenAPIError
 
+from app.model.poll_schedule import PollSchedule
+from app.model.schema_verdict import SchemaVerdict
 from app.model.secom.v2.secom_envelope_search_filter import SecomEnvelopeSearchFilter
 from app.model.secom.v2.secom_search_filter import SecomSearchFilter
 from app.model.secom.v2.secom_search_parameters import SecomSearchParameters
 from app.model.secom.v2.secom_search_result import SecomSearchResult
-from app.model.test_data import TestData
+from app.model.secom.v2.secom_service_instance import ServiceInstance
+from app.model.test_data import ProfileMode, ResponseMode, TestData, schema_version_path
 from app.model.test_result import TestResult
 from app.model.test_results import TestResults
+from app.services.blob_store import BlobStore
+from app.services.http_client_pool import HttpClientPool
+from app.services.httpx_openapi import HttpxOpenAPIRequest, HttpxOpenAPIResponse
+from app.services.item_validation import ItemValidation
+from app.services.json_stream import JsonArrayStream
+from app.services.msr_response import MsrResponse
+from app.services.openapi_registry import OpenApiRegistry
+from app.services.phase_timings import collect_timings, phase
+from app.services.profiling import RunProfile, span, traced
 from app.services.pki_services import PKIServices
+from app.services.result_store import ResultStore
+from app.services.test_metrics import TestMetrics
+from app.test_scripts.result_poller import ResultPoller
+from app.test_scripts.test_scheduler import TestNode, TestScheduler
 
 
 class MsrOpenApiValidator:
@@ -27,57 +49,101 @@ class MsrOpenApiValidator:
     }
 
     timeout : int = 5
+    stream_chunk_size : int = 65536
+    api_path : str
+    api_paths : list[str]
     open_api : OpenAPI
     url : str
+    search_service_url : str
+    retrieve_results_url : str
+    max_concurrency : int
+    poll_schedule : PollSchedule
+    stream_results : bool
+    result_store : ResultStore | None
+    blob_store : BlobStore | None
+    response_mode : ResponseMode
+    profiling : ProfileMode
 
     # Internal variables
     _pki_services : PKIServices
-
-    def __init__(self, test_data : TestData, api_path : str = "./app/schema/MSRv2.json"):
-        self.open_api = OpenAPI.from_file_path(api_path)
+    _client : httpx.AsyncClient
+    _anonymous_client : httpx.AsyncClient
+    _schema_verdicts : dict[str, dict[str, str]]
+
+    def __init__(self, test_data : TestData, api_path : str = "./app/schema/MSRv2.json",
+                 result_store : ResultStore | None = None, blob_store : BlobStore | None = None):
+        self.api_path = api_path
+        self.result_store = result_store
+        self.blob_store = blob_store
+        self.open_api = OpenApiRegistry.get(api_path)
         self.url = test_data.test_url
         if self.url[-1] != "/":
             self.url = self.url + "/"
 
+        self.search_service_url = self.url + "api/secom/v2/searchService"
+        self.retrieve_results_url = self.url + "api/secom/v2/retrieveResults"
+        self.max_concurrency = test_data.max_concurrency
+        self.poll_schedule = test_data.poll_schedule
+        self.stream_results = test_data.stream_results
+        self.response_mode = test_data.response_mode
+        self.profiling = test_data.profiling
+
+        # The responses are also validated against these schema versions
+        self.api_paths = [api_path]
+        for schema_version in test_data.schema_versions:
+            path = schema_version_path(schema_version)
+            if all(not Path(path).samefile(existing) for existing in self.api_paths):
+                self.api_paths.append(path)
+        self._schema_verdicts = {}
+
         self._pki_services = PKIServices(public_cert=test_data.certificate,
                                          private_cert=test_data.private_key,
                                          root_cert=test_data.root_certificate)
 
 
 
-    def run_search_test(self, url : str, data: str, test_title : str, expected_code : int = 200) -> TestResult:
+    @traced("run_search_test", "url", "test_title", "expected_code")
+    async def run_search_test(self, url : str, data: str, test_title : str, expected_code : int = 200,
+                              check : Callable[[ServiceInstance], str] | None = None) -> TestResult:
         """
         Query the MSR with the given data
         :param url: The URL to query
         :param data: Search filter data
         :param test_title: The title of the test
         :param expected_code: The expected HTTP status code
+        :param check: Called with each service instance found, returns a failure reason or an empty string
         :return: the result and either the search result or the exceptions
         """
-        resp = requests.post(url,
-                             cert=self._pki_services.get_client_certificate(),
-                             data=data,
-                             headers=self.headers,
-                             timeout=self.timeout)
+        if self.stream_results and expected_code == 200:
+            return await self.run_streaming_test("POST", url, test_title, check, content=data)
+
+        resp = MsrResponse(await self._client.post(url,
+                                                   content=data,
+                                                   headers=self.headers,
+                                                   timeout=self.timeout))
 
         if resp.status_code != expected_code:
             return TestResult(test_name=test_title,
                               test_success=False,
-                              full_response=resp.json() ,
+                              full_response=resp.to_full_response(),
                               failure_reason=f"Expected status code {expected_code}, got {resp.status_code}")
 
-        # Wrap the request objects with adapters
-        openapi_request = RequestsOpenAPIRequest(resp.request)
-        openapi_response = RequestsOpenAPIResponse(resp)
-
         try:
-            # Validate + unmarshal the response against the request
-            # self.open_api.validate_request(openapi_request)
-            self.open_api.validate_response(openapi_request, openapi_response)
+            failure_reason = self.format_item_errors(await self.validate_search_result(resp, test_title))
+            full_response = resp.to_full_response()
+
+            if check is not None and not failure_reason:
+                with phase("model_build"):
+                    service_instances = SecomSearchResult(full_response).service_instance
+                for service_instance in service_instances:
+                    failure_reason = check(service_instance)
+                    if failure_reason:
+                        break
+
             return TestResult(test_name=test_title,
-                              test_success=True,
-                              full_response=resp.json(),
-                              failure_reason="")
+                              test_success=failure_reason == "",
+                              full_response=full_response,
+                              failure_reason=failure_reason)
 
         except Exception as e:
             return TestResult(test_name=test_title,
@@ -86,7 +152,231 @@ class MsrOpenApiValidator:
                               failure_reason=str(e))
 
 
-    def run_unauthorised_search_test(self, url : str, data : str, test_title : str, expected_code : int) -> TestResult:
+    @traced("run_streaming_test", "method", "url", "test_title")
+    async def run_streaming_test(self, method : str, url : str, test_title : str,
+                                 check : Callable[[ServiceInstance], str] | None = None,
+                                 content : str | None = None) -> TestResult:
+        """
+        Query the MSR and read the search result in chunks. Each service instance is
+        handed to the item validation and checked as soon as it is decoded, then
+        dropped, so memory is bounded by one chunk of instances rather than the result
+        set. The rest of the document is validated once at the end. Only the first service
+        instance is kept in the stored response, next to the number of instances read.
+        :param method: The HTTP method
+        :param url: The URL to query
+        :param test_title: The title of the test
+        :param check: Called with each service instance found, returns a failure reason or an empty string
+        :param content: The request body
+        :return: the result and either the search result summary or the exceptions
+        """
+        stream = JsonArrayStream("serviceInstance")
+        validations = self._new_item_validations()
+        first_instance = None
+        failure_reason = ""
+
+        def consume(items : list[Any]) -> str:
+            nonlocal first_instance
+            if first_instance is None and items:
+                first_instance = items[0]
+
+            self._submit_items(validations, items)
+            if check is not None:
+                for item in items:
+                    with phase("model_build"):
+                        service_instance = ServiceInstance(item)
+                    reason = check(service_instance)
+                    if reason:
+                        return reason
+            return ""
+
+        def summary() -> dict:
+            if not stream.streamed:
+                return stream.envelope
+            return stream.envelope | { "serviceInstance" : [first_instance] if first_instance is not None else [],
+                                       "serviceInstanceCount" : stream.count }
+
+        try:
+            async with self._client.stream(method, url,
+                                           content=content,
+                                           headers=self.headers,
+                                           timeout=self.timeout) as raw:
+                if raw.status_code != 200:
+                    await raw.aread()
+                    return TestResult(test_name=test_title,
+                                      test_success=False,
+                                      full_response=MsrResponse(raw).to_full_response(),
+                                      failure_reason=f"Expected status code 200, got {raw.status_code}")
+
+                async for chunk in raw.aiter_bytes(self.stream_chunk_size):
+                    with phase("json_decode"):
+                        items = stream.feed(chunk)
+                    failure_reason = consume(items)
+                    if failure_reason:
+                        break
+
+                if not failure_reason:
+                    with phase("json_decode"):
+                        items = stream.close()
+                    failure_reason = consume(items)
+
+            if not failure_reason:
+                # Validate the document once with the streamed instances left out. Without
+                # a serviceInstance array the envelope is validated as received, as in
+                # buffered mode, so a missing or malformed member is still rejected
+                decoded = stream.envelope | { "serviceInstance" : [] } if stream.streamed else stream.envelope
+                document = MsrResponse(raw, decoded=decoded)
+                failure_reason = self.format_item_errors(await self.validate_schemas(test_title, document, validations))
+
+            return TestResult(test_name=test_title,
+                              test_success=failure_reason == "",
+                              full_response=summary(),
+                              failure_reason=failure_reason)
+
+        except Exception as e:
+            return TestResult(test_name=test_title,
+                              test_success=False,
+                              full_response=summary(),
+                              failure_reason=str(e))
+
+
+    async def validate_search_result(self, resp : MsrResponse, test_title : str) -> list[tuple[int, str]]:
+        """
+        Validate a response against the schema. When the body is a search result the
+        document is validated once with serviceInstance emptied, and the service
+        instances are validated separately against ServiceInstanceObject, on the
+        worker pool for large result sets. Raises an OpenAPIError when the rest of
+        the document is invalid.
+        :param resp: The MSR response
+        :param test_title: The title of the test, used in the schema verdicts
+        :return: (index, message) for every invalid service instance
+        """
+        try:
+            body = resp.json()
+        except ValueError:
+            body = None
+
+        if not isinstance(body, dict) or not isinstance(body.get("serviceInstance"), list):
+            return await self.validate_schemas(test_title, resp)
+
+        validations = self._new_item_validations()
+        self._submit_items(validations, body["serviceInstance"])
+
+        document = MsrResponse(resp.response, decoded=body | { "serviceInstance" : [] })
+        return await self.validate_schemas(test_title, document, validations)
+
+
+    async def validate_schemas(self, test_title : str, document : MsrResponse,
+                               validations : dict[str, ItemValidation] | None = None) -> list[tuple[int, str]]:
+        """
+        Validate a response against every schema version and record a verdict for each.
+        The decoded body and the request adapter are shared between the versions.
+        Raises the OpenAPIError of the primary schema when the document is invalid.
+        :param test_title: The title of the test
+        :param document: The response, with the service instances left out when validations are given
+        :param validations: The item validations the service instances were submitted to, by schema path
+        :return: (index, message) for every service instance the primary schema rejects
+        """
+        with phase("schema_validate"):
+            openapi_request = HttpxOpenAPIRequest(document.request)
+            openapi_response = HttpxOpenAPIResponse(document)
+
+            item_errors : dict[int, list[tuple[int, str]]] = {}
+            primary_error = None
+            primary_item_errors = []
+
+            for api_path in self.api_paths:
+                failure_reason = ""
+                try:
+                    with span("open_api.validate_response", schema_version=Path(api_path).stem, test_title=test_title):
+                        OpenApiRegistry.get(api_path).validate_response(openapi_request, openapi_response)
+                except OpenAPIError as e:
+                    failure_reason = str(e)
+                    if api_path == self.api_path:
+                        primary_error = e
+
+                errors = []
+                if validations is not None:
+                    validation = validations[api_path]
+                    if id(validation) not in item_errors:
+                        item_errors[id(validation)] = await validation.errors()
+                    errors = item_errors[id(validation)]
+
+                if api_path == self.api_path:
+                    primary_item_errors = errors
+                self._schema_verdicts.setdefault(api_path, {})[test_title] = failure_reason or self.format_item_errors(errors)
+
+        if primary_error is not None:
+            raise primary_error
+
+        return primary_item_errors
+
+
+    def _new_item_validations(self) -> dict[str, ItemValidation]:
+        """
+        Create the item validations for a search result, one per schema version. Versions
+        that define ServiceInstanceObject identically share one, so each service instance
+        is validated once per distinct definition.
+        :return: the item validations by schema path
+        """
+        shared : dict[str, ItemValidation] = {}
+        validations = {}
+        for api_path in self.api_paths:
+            fingerprint = OpenApiRegistry.get_schema_fingerprint(api_path, "ServiceInstanceObject")
+            if fingerprint not in shared:
+                shared[fingerprint] = ItemValidation(api_path, "ServiceInstanceObject")
+            validations[api_path] = shared[fingerprint]
+        return validations
+
+
+    @staticmethod
+    def _submit_items(validations : dict[str, ItemValidation], items : list[Any]) -> None:
+        """
+        Submit service instances to each distinct item validation
+        :param validations: The item validations by schema path
+        :param items: The decoded service instances
+        """
+        with phase("schema_validate"):
+            for validation in { id(validation) : validation for validation in validations.values() }.values():
+                validation.submit(items)
+
+
+    def get_schema_verdicts(self, test_names : list[str]) -> list[SchemaVerdict]:
+        """
+        Build the verdict matrix of the responses validated so far
+        :param test_names: The tests in the order to report them
+        :return: a verdict per schema version
+        """
+        schema_verdicts = []
+        for api_path in self.api_paths:
+            failure_reasons = self._schema_verdicts.get(api_path, {})
+            validated = [test_name for test_name in test_names if test_name in failure_reasons]
+            schema_verdicts.append(SchemaVerdict(
+                schema_version=Path(api_path).stem,
+                conforms=all(failure_reasons[test_name] == "" for test_name in validated),
+                verdicts={ test_name : failure_reasons[test_name] == "" for test_name in validated },
+                failure_reasons={ test_name : failure_reasons[test_name]
+                                  for test_name in validated if failure_reasons[test_name] }))
+        return schema_verdicts
+
+
+    @staticmethod
+    def format_item_errors(errors : list[tuple[int, str]]) -> str:
+        """
+        Format the service instance errors as a failure reason
+        :param errors: (index, message) for every error
+        :return: one line per error, or an empty string
+        """
+        if not errors:
+            return ""
+
+        invalid = len({index for index, _ in errors})
+        lines = [f"{invalid} service instance(s) failed schema validation"]
+        lines.extend(f"serviceInstance[{index}]: {message}" for index, message in errors)
+        return "\n".join(lines)
+
+
+    @traced("run_unauthorised_search_test", "url", "test_title", "expected_code")
+    async def run_unauthorised_search_test(self, url : str, data : str, test_title : str, expected_code : int) -> TestResult:
         """
         Try a valid query without a certificate
         :param url: The URL to query
@@ -95,24 +385,25 @@ class MsrOpenApiValidator:
         :param expected_code: The expected HTTP status code
         :return: the result and either the search result or failure text
         """
+        resp = None
         try:
-            resp = requests.post(url,
-                                 data=data,
-                                 headers=self.headers,
-                                 timeout=self.timeout)
+            resp = MsrResponse(await self._anonymous_client.post(url,
+                                                                 content=data,
+                                                                 headers=self.headers,
+                                                                 timeout=self.timeout))
 
             if resp.status_code != expected_code:
                 return TestResult(test_name=test_title,
                                   test_success=False,
-                                  full_response=resp.json(),
+                                  full_response=resp.to_full_response(),
                                   failure_reason=f"Expected status code {expected_code}, got {resp.status_code}")
             else:
                 return TestResult(test_name=test_title,
                                   test_success=resp.status_code == expected_code,
-                                  full_response=resp.json(),
+                                  full_response=resp.to_full_response(),
                                   failure_reason="")
 
-        except RequestException as e:
+        except httpx.HTTPError as e:
             if resp is not None:
                 return TestResult(test_name=test_title,
                                   test_success=resp.status_code == expected_code,
@@ -124,7 +415,8 @@ class MsrOpenApiValidator:
                                   full_response={ "serverResponse" :  "" },
                                   failure_reason=str(e))
 
-    def run_retrieve_test(self, url : str, transaction_id: str, test_title : str, expected_code : int = 200) -> TestResult:
+    @traced("run_retrieve_test", "url", "transaction_id", "test_title", "expected_code")
+    async def run_retrieve_test(self, url : str, transaction_id: str, test_title : str, expected_code : int = 200) -> TestResult:
         """
         Try a retrieve result request with the given transaction id and check the response code
         :param url: the url of the retrieve service
@@ -133,11 +425,14 @@ class MsrOpenApiValidator:
         :param expected_code: the expected response code
         :return: the result and either the search result or failure text
         """
+        if self.stream_results and expected_code == 200:
+            return await self.run_streaming_test("GET", url + f"/{transaction_id}", test_title)
+
+        resp = None
         try:
-            resp = requests.get(url + f"/{transaction_id}",
-                                cert=self._pki_services.get_client_certificate(),
-                                headers=self.headers,
-                                timeout=self.timeout)
+            resp = MsrResponse(await self._client.get(url + f"/{transaction_id}",
+                                                      headers=self.headers,
+                                                      timeout=self.timeout))
 
             if resp.status_code != expected_code:
                 return TestResult(test_name=test_title,
@@ -145,17 +440,11 @@ class MsrOpenApiValidator:
                                   full_response={ "serverResponse" :resp.text },
                                   failure_reason=f"Expected status code {expected_code}, got {resp.status_code}")
 
-            # Wrap the request objects with adapters
-            openapi_request = RequestsOpenAPIRequest(resp.request)
-            openapi_response = RequestsOpenAPIResponse(resp)
-
-            # Validate + unmarshal the response against the request
-            # self.open_api.validate_request(openapi_request)
-            self.open_api.validate_response(openapi_request, openapi_response)
+            failure_reason = self.format_item_errors(await self.validate_search_result(resp, test_title))
             return TestResult(test_name=test_title,
-                              test_success=True,
-                              full_response=resp.json(),
-                              failure_reason="")
+                              test_success=failure_reason == "",
+                              full_response=resp.to_full_response(),
+                              failure_reason=failure_reason)
 
         except Exception as e:
             return TestResult(test_name=test_title,
@@ -164,240 +453,428 @@ class MsrOpenApiValidator:
                               failure_reason=str(e))
 
 
-    def validate_msr(self):
+    def validate_msr(self) -> TestResults:
         """
-        Validate the MSR with test queries
+        Validate the MSR with test queries, blocking until every test has run
         :return: the test results
         """
-        test_results: TestResults = TestResults()
+        async def run() -> TestResults:
+            try:
+                return await self.validate_msr_async()
+            finally:
+                await HttpClientPool.aclose()
+
+        return asyncio.run(run())
 
-        search_filter = self.get_new_search_filter()
 
-        search_service_url = self.url + "api/secom/v2/searchService"
-        retrieve_results_url = self.url + "api/secom/v2/retrieveResults"
+    async def validate_msr_async(self,
+                                 on_result : Callable[[TestResult], Awaitable[None] | None] | None = None) -> TestResults:
+        """
+        Validate the MSR with test queries without blocking the event loop. The
+        connections to the MSR are pooled and kept alive for later runs. The results
+        are added to the result store, if there is one. When profiling is asked for,
+        the trace spans and profile of the run are written and reported in the results.
+        :param on_result: Called with each test result as soon as its test finishes
+        :return: the test results
+        """
+        started_at = time.time()
+        start = time.perf_counter()
+        profile = RunProfile(self.profiling, "validate_msr", test_url=self.url) if self.profiling != "off" else None
+        try:
+            with profile or nullcontext():
+                async with AsyncExitStack() as clients:
+                    self._client = await clients.enter_async_context(
+                        HttpClientPool.lease(self.url,
+                                             self._pki_services.get_client_certificate(),
+                                             self._pki_services.client_credentials_fingerprint))
+                    self._anonymous_client = await clients.enter_async_context(HttpClientPool.lease(self.url))
+                    test_results = await self._run_tests(on_result)
+        finally:
+            self._pki_services.cleanup()
+
+        if profile is not None:
+            test_results.profile = await asyncio.to_thread(profile.write)
+
+        if self.result_store is not None:
+            try:
+                await asyncio.to_thread(self.result_store.record, self.url,
+                                        self._pki_services.client_certificate_fingerprint,
+                                        OpenApiRegistry.get_content_hash(self.api_path), started_at,
+                                        time.perf_counter() - start, test_results)
+            except sqlite3.Error:
+                logging.exception("Could not record the results for %s", self.url)
 
-        search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
+        return test_results
+
+
+    async def sign_search_filter(self, search_filter : SecomSearchFilter) -> None:
+        """
+        Sign the envelope of the search filter off the event loop
+        :param search_filter: The search filter to sign
+        :return: None
+        """
+        with phase("sign"):
+            search_filter.envelope, signature = await asyncio.to_thread(self._pki_services.sign_envelope_object,
+                                                                        search_filter.envelope)
         search_filter.envelope_signature = signature
 
-        # Test an empty search
-        result = self.run_search_test(search_service_url,
-                                                 json.dumps(search_filter.to_secom_dict()),
-                                                 "Test empty search")
 
-        test_results.results.append(result)
+    async def _run_tests(self,
+                         on_result : Callable[[TestResult], Awaitable[None] | None] | None = None) -> TestResults:
+        """
+        Run the test queries against the MSR. Every test after the empty search needs
+        the service instance it returns, the retrieve tests also need the global search;
+        everything else is independent and runs concurrently.
+        :param on_result: Called with each test result as soon as its test finishes
+        :return: the test results
+        """
+        def has_service_instance(context : dict[str, Any]) -> bool:
+            return context.get("service_instance") is not None
+
+        scheduler = TestScheduler(self.max_concurrency)
+        scheduler.add(TestNode("empty_search", self._test_empty_search))
+
+        for name, run in [("instance_id_search", self._test_instance_id_search),
+                          ("status_search", self._test_status_search),
+                          ("geometry_search", self._test_geometry_search),
+                          ("bad_signature", self._test_bad_signature),
+                          ("unauthorised_search", self._test_unauthorised_search),
+                          ("invalid_status", self._test_invalid_status),
+                          ("no_results", self._test_no_results),
+                          ("imo_only", self._test_imo_only),
+                          ("mmsi_only", self._test_mmsi_only),
+                          ("global_search", self._test_global_search)]:
+            scheduler.add(TestNode(name, run, ("empty_search",), has_service_instance))
+
+        scheduler.add(TestNode("retrieve_results", self._test_retrieve_results, ("global_search",), streaming=True))
+        scheduler.add(TestNode("random_transaction_id", self._test_random_transaction_id,
+                               ("empty_search",), has_service_instance))
+
+        async def finish_result(result : TestResult) -> None:
+            TestMetrics.observe(result)
+            await self.store_response(result)
+            if on_result is not None:
+                outcome = on_result(result)
+                if inspect.isawaitable(outcome):
+                    await outcome
+
+        self._schema_verdicts = {}
+        test_results: TestResults = TestResults()
+        test_results.results = await scheduler.run({}, finish_result)
+
+        if len(self.api_paths) > 1:
+            test_results.schema_verdicts = self.get_schema_verdicts([result.test_name for result in test_results.results])
+
+        return test_results
+
+
+    async def _test_empty_search(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test an empty search and publish the first service instance found
+        """
+        search_filter = self.get_new_search_filter()
+
+        await self.sign_search_filter(search_filter)
+
+        # Test an empty search
+        result = await self.run_search_test(self.search_service_url,
+                                            json.dumps(search_filter.to_secom_dict()),
+                                            "Test empty search")
 
         if result.test_success:
-            search_result = SecomSearchResult(result.full_response)
+            with phase("model_build"):
+                search_result = SecomSearchResult(result.full_response)
 
-            # If there is a service instance returned, test searching for it by name
+            # If there is a service instance returned, the remaining tests search for it
             if search_result is not None and len(search_result.service_instance) > 0:
+                context["service_instance"] = search_result.service_instance[0]
 
-                service_instance = search_result.service_instance[0]
+        return [result]
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.query.instance_id = service_instance.instance_id
 
-                # Sign the envelope
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+    async def _test_instance_id_search(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test searching for the service instance by instance ID
+        """
+        service_instance = context["service_instance"]
 
-                test_name = f"Search for {search_result.service_instance[0].name} by instance ID: {search_result.service_instance[0].instance_id}"
-                instant_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name)
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.query.instance_id = service_instance.instance_id
 
-                # Check every result contains the name
-                if instant_result.test_success:
-                    search_result = SecomSearchResult(instant_result.full_response)
-                    for result in search_result.service_instance:
-                        if service_instance.instance_id not in result.instance_id:
-                            instant_result.test_success = False
-                            instant_result.failure_reason = f"Test failed: {result.instance_id} not found in {result.instance_id}"
-                            break
+        # Sign the envelope
+        await self.sign_search_filter(search_filter)
 
-                test_results.results.append(instant_result)
+        # Check every result contains the instance ID
+        def check(result : ServiceInstance) -> str:
+            if service_instance.instance_id not in result.instance_id:
+                return f"Test failed: {service_instance.instance_id} not found in {result.instance_id}"
+            return ""
 
-                # Test searching for a service instance by status
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.query.status = service_instance.status
+        test_name = f"Search for {service_instance.name} by instance ID: {service_instance.instance_id}"
+        instant_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name,
+                                                    check=check)
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+        return [instant_result]
 
-                test_name3 = f"Search for {service_instance.name} by status ({service_instance.status})"
-                status_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name3)
 
-                if status_result.test_success:
-                    search_result = SecomSearchResult(status_result.full_response)
-                    for result in search_result.service_instance:
-                        if result.status != service_instance.status:
-                            status_result.test_success = False
-                            status_result.failure_reason = f"Test failed: {result.status} not found in {search_result.service_instance}"
-                            break
+    async def _test_status_search(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test searching for a service instance by status
+        """
+        service_instance = context["service_instance"]
 
-                test_results.results.append(status_result)
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.query.status = service_instance.status
 
-                # Test searching for a service instance by geometry
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.geometry = service_instance.coverage_area[0]
+        await self.sign_search_filter(search_filter)
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+        # Check every result has the status searched for
+        def check(result : ServiceInstance) -> str:
+            if result.status != service_instance.status:
+                return f"Test failed: {result.instance_id} has status {result.status}, expected {service_instance.status}"
+            return ""
 
-                test_name = f"Search for {search_result.service_instance[0].name} by geometry"
-                geometry_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name)
+        test_name = f"Search for {service_instance.name} by status ({service_instance.status})"
+        status_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name,
+                                                   check=check)
 
-                test_results.results.append(geometry_result)
+        return [status_result]
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+    async def _test_geometry_search(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test searching for a service instance by geometry
+        """
+        service_instance = context["service_instance"]
 
-                # Test incorrect envelope signature results in a 400
-                test_name = "Test incorrect envelope signature generates a 400 response"
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.geometry = service_instance.coverage_area[0]
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
+        await self.sign_search_filter(search_filter)
 
-                # Generate the envelope signature
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+        test_name = f"Search for {service_instance.name} by geometry"
+        geometry_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name)
 
-                # Change the query so the signature is incorrect
-                search_filter.envelope.query.name = search_result.service_instance[0].name
+        return [geometry_result]
 
-                bad_signature_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 400)
 
-                test_results.results.append(bad_signature_result)
+    async def _test_bad_signature(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test incorrect envelope signature results in a 400
+        """
+        service_instance = context["service_instance"]
 
-                # Test unauthorised access to the search service
-                test_name = "Test unauthorised search generates a 401 response"
+        test_name = "Test incorrect envelope signature generates a 400 response"
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
-                unauth_result = self.run_unauthorised_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 401)
-                
-                test_results.results.append(unauth_result)
+        # Generate the envelope signature
+        await self.sign_search_filter(search_filter)
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
+        # Change the query so the signature is incorrect
+        search_filter.envelope.query.name = service_instance.name
 
-                # Test invalid status search result in a 400
-                test_name = "Test invalid status search generates a 400 response"
-                search_filter.envelope.query.status = "!!INVALID!!"
+        bad_signature_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 400)
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+        return [bad_signature_result]
 
-                invalid_search_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 400)
 
-                test_results.results.append(invalid_search_result)
+    async def _test_unauthorised_search(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test unauthorised access to the search service
+        """
+        test_name = "Test unauthorised search generates a 401 response"
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
 
-                # Test 404 is returned when no results are found
-                test_name = "Test no results found generates a 404 response"
+        await self.sign_search_filter(search_filter)
+        unauth_result = await self.run_unauthorised_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 401)
 
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.query.name = "INVALID SERVICE NAME - SHOULD NOT BE FOUND"
+        return [unauth_result]
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
 
-                empty_search_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 404)
+    async def _test_invalid_status(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test invalid status search result in a 400
+        """
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
 
-                test_results.results.append(empty_search_result)
+        test_name = "Test invalid status search generates a 400 response"
+        search_filter.envelope.query.status = "!!INVALID!!"
 
-                # Reset the search filter
-                # Test searching for a service instance by imo number alone results in a 400
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.query.imo = "9999999"
+        await self.sign_search_filter(search_filter)
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+        invalid_search_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 400)
 
-                test_name = "Test search by imo number alone results in a 400 response"
-                imo_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 400)
-                test_results.results.append(imo_result)
+        return [invalid_search_result]
 
-                # Reset the search filter
-                # Test searching for a service instance by mmsi number alone results in a 400
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.query.mmsi = "999999999"
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+    async def _test_no_results(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test 404 is returned when no results are found
+        """
+        test_name = "Test no results found generates a 404 response"
 
-                test_name = "Test search by mmsi number alone results in a 400 response"
-                mmsi_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()),
-                                                  test_name, 400)
-                test_results.results.append(mmsi_result)
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.query.name = "INVALID SERVICE NAME - SHOULD NOT BE FOUND"
 
-                # Start a global search
-                # Reset the search filter
-                search_filter = self.get_new_search_filter()
-                search_filter.envelope.local_only = False
+        await self.sign_search_filter(search_filter)
 
-                search_filter.envelope, signature = self._pki_services.sign_envelope_object(search_filter.envelope)
-                search_filter.envelope_signature = signature
+        empty_search_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 404)
 
-                test_name = "Test a global search"
+        return [empty_search_result]
 
-                global_search_test_result = self.run_search_test(search_service_url, json.dumps(search_filter.to_secom_dict()), test_name)
 
-                test_results.results.append(global_search_test_result)
+    async def _test_imo_only(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test searching for a service instance by imo number alone results in a 400
+        """
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.query.imo = "9999999"
 
-                global_search_result = SecomSearchResult(global_search_test_result.full_response)
+        await self.sign_search_filter(search_filter)
 
-                test_name = f"Wait 3 seconds then retrieve results for transaction id"
-                if global_search_result is not None and len(global_search_result.service_instance) > 0 and \
-                    hasattr(global_search_result.service_instance[0], "transaction_id"):
-                    transaction_id = global_search_result.service_instance[0].transaction_id
-                    test_name = test_name + f": {transaction_id}"
+        test_name = "Test search by imo number alone results in a 400 response"
+        imo_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name, 400)
 
-                    # First attempt to retrieve the result
-                    sleep(3)
-                    retrieve_result_3s = self.run_retrieve_test(retrieve_results_url, str(transaction_id), test_name, 200)
-                    test_results.results.append(retrieve_result_3s)
+        return [imo_result]
 
-                    # Second attempt to retrieve the result
-                    sleep(3)
-                    test_name = f"Wait 6 seconds then retrieve results for transaction id: {transaction_id}"
-                    retrieve_result_6s = self.run_retrieve_test(retrieve_results_url, str(transaction_id), test_name, 200)
-                    test_results.results.append(retrieve_result_6s)
 
-                    # Final attempt to retrieve the result
-                    sleep(4)
-                    test_name = f"Wait 10 seconds then retrieve results for transaction id: {transaction_id}"
-                    retrieve_result_10s = self.run_retrieve_test(retrieve_results_url, str(transaction_id), test_name, 200)
-                    test_results.results.append(retrieve_result_10s)
+    async def _test_mmsi_only(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test searching for a service instance by mmsi number alone results in a 400
+        """
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.query.mmsi = "999999999"
 
-                else:
-                    retrieve_result_3s = TestResult(
-                        test_name=test_name,
-                        test_success=False,
-                        full_response={ "test_skipped" : "No transaction id found in global search result" },
-                        failure_reason="No transaction id found in global search result"
-                    )
-                    test_results.results.append(retrieve_result_3s)
+        await self.sign_search_filter(search_filter)
 
-                test_name = "Test retrieve results for random transaction id generates a 404 response"
-                uuid = uuid4()
-                invalid_transation_id_result = self.run_retrieve_test(retrieve_results_url, str(uuid), test_name, 404)
+        test_name = "Test search by mmsi number alone results in a 400 response"
+        mmsi_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()),
+                                                 test_name, 400)
 
-                test_results.results.append(invalid_transation_id_result)
+        return [mmsi_result]
 
-        self._pki_services.cleanup()
 
-        return test_results
+    async def _test_global_search(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Start a global search and publish its result for the retrieve tests
+        """
+        # Reset the search filter
+        search_filter = self.get_new_search_filter()
+        search_filter.envelope.local_only = False
+
+        await self.sign_search_filter(search_filter)
+
+        test_name = "Test a global search"
+
+        global_search_test_result = await self.run_search_test(self.search_service_url, json.dumps(search_filter.to_secom_dict()), test_name)
+
+        if global_search_test_result.test_success:
+            with phase("model_build"):
+                context["global_search_result"] = SecomSearchResult(global_search_test_result.full_response)
+
+        return [global_search_test_result]
+
+
+    async def _test_retrieve_results(self, context : dict[str, Any],
+                                     emit : Callable[[TestResult], Awaitable[None]]) -> list[TestResult]:
+        """
+        Retrieve the results of the global search following the poll schedule,
+        emitting each attempt as soon as it finishes
+        """
+        results : list[TestResult] = []
+        global_search_result = context.get("global_search_result")
+
+        if global_search_result is not None and len(global_search_result.service_instance) > 0 and \
+            hasattr(global_search_result.service_instance[0], "transaction_id"):
+            transaction_id = global_search_result.service_instance[0].transaction_id
+
+            async def retrieve(offset : float) -> TestResult:
+                test_name = f"Wait {offset:g} seconds then retrieve results for transaction id: {transaction_id}"
+                # Time the request alone rather than the wait for the poll schedule
+                start = time.perf_counter()
+                with collect_timings() as timings:
+                    result = await self.run_retrieve_test(self.retrieve_results_url, str(transaction_id), test_name, 200)
+                result.elapsed = time.perf_counter() - start
+                result.timings = dict(timings.phases)
+                return result
+
+            results.extend(await ResultPoller(self.poll_schedule).poll(retrieve, emit))
+
+        else:
+            delays = self.poll_schedule.get_delays()
+            first_offset = delays[0] if delays else 0
+            skipped_result = TestResult(
+                test_name=f"Wait {first_offset:g} seconds then retrieve results for transaction id",
+                test_success=False,
+                full_response={ "test_skipped" : "No transaction id found in global search result" },
+                failure_reason="No transaction id found in global search result"
+            )
+            results.append(skipped_result)
+
+        return results
+
+
+    async def _test_random_transaction_id(self, context : dict[str, Any]) -> list[TestResult]:
+        """
+        Test retrieving an unknown transaction id results in a 404
+        """
+        test_name = "Test retrieve results for random transaction id generates a 404 response"
+        uuid = uuid4()
+        invalid_transation_id_result = await self.run_retrieve_test(self.retrieve_results_url, str(uuid), test_name, 404)
+
+        return [invalid_transation_id_result]
+
+    async def store_response(self, result : TestResult) -> None:
+        """
+        Keep the response of a finished test in the blob store, if there is one, then
+        cut it down as the response mode asks so the results hold only what is returned
+        :param result: The test result
+        :return: None
+        """
+        if self.blob_store is not None and result.full_response:
+            result.response_ref = await asyncio.to_thread(self.blob_store.put, result.full_response)
+
+        if self.response_mode == "omit":
+            result.full_response = {}
+        elif self.response_mode == "truncate":
+            result.full_response = self.truncate_response(result.full_response)
+
+    @staticmethod
+    def truncate_response(value : Any, max_items : int = 1, max_length : int = 256) -> Any:
+        """
+        Shorten a response. Longer lists keep their first items and gain a count
+        alongside, like the summaries of streamed results, and long strings are cut.
+        :param value: The response, or part of it
+        :param max_items: The number of items kept of each list
+        :param max_length: The number of characters kept of each string
+        :return: the shortened response
+        """
+        if isinstance(value, dict):
+            truncated = {}
+            for key, member in value.items():
+                truncated[key] = MsrOpenApiValidator.truncate_response(member, max_items, max_length)
+                if isinstance(member, list) and len(member) > max_items and f"{key}Count" not in value:
+                    truncated[f"{key}Count"] = len(member)
+            return truncated
+
+        if isinstance(value, list):
+            return [MsrOpenApiValidator.truncate_response(item, max_items, max_length) for item in value[:max_items]]
+
+        if isinstance(value, str) and len(value) > max_length:
+            return value[:max_length] + "..."
+
+        return value
 
     @staticmethod
     def get_new_search_filter():
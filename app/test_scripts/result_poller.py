@@ -0,0 +1,65 @@
+"""
+    Poll the MSR for the results of a global search
+"""
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from app.model.poll_schedule import PollSchedule
+from app.model.test_result import TestResult
+
+
+class ResultPoller:
+    """
+        Runs the retrieve attempts at fixed offsets from the start of polling.
+        Waiting is done with event loop timers so no thread is held between attempts.
+    """
+
+    schedule : PollSchedule
+
+    def __init__(self, schedule : PollSchedule) -> None:
+        self.schedule = schedule
+
+    async def poll(self, attempt : Callable[[float], Awaitable[TestResult]],
+                   on_result : Callable[[TestResult], Awaitable[None]] | None = None) -> list[TestResult]:
+        """
+        Run the attempts in the schedule
+        :param attempt: Called with the scheduled offset in seconds, returns the attempt's result
+        :param on_result: Awaited with each attempt's result before waiting for the next attempt
+        :return: the result of every attempt that was made
+        """
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        offset = 0.0
+        results : list[TestResult] = []
+        # The responses as they were returned, on_result may cut down those of the results
+        responses : list[tuple[bool, Any]] = []
+
+        for delay in self.schedule.get_delays():
+            offset += delay
+
+            # Sleep until the scheduled offset so slow responses do not push later attempts back
+            await asyncio.sleep(max(0.0, start + offset - loop.time()))
+            result = await attempt(offset)
+            results.append(result)
+            responses.append((result.test_success, result.full_response))
+            if on_result is not None:
+                await on_result(result)
+
+            if self.schedule.stop_when_stable and self._is_stable(responses):
+                break
+
+        return results
+
+    @staticmethod
+    def _is_stable(responses : list[tuple[bool, Any]]) -> bool:
+        """
+        Check if the last two attempts succeeded with the same response
+        :param responses: Whether each attempt made so far succeeded, and its response
+        :return: True if the results have stopped changing
+        """
+        if len(responses) < 2:
+            return False
+
+        (previous_success, previous), (latest_success, latest) = responses[-2], responses[-1]
+        return previous_success and latest_success and previous == latest
@@ -0,0 +1,132 @@
+"""
+    Run MSR tests as a dependency graph
+"""
+import asyncio
+import inspect
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from app.model.test_result import TestResult
+from app.services.phase_timings import collect_timings
+from app.services.profiling import span
+
+
+@dataclass
+class TestNode:
+    """
+        A single test in the graph. The run function receives the shared context,
+        may publish values into it for its dependants and returns its test results.
+        The guard is checked once the dependencies have finished; when it returns
+        False the node and everything depending on it is skipped. A streaming node's
+        run function also receives an emit coroutine function to send each result
+        as soon as it is ready, for tests that make several requests over time.
+    """
+
+    name : str
+    run : Callable[..., Awaitable[list[TestResult]]]
+    depends_on : tuple[str, ...] = ()
+    guard : Callable[[dict[str, Any]], bool] | None = None
+    streaming : bool = False
+
+
+class TestScheduler:
+    """
+        Runs each test as soon as its dependencies have finished, with at most
+        max_concurrency tests in flight against the target at any time. Results are
+        tagged with the name of their test node, and those without a timing of
+        their own get the run time of their test and the phases timed during it.
+    """
+
+    max_concurrency : int
+
+    _nodes : dict[str, TestNode]
+
+    def __init__(self, max_concurrency : int = 4) -> None:
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+
+        self.max_concurrency = max_concurrency
+        self._nodes = {}
+
+    def add(self, node : TestNode) -> None:
+        """
+        Add a test to the graph. Dependencies must be added before the tests that
+        use them, which also rules out cycles.
+        :param node: The test to add
+        :return: None
+        """
+        if node.name in self._nodes:
+            raise ValueError(f"Duplicate test node: {node.name}")
+
+        for dependency in node.depends_on:
+            if dependency not in self._nodes:
+                raise ValueError(f"Test node {node.name} depends on unknown node {dependency}")
+
+        self._nodes[node.name] = node
+
+    async def run(self, context : dict[str, Any] | None = None,
+                  on_result : Callable[[TestResult], Awaitable[None] | None] | None = None) -> list[TestResult]:
+        """
+        Run every test in the graph
+        :param context: Values shared between the tests
+        :param on_result: Called with each result as soon as its test finishes, or as soon as a streaming
+                          test emits it, may be a coroutine function
+        :return: the test results in the order the tests were added
+        """
+        context = context if context is not None else {}
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        results : dict[str, list[TestResult]] = {}
+        tasks : dict[str, asyncio.Task[bool]] = {}
+
+        async def execute(node : TestNode) -> bool:
+            dependencies_ran = await asyncio.gather(*(tasks[dependency] for dependency in node.depends_on))
+
+            if not all(dependencies_ran) or (node.guard is not None and not node.guard(context)):
+                return False
+
+            emitted : set[int] = set()
+
+            async def emit(result : TestResult) -> None:
+                # Streamed results are timed up to the moment they are sent
+                if result.elapsed is None:
+                    result.elapsed = time.perf_counter() - start
+                    result.timings = dict(timings.phases)
+                await send(result)
+
+            async def send(result : TestResult) -> None:
+                if id(result) in emitted:
+                    return
+                emitted.add(id(result))
+
+                if result.test_key is None:
+                    result.test_key = node.name
+
+                if on_result is not None:
+                    outcome = on_result(result)
+                    if inspect.isawaitable(outcome):
+                        await outcome
+
+            async with semaphore:
+                start = time.perf_counter()
+                with collect_timings() as timings, span(f"test {node.name}"):
+                    if node.streaming:
+                        results[node.name] = await node.run(context, emit)
+                    else:
+                        results[node.name] = await node.run(context)
+                elapsed = time.perf_counter() - start
+
+            for result in results[node.name]:
+                if result.elapsed is None:
+                    result.elapsed = elapsed
+                    result.timings = dict(timings.phases)
+                await send(result)
+
+            return True
+
+        async with asyncio.TaskGroup() as task_group:
+            for node in self._nodes.values():
+                tasks[node.name] = task_group.create_task(execute(node))
+
+        return [result for name in self._nodes for result in results.get(name, [])]
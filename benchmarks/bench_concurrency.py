@@ -0,0 +1,105 @@
+"""
+    Measure how concurrent endorsement runs scale on a single event loop
+
+    The retrieve results test waits --poll-delays between its polls; the default
+    schedule of an MSR endorsement would make every run take ten seconds, most of
+    it asleep, and hide how the event loop copes with the concurrent runs. Before
+    timing anything it checks that the first retrieve result is sent while the
+    later polls are still to be made.
+
+    Usage: python -m benchmarks.bench_concurrency [--latency 0.05] [--levels 1 2 4 8 16]
+                                                  [--poll-delays 0.1 0.1 0.1]
+"""
+import argparse
+import asyncio
+import logging
+import sys
+import time
+
+from app.model.poll_schedule import PollSchedule
+from app.model.test_data import TestData
+from app.model.test_result import TestResult
+from app.services.http_client_pool import HttpClientPool
+from app.test_scripts.msr_openapi_validator import MsrOpenApiValidator
+from benchmarks.certificates import generate_test_data_fields
+from benchmarks.stub_msr import StubMsr
+
+SCHEMA_PATH = "./app/schema/MSRv2-dodgy.json"
+
+
+async def run_concurrently(test_data : TestData, concurrency : int) -> tuple[float, dict[str, int]]:
+    """
+    Run several endorsements at once on the current event loop
+    :param test_data: The target and credentials for each run
+    :param concurrency: The number of runs to start together
+    :return: the wall clock time in seconds and the connection pool counters
+    """
+    validators = [MsrOpenApiValidator(test_data, SCHEMA_PATH) for _ in range(concurrency)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(validator.validate_msr_async() for validator in validators))
+    elapsed = time.perf_counter() - start
+
+    totals = {"requests" : 0, "connections" : 0}
+    for entry in HttpClientPool.stats().values():
+        totals["requests"] += entry["requests"]
+        totals["connections"] += entry["connections"]
+    await HttpClientPool.aclose()
+
+    return elapsed, totals
+
+
+async def check_streaming(test_data : TestData, stub : StubMsr) -> int:
+    """
+    Check that each retrieve result is sent as soon as its poll finishes rather than
+    after the last poll
+    :param test_data: The target and credentials, with a poll schedule of at least two polls
+    :param stub: The stub MSR the target points at
+    :return: the number of differences
+    """
+    polls_made : list[int] = []
+    start_count = stub.retrieve_count
+
+    def on_result(result : TestResult) -> None:
+        if result.test_key == "retrieve_results":
+            polls_made.append(stub.retrieve_count - start_count)
+
+    await MsrOpenApiValidator(test_data, SCHEMA_PATH).validate_msr_async(on_result=on_result)
+    await HttpClientPool.aclose()
+
+    if len(polls_made) < 2 or polls_made[0] != 1:
+        print(f"Retrieve results were sent after {polls_made} polls, expected the first after 1 poll")
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub MSR latency per request in seconds")
+    parser.add_argument("--result-size", type=int, default=5, help="Service instances per search result")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--poll-delays", type=float, nargs="+", default=[0.1, 0.1, 0.1],
+                        help="Seconds between the retrieve results polls")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    stub = StubMsr(latency=args.latency, result_size=args.result_size).start()
+    test_data = TestData(test_url=stub.url, poll_schedule=PollSchedule(delays=args.poll_delays),
+                         **generate_test_data_fields())
+
+    try:
+        if len(args.poll_delays) > 1 and asyncio.run(check_streaming(test_data, stub)):
+            sys.exit(1)
+
+        print(f"{'concurrency':>11} {'wall (s)':>10} {'runs/s':>8} {'requests':>9} {'connections':>12}")
+        for concurrency in args.levels:
+            elapsed, totals = asyncio.run(run_concurrently(test_data, concurrency))
+            print(f"{concurrency:>11} {elapsed:>10.2f} {concurrency / elapsed:>8.2f} "
+                  f"{totals['requests']:>9} {totals['connections']:>12}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
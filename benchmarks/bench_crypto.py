@@ -0,0 +1,115 @@
+"""
+    Compare sign and verify throughput of the crypto backends, then verify a
+    batch of signatures one at a time and with PKIServices.verify_data_signatures
+    on the worker pool. One signature in the batch is corrupted, and both ways
+    must reject exactly that one.
+
+    Usage: python -m benchmarks.bench_crypto [--iterations 200] [--batch 1000]
+"""
+import argparse
+import asyncio
+import time
+
+from cryptography.x509 import load_pem_x509_certificate
+
+from app.model.exceptions.signature_validation_exception import SignatureValidationException
+from app.services.crypto_backends import get_crypto_backend
+from app.services.pki_services import PKIServices
+from benchmarks.certificates import generate_test_credentials, generate_test_data_fields
+
+HASH_NAMES = ["sha3_384", "sha384"]
+BACKEND_NAMES = ["cryptography", "ecdsa"]
+
+
+def throughput(operation, iterations : int) -> float:
+    """
+    Run an operation repeatedly
+    :param operation: The operation to time
+    :param iterations: The number of times to run it
+    :return: the number of operations per second
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        operation()
+    return iterations / (time.perf_counter() - start)
+
+
+def verify_batch(credentials : dict[str, bytes], size : int) -> None:
+    """
+    Verify a batch of signed payloads one at a time and as a batch, and compare the verdicts
+    :param credentials: The test credentials, the client certificate signs the payloads
+    :param size: The number of payloads
+    """
+    fields = generate_test_data_fields(credentials)
+    pki_services = PKIServices(public_cert=fields["certificate"],
+                               private_cert=fields["private_key"],
+                               root_cert=fields["root_certificate"])
+    try:
+        payloads = [f"name.status.1.0.{index}.description".encode() for index in range(size)]
+        signatures = [pki_services.get_data_signature(payload) for payload in payloads]
+        signatures[size // 2] = signatures[size // 2 - 1]
+        certificates = [credentials["certificate"]]
+
+        def verify_one(payload : bytes, signature : str) -> bool:
+            try:
+                return pki_services.verify_ecdsa_384_sha3_data_signature(payload, certificates, signature)
+            except SignatureValidationException:
+                return False
+
+        start = time.perf_counter()
+        expected = [verify_one(payload, signature) for payload, signature in zip(payloads, signatures)]
+        sequential = time.perf_counter() - start
+
+        items = [(payload, certificates, signature, "ecdsa-384-sha3")
+                 for payload, signature in zip(payloads, signatures)]
+
+        async def verify_all() -> list[bool]:
+            # The first batch starts the worker processes, so it is not timed
+            await pki_services.verify_data_signatures(items)
+            start = time.perf_counter()
+            verdicts = await pki_services.verify_data_signatures(items)
+            print(f"{'batch':>13} {size / (time.perf_counter() - start):>10.0f} verify/s")
+            return verdicts
+
+        print(f"\n{'sequential':>13} {size / sequential:>10.0f} verify/s")
+        verdicts = asyncio.run(verify_all())
+        assert verdicts == expected, "The batch verdicts differ from the sequential ones"
+        assert verdicts.count(False) == 1, "Exactly the corrupted signature should be rejected"
+    finally:
+        pki_services.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=1000, help="The number of signatures verified as a batch")
+    args = parser.parse_args()
+
+    credentials = generate_test_credentials()
+    public_key = load_pem_x509_certificate(credentials["certificate"]).public_key()
+    payload = b"name.status.1.0.keyword.description.s124.spec.design.instance.mmsi.imo.type.unlocode.uri" * 4
+
+    print(f"{'backend':>13} {'hash':>9} {'sign/s':>10} {'verify/s':>10}")
+    for hash_name in HASH_NAMES:
+        for backend_name in BACKEND_NAMES:
+            backend = get_crypto_backend(backend_name)
+            signing_key = backend.load_signing_key(credentials["private_key"], hash_name)
+            verifying_key = backend.load_verifying_key(public_key)
+            signature = backend.sign(signing_key, payload, hash_name)
+
+            # Every backend must accept the signatures of every other backend
+            for other_name in BACKEND_NAMES:
+                other = get_crypto_backend(other_name)
+                assert other.verify(other.load_verifying_key(public_key), payload, signature, hash_name), \
+                    f"{other_name} rejected a {backend_name} signature"
+
+            sign_rate = throughput(lambda: backend.sign(signing_key, payload, hash_name), args.iterations)
+            verify_rate = throughput(lambda: backend.verify(verifying_key, payload, signature, hash_name),
+                                     args.iterations)
+            print(f"{backend_name:>13} {hash_name:>9} {sign_rate:>10.0f} {verify_rate:>10.0f}")
+
+    verify_batch(credentials, args.batch)
+
+
+if __name__ == "__main__":
+    main()
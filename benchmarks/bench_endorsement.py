@@ -0,0 +1,122 @@
+"""
+    End to end throughput and latency of validate_msr against a local MSR over mutual TLS
+
+    Starts the stub MSR in a child process with freshly generated ECDSA P-384
+    certificates and, at each concurrency level, keeps that many endorsement
+    runs going until --runs have finished. Reports the runs per second and the 50th and 99th percentile
+    latency of a run, with the share of tests that passed, so a stub configured
+    to fail shows up as failed tests rather than as faster runs. The retrieve
+    results test waits --poll-delays between its polls; the default schedule of
+    an MSR endorsement would make every run take ten seconds.
+
+    Usage: python -m benchmarks.bench_endorsement [--latency 0.02] [--result-size 5] [--error-rate 0]
+                                                  [--levels 1 2 4 8 16] [--runs 32] [--poll-delays 0.1 0.1 0.1]
+"""
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+from app.model.poll_schedule import PollSchedule
+from app.model.test_data import TestData
+from app.services.http_client_pool import HttpClientPool
+from app.test_scripts.msr_openapi_validator import MsrOpenApiValidator
+from benchmarks.certificates import generate_test_credentials, generate_test_data_fields
+from benchmarks.stub_msr import StubMsrProcess
+
+SCHEMA_PATH = "./app/schema/MSRv2-dodgy.json"
+
+
+def percentile(values : list[float], percent : int) -> float:
+    """
+    Return a percentile of the values
+    :param values: The values, at least one
+    :param percent: The percentile, from 1 to 99
+    :return: the value below which that percent of the values fall
+    """
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+async def run_level(test_data : TestData, concurrency : int, runs : int) -> dict[str, float]:
+    """
+    Run endorsements with a fixed number in flight, starting the next as soon as one finishes
+    :param test_data: The target and credentials for each run
+    :param concurrency: The number of runs in flight
+    :param runs: The number of runs to finish
+    :return: the wall clock time, the latencies and test counts, and the connection counters
+    """
+    latencies : list[float] = []
+    passed = 0
+    tests = 0
+    remaining = runs
+
+    async def worker() -> None:
+        nonlocal passed, tests, remaining
+        while remaining > 0:
+            remaining -= 1
+            validator = MsrOpenApiValidator(test_data, SCHEMA_PATH)
+            start = time.perf_counter()
+            test_results = await validator.validate_msr_async()
+            latencies.append(time.perf_counter() - start)
+            passed += sum(result.test_success for result in test_results.results)
+            tests += len(test_results.results)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, runs))))
+    elapsed = time.perf_counter() - start
+
+    handshakes = sum(entry["tls_handshakes"] for entry in HttpClientPool.stats().values())
+    await HttpClientPool.aclose()
+
+    return {
+        "elapsed" : elapsed,
+        "p50" : percentile(latencies, 50),
+        "p99" : percentile(latencies, 99),
+        "passed" : passed / tests if tests else 0.0,
+        "handshakes" : handshakes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=0.02, help="Stub MSR latency per request in seconds")
+    parser.add_argument("--result-size", type=int, default=5, help="Service instances per search result")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    parser.add_argument("--error-status", type=int, default=500, help="Status code of the failed requests")
+    parser.add_argument("--no-signature-check", action="store_true",
+                        help="Make the stub accept any envelope signature")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--runs", type=int, default=32, help="Runs to finish at each level")
+    parser.add_argument("--poll-delays", type=float, nargs="+", default=[0.1, 0.1, 0.1],
+                        help="Seconds between the retrieve results polls")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    credentials = generate_test_credentials()
+    stub = StubMsrProcess(latency=args.latency, result_size=args.result_size, credentials=credentials,
+                          error_rate=args.error_rate, error_status=args.error_status,
+                          check_signatures=not args.no_signature_check, seed=0).start()
+    HttpClientPool.configure(ca_file=stub.ca_file)
+    test_data = TestData(test_url=stub.url, poll_schedule=PollSchedule(delays=args.poll_delays),
+                         **generate_test_data_fields(credentials))
+
+    try:
+        # Load the schema and start the verification workers before timing anything
+        asyncio.run(run_level(test_data, 1, 1))
+
+        print(f"{'concurrency':>11} {'runs':>5} {'runs/s':>8} {'p50 (s)':>8} {'p99 (s)':>8} "
+              f"{'passed':>7} {'handshakes':>11}")
+        for concurrency in args.levels:
+            level = asyncio.run(run_level(test_data, concurrency, args.runs))
+            print(f"{concurrency:>11} {args.runs:>5} {args.runs / level['elapsed']:>8.2f} "
+                  f"{level['p50']:>8.3f} {level['p99']:>8.3f} {level['passed']:>7.1%} {level['handshakes']:>11}")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+"""
+    Time the CPU bound hot paths and compare them with a stored baseline
+
+    Covers envelope signing and signature verification, the CA certificate
+    fingerprint, building the signing payload and the Secom dictionary of each
+    Secom payload class, SecomSearchResult construction, the generated component
+    validators, the validation of search results item by item with ItemValidation,
+    in this process and on the worker pool, as the endorsement tests do, and
+    openapi_core validation of whole large search results. Each case is run for at least 0.2
+    seconds per repeat, and the best repeat is compared with the baseline. A
+    case that is slower than its baseline by more than the threshold is a
+    regression and makes the script exit with status 1.
+
+    Shared and virtual machines change speed from one run to the next, which
+    moves every case at once. Each run therefore also times a fixed reference
+    workload, and the baseline is scaled by how much faster or slower that
+    workload ran than when the baseline was recorded.
+
+    The payload cases change a field before each call, so they time building
+    the payload rather than reading it from the cache.
+
+    Baselines depend on the machine, so record them where they are compared:
+
+        python -m benchmarks.bench_hot_paths --save
+
+    Usage: python -m benchmarks.bench_hot_paths [--baseline benchmarks/hot_paths_baseline.json]
+                                                [--threshold 0.2] [--repeat 5] [--filter verify] [--save]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import platform
+import sys
+import timeit
+from collections.abc import Callable, Iterator
+from contextlib import ExitStack
+from typing import NamedTuple
+from uuid import uuid4
+
+import httpx
+
+from app.model.secom.v2.secom_envelope import SecomEnvelope
+from app.model.secom.v2.secom_search_result import SecomSearchResult
+from app.services.httpx_openapi import HttpxOpenAPIRequest, HttpxOpenAPIResponse
+from app.services.item_validation import ItemValidation
+from app.services.msr_response import MsrResponse
+from app.services.openapi_registry import OpenApiRegistry
+from app.services.pki_services import PKIServices
+from benchmarks.bench_payload import build_envelopes
+from benchmarks.bench_validators import build_search_filter, full_service_instance
+from benchmarks.certificates import generate_test_credentials, generate_test_data_fields
+from benchmarks.stub_msr import build_service_instance
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "hot_paths_baseline.json")
+
+SCHEMA_PATH = "./app/schema/MSRv2.json"
+
+
+class Case(NamedTuple):
+    """
+        One timed operation
+
+        name: Identifies the case in the output and the baseline
+        operation: The call to time
+        threshold: The allowed slowdown for this case, None for the --threshold given
+        repeat: The number of repeats for this case, None for the --repeat given
+    """
+
+    name : str
+    operation : Callable[[], object]
+    threshold : float | None = None
+    repeat : int | None = None
+
+
+def pki_cases(stack : ExitStack) -> Iterator[Case]:
+    """
+    Sign, verify and fingerprint with freshly generated ECDSA P-384 credentials
+    :param stack: Cleans up the PKI services once the cases have run
+    :return: the cases
+    """
+    credentials = generate_test_credentials()
+    fields = generate_test_data_fields(credentials)
+    pki_services = PKIServices(public_cert=fields["certificate"],
+                               private_cert=fields["private_key"],
+                               root_cert=fields["root_certificate"])
+    stack.callback(pki_services.cleanup)
+
+    payload = build_envelopes()[-2].payload_to_bytes()
+    certificates = [credentials["certificate"]]
+    sha3_signature = pki_services.get_data_signature(payload)
+    backend = pki_services.crypto_backend
+    sha2_signature = backend.sign(backend.load_signing_key(credentials["private_key"], "sha384"),
+                                  payload, "sha384").hex()
+
+    assert pki_services.verify_ecdsa_384_sha3_data_signature(payload, certificates, sha3_signature)
+    assert pki_services.verify_ecdsa_384_sha2_data_signature(payload, certificates, sha2_signature)
+
+    yield Case("PKIServices.get_data_signature",
+               lambda: pki_services.get_data_signature(payload))
+    yield Case("PKIServices.verify_ecdsa_384_sha3_data_signature",
+               lambda: pki_services.verify_ecdsa_384_sha3_data_signature(payload, certificates, sha3_signature))
+    yield Case("PKIServices.verify_ecdsa_384_sha2_data_signature",
+               lambda: pki_services.verify_ecdsa_384_sha2_data_signature(payload, certificates, sha2_signature))
+    yield Case("PKIServices.calculate_ca_certificate_fingerprint",
+               pki_services.calculate_ca_certificate_fingerprint)
+
+
+def payload_cases() -> Iterator[Case]:
+    """
+    Build the signing payload and the Secom dictionary of each Secom payload class
+    :return: the cases
+    """
+    search_filter = build_envelopes()[-2]
+    parameters = search_filter.query
+
+    envelope = SecomEnvelope()
+    envelope.envelope_signature_certificate = list(search_filter.envelope_signature_certificate)
+    envelope.envelope_root_certificate_thumbprint = search_filter.envelope_root_certificate_thumbprint
+    envelope.envelope_signature_time = search_filter.envelope_signature_time
+    envelope.envelope_signature_reference = search_filter.envelope_signature_reference
+
+    # Assigning a field drops the cached payload, of the nested query as well for the filter
+    def change_envelope() -> None:
+        envelope.envelope_signature_reference = search_filter.envelope_signature_reference
+
+    def change_parameters() -> None:
+        parameters.name = "Service Name"
+
+    def change_search_filter() -> None:
+        change_parameters()
+        search_filter.geometry = "POLYGON((0 0, 1 0, 1 1, 0 0))"
+
+    for name, value, change in [("SecomEnvelope", envelope, change_envelope),
+                                ("SecomEnvelopeSearchFilter", search_filter, change_search_filter),
+                                ("SecomSearchParameters", parameters, change_parameters)]:
+        yield Case(f"{name}.payload_to_bytes",
+                   lambda value=value, change=change: (change(), value.payload_to_bytes()))
+        yield Case(f"{name}.to_secom_dict",
+                   lambda value=value, change=change: (change(), value.to_secom_dict()))
+
+
+def search_result_cases() -> Iterator[Case]:
+    """
+    Build search results of growing size. The large ones repeat a thousand
+    distinct instances, which the lazy model treats like distinct ones.
+    :return: the cases
+    """
+    transaction_id = str(uuid4())
+    instances = [build_service_instance(index, transaction_id) for index in range(1000)]
+    for count in (10, 1000, 100000):
+        results = {"serviceInstance" : (instances * (count // len(instances) + 1))[:count]}
+        yield Case(f"SecomSearchResult[{count}]", lambda results=results: SecomSearchResult(results))
+
+
+def compiled_validator_cases() -> Iterator[Case]:
+    """
+    Validate single values with the generated component validators
+    :return: the cases
+    """
+    for schema_name, value in (("ServiceInstanceObject", full_service_instance(0)),
+                               ("SearchFilterObject", build_search_filter())):
+        validator = OpenApiRegistry.get_compiled_validator(SCHEMA_PATH, schema_name)
+        assert not validator(value), f"The {schema_name} sample is invalid"
+        yield Case(f"compiled.{schema_name}", lambda validator=validator, value=value: validator(value))
+
+
+def item_validation_cases(stack : ExitStack) -> Iterator[Case]:
+    """
+    Validate the service instances of search results item by item, as the
+    endorsement tests do, in this process and on the worker pool
+    :param stack: Closes the event loop once the cases have run
+    :return: the cases
+    """
+    loop = asyncio.new_event_loop()
+    stack.callback(loop.close)
+
+    for count, inline_threshold, repeat in ((1000, None, None), (1000, 0, None), (10000, 0, 3)):
+        items = [full_service_instance(index) for index in range(count)]
+
+        def validate(items : list[dict] = items, inline_threshold : int | None = inline_threshold) -> None:
+            validation = ItemValidation(SCHEMA_PATH, "ServiceInstanceObject",
+                                        inline_threshold=len(items) if inline_threshold is None else inline_threshold)
+            validation.submit(items)
+            errors = loop.run_until_complete(validation.errors())
+            assert not errors, errors[:3]
+
+        # The first call starts the worker processes
+        validate()
+        yield Case(f"ItemValidation[{count}{',inline' if inline_threshold is None else ',pool'}]", validate,
+                   repeat=repeat)
+
+
+def validation_cases() -> Iterator[Case]:
+    """
+    Validate search responses with every optional field of their instances set
+    :return: the cases
+    """
+    open_api = OpenApiRegistry.get(SCHEMA_PATH)
+    request = httpx.Request("POST", "http://127.0.0.1/api/secom/v2/searchService", content=b"{}",
+                            headers={"Content-Type" : "application/json"})
+
+    for count, repeat in ((1000, None), (10000, 3)):
+        body = json.dumps({"serviceInstance" : [full_service_instance(index) for index in range(count)]})
+        document = MsrResponse(httpx.Response(200, content=body.encode(), request=request,
+                                              headers={"Content-Type" : "application/json"}))
+        document.json()
+
+        def validate(document : MsrResponse = document) -> None:
+            open_api.validate_response(HttpxOpenAPIRequest(request), HttpxOpenAPIResponse(document))
+
+        validate()
+        yield Case(f"validate_response[{count}]", validate, repeat=repeat)
+
+
+def reference_workload() -> None:
+    """
+    A fixed mix of interpreted code and C calls whose time tracks the speed of the machine
+    """
+    document = {"serviceInstance" : [{"name" : f"Service {index}", "keywords" : ["a", "b"], "imo" : index}
+                                     for index in range(50)]}
+    decoded = json.loads(json.dumps(document))
+    hashlib.sha384(json.dumps(decoded).encode()).digest()
+    sorted(instance["name"].lower() for instance in decoded["serviceInstance"])
+
+
+def time_case(case : Case, repeat : int) -> float:
+    """
+    Time a case
+    :param case: The case
+    :param repeat: The number of repeats when the case does not set its own
+    :return: the seconds per call of the best repeat
+    """
+    timer = timeit.Timer(case.operation)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=case.repeat or repeat, number=number)) / number
+
+
+def machine() -> dict[str, str]:
+    """
+    Describe what the timings were taken on
+    :return: the Python version and the platform
+    """
+    return {"python" : platform.python_version(), "platform" : platform.platform(),
+            "processor" : platform.processor() or platform.machine(), "cpus" : str(os.cpu_count())}
+
+
+def format_seconds(seconds : float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="The baseline file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="The slowdown over the baseline that counts as a regression, 0.2 is 20%%")
+    parser.add_argument("--repeat", type=int, default=5, help="Repeats of each case, the best one counts")
+    parser.add_argument("--filter", nargs="+", default=[], help="Run only the cases whose names contain one of these")
+    parser.add_argument("--save", action="store_true", help="Store the timings as the new baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    baseline = {"machine" : {}, "reference" : None, "cases" : {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    if baseline["cases"] and baseline["machine"] != machine() and not args.save:
+        print(f"The baseline was recorded on {baseline['machine']}, the ratios compare different machines\n")
+
+    reference = time_case(Case("reference", reference_workload), args.repeat)
+    speed = reference / baseline["reference"] if baseline["reference"] and not args.save else 1.0
+    if speed != 1.0:
+        print(f"The reference workload took {speed:.2f} times as long as when the baseline was recorded, "
+              f"the baseline is scaled to match\n")
+
+    regressions = 0
+    timings : dict[str, dict[str, float]] = {}
+    print(f"{'case':<52} {'time':>12} {'baseline':>12} {'ratio':>6}")
+    with ExitStack() as stack:
+        cases = [*pki_cases(stack), *payload_cases(), *search_result_cases(), *compiled_validator_cases(),
+                 *item_validation_cases(stack), *validation_cases()]
+        for case in cases:
+            if args.filter and not any(pattern in case.name for pattern in args.filter):
+                continue
+
+            seconds = time_case(case, args.repeat)
+            timings[case.name] = {"seconds" : seconds}
+
+            expected = baseline["cases"].get(case.name, {}).get("seconds")
+            if expected is None:
+                print(f"{case.name:<52} {format_seconds(seconds):>12} {'-':>12} {'-':>6}  new")
+                continue
+
+            expected *= speed
+            ratio = seconds / expected
+            threshold = case.threshold if case.threshold is not None else args.threshold
+            verdict = ""
+            if ratio > 1 + threshold:
+                verdict = "  REGRESSION"
+                regressions += 1
+            elif ratio < 1 / (1 + threshold):
+                verdict = "  faster, record a new baseline"
+            print(f"{case.name:<52} {format_seconds(seconds):>12} {format_seconds(expected):>12} "
+                  f"{ratio:>6.2f}{verdict}")
+
+    if args.save:
+        # Cases left out by --filter keep their recorded timings
+        cases = baseline["cases"] if baseline["machine"] == machine() else {}
+        with open(args.baseline, "w") as file:
+            json.dump({"machine" : machine(), "reference" : reference, "cases" : cases | timings},
+                      file, indent=2, sort_keys=True)
+            file.write("\n")
+        print(f"\nStored the baseline in {args.baseline}")
+    elif regressions:
+        print(f"\n{regressions} case(s) slower than the baseline by more than the threshold")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+    Measure construction time and memory of SecomSearchResult on synthetic results
+
+    Usage: python -m benchmarks.bench_models [--instances 10000]
+"""
+import argparse
+import time
+import tracemalloc
+from uuid import UUID, uuid4
+
+from app.model.secom.v2.secom_search_result import SecomSearchResult
+
+
+class LegacyServiceInstance:
+    """
+        The previous dict backed service instance that decoded every field up front
+    """
+
+    def __init__(self, result : dict) -> None:
+        transaction_id = result.get("transactionId", "")
+        if transaction_id is not None and transaction_id != "":
+            self.transaction_id = UUID(transaction_id)
+        self.instance_id = result.get("instanceId", "")
+        self.version = result.get("version", "")
+        self.name = result.get("name", "")
+        self.status = result.get("status", "")
+        self.description = result.get("description", "")
+        self.data_product_type = []
+        self.organization_id = result.get("organizationId", "")
+        self.endpoint_uri = result.get("endpointUri", "")
+        self.endpoint_type = result.get("endpointType", "")
+        self.keywords = result.get("keywords", [])
+        self.unlocode = result.get("unlocode", [])
+        self.implements_designs = result.get("implementsDesigns", "")
+        self.api_doc = result.get("apiDoc", "")
+        self.coverage_area = result.get("coverageArea", [])
+        self.instance_as_xml = result.get("instanceAsXml", "")
+        self.imo = result.get("imo", 0)
+        self.mmsi = result.get("mmsi", 0)
+        self.certificates = result.get("certificates", [])
+        self.source_msr = result.get("sourceMSR", "")
+        self.unsupported_params = result.get("unsupportedParams", [])
+
+
+class LegacySearchResult:
+
+    def __init__(self, results : dict) -> None:
+        self.service_instance = [LegacyServiceInstance(result) for result in results["serviceInstance"]]
+
+
+def build_results(count : int) -> dict:
+    """
+    Build a decoded search result with the given number of service instances
+    :param count: The number of service instances
+    :return: the search result as it comes out of the JSON decoder
+    """
+    transaction_id = str(uuid4())
+    return {"serviceInstance" : [{
+        "transactionId" : transaction_id,
+        "instanceId" : f"urn:mrn:mcp:instance:benchmark:service-{index}",
+        "version" : "1.0.0",
+        "name" : f"Benchmark Service {index}",
+        "status" : "RELEASED",
+        "organizationId" : "urn:mrn:mcp:org:benchmark",
+        "endpointUri" : f"https://example.com/service/{index}",
+        "keywords" : ["benchmark", "s-124"],
+        "coverageArea" : ["POLYGON((-10 50, 2 50, 2 60, -10 60, -10 50))"],
+        "instanceAsXml" : "<ServiceInstance>" + "x" * 2048 + "</ServiceInstance>",
+        "imo" : None,
+        "mmsi" : None,
+    } for index in range(count)]}
+
+
+def measure(name : str, model : type, results : dict) -> None:
+    """
+    Print the construction time and the memory held by the model objects
+    :param name: The label to print
+    :param model: The search result class to construct
+    :param results: The decoded search result
+    """
+    start = time.perf_counter()
+    model(results)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    search_result = model(results)
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = len(search_result.service_instance)
+    print(f"{name:>10} {elapsed * 1e3:>12.2f} {held / count:>14.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--instances", type=int, default=10000)
+    args = parser.parse_args()
+
+    results = build_results(args.instances)
+
+    print(f"{'model':>10} {'build (ms)':>12} {'bytes/instance':>14}")
+    measure("legacy", LegacySearchResult, results)
+    measure("slots", SecomSearchResult, results)
+
+
+if __name__ == "__main__":
+    main()
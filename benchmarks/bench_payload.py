@@ -0,0 +1,194 @@
+"""
+    Compare the field spec driven payload builder with the previous string concatenation
+
+    Usage: python -m benchmarks.bench_payload [--iterations 20000]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime
+
+from app.model.secom.enums.data_product_type import DataProductType
+from app.model.secom.secom_constants import SecomConstants as sc
+from app.model.secom.v2.secom_envelope_search_filter import SecomEnvelopeSearchFilter
+from app.model.secom.v2.secom_search_parameters import SecomSearchParameters
+
+
+def legacy_parameters_payload(query : SecomSearchParameters) -> bytes:
+    payload = ""
+    payload += query.name if query.name is not None else ""
+    payload += "."
+    payload += query.status if query.status is not None else ""
+    payload += "."
+    payload += query.version.lower() if query.version is not None else ""
+    payload += "."
+    if query.keywords is not None:
+        for keyword in query.keywords:
+            payload += keyword.lower() + "."
+    else:
+        payload += "."
+    payload += query.description.lower() if query.description is not None else ""
+    payload += "."
+    payload += query.data_product_type.name.lower() if query.data_product_type is not None else ""
+    payload += "."
+    payload += query.specification_id.lower() if query.specification_id is not None else ""
+    payload += "."
+    payload += query.design_id.lower() if query.design_id is not None else ""
+    payload += "."
+    payload += query.instance_id.lower() if query.instance_id is not None else ""
+    payload += "."
+    payload += query.mmsi.lower() if query.mmsi is not None else ""
+    payload += "."
+    payload += query.imo.lower() if query.imo is not None else ""
+    payload += "."
+    payload += query.service_type.lower() if query.service_type is not None else ""
+    payload += "."
+    payload += query.unlocode.lower() if query.unlocode is not None else ""
+    payload += "."
+    payload += query.endpoint_uri.lower() if query.endpoint_uri is not None else ""
+    return bytes(payload, encoding='utf-8')
+
+
+def legacy_envelope_payload(envelope : SecomEnvelopeSearchFilter) -> bytes:
+    payload = ""
+    payload += "["
+    for certificate in envelope.envelope_signature_certificate:
+        payload += certificate + "."
+    payload = payload[:-1] + "]."
+    payload += envelope.envelope_root_certificate_thumbprint + "."
+    payload += str(int(envelope.envelope_signature_time.timestamp())) + "."
+    payload += envelope.envelope_signature_reference.lower()
+    return bytes(payload, encoding='utf-8')
+
+
+def legacy_filter_payload(envelope : SecomEnvelopeSearchFilter) -> bytes:
+    payload = ""
+    payload += legacy_parameters_payload(envelope.query).decode() if envelope.query is not None else ""
+    payload += "."
+    payload += envelope.geometry if envelope.geometry is not None else ""
+    payload += "."
+    payload += str(envelope.include_xml).lower() if envelope.include_xml is not None else ""
+    payload += "."
+    payload += str(envelope.local_only).lower()
+    payload += "."
+    payload += legacy_envelope_payload(envelope).decode()
+    return bytes(payload, encoding='utf-8')
+
+
+def legacy_parameters_dict(query : SecomSearchParameters) -> dict:
+    dictionary = {}
+    for attribute, key in [("name", "name"), ("status", "status"), ("version", "version"),
+                           ("keywords", "keywords"), ("description", "description")]:
+        if getattr(query, attribute) is not None:
+            dictionary[key] = getattr(query, attribute)
+    if query.data_product_type is not None:
+        dictionary["dataProductType"] = query.data_product_type.name
+    for attribute, key in [("specification_id", "specificationId"), ("design_id", "designId"),
+                           ("instance_id", "instanceId"), ("organization_id", "organizationId"),
+                           ("mmsi", "mmsi"), ("imo", "imo"), ("service_type", "serviceType"),
+                           ("unlocode", "unlocode"), ("endpoint_uri", "endpointUri")]:
+        if getattr(query, attribute) is not None:
+            dictionary[key] = getattr(query, attribute)
+    return dictionary
+
+
+def legacy_filter_dict(envelope : SecomEnvelopeSearchFilter) -> dict:
+    dictionary = {"query" : legacy_parameters_dict(envelope.query) if envelope.query is not None else {}}
+    if envelope.geometry is not None:
+        dictionary["geometry"] = envelope.geometry
+    if envelope.include_xml is not None:
+        dictionary["includeXml"] = envelope.include_xml
+    dictionary["localOnly"] = envelope.local_only
+    dictionary["envelopeSignatureCertificate"] = envelope.envelope_signature_certificate
+    dictionary["envelopeRootCertificateThumbprint"] = envelope.envelope_root_certificate_thumbprint
+    dictionary["envelopeSignatureTime"] = envelope.envelope_signature_time.strftime(sc.DATETIME_FORMAT_v2)
+    dictionary["envelopeSignatureReference"] = envelope.envelope_signature_reference
+    return dictionary
+
+
+def build_envelopes() -> list[SecomEnvelopeSearchFilter]:
+    """
+    Build envelopes covering the optional fields and the keyword edge cases
+    :return: a list of populated envelopes
+    """
+    envelopes = []
+    for keywords in [None, [], ["Navigation", "Warning"]]:
+        envelope = SecomEnvelopeSearchFilter()
+        envelope.query = SecomSearchParameters(name="Service Name", status="RELEASED", version="1.0.A",
+                                               keywords=keywords, description="A Description",
+                                               data_product_type=DataProductType.S124,
+                                               instance_id="urn:mrn:mcp:instance:Test",
+                                               organization_id="urn:mrn:mcp:org:test", mmsi="123456789")
+        envelope.geometry = "POLYGON((0 0, 1 0, 1 1, 0 0))"
+        envelope.include_xml = True
+        envelope.local_only = False
+        envelope.envelope_signature_certificate = ["MIIB" * 150]
+        envelope.envelope_root_certificate_thumbprint = "ab" * 32
+        envelope.envelope_signature_time = datetime(2026, 1, 1, 12, 0, 0)
+        envelope.envelope_signature_reference = "SHA3_384"
+        envelopes.append(envelope)
+
+    envelope = SecomEnvelopeSearchFilter()
+    envelope.query = SecomSearchParameters()
+    envelopes.append(envelope)
+    return envelopes
+
+
+def measure(name : str, operation, iterations : int) -> None:
+    """
+    Print the time per operation and the memory allocated while running it
+    :param name: The label to print
+    :param operation: The operation to measure
+    :param iterations: The number of times to run it
+    """
+    start = time.perf_counter()
+    for _ in range(iterations):
+        operation()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    for _ in range(1000):
+        operation()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:>24} {elapsed / iterations * 1e6:>10.2f} {peak / 1024:>10.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    envelopes = build_envelopes()
+
+    # The new builder must produce exactly what the old code produced
+    for envelope in envelopes:
+        assert envelope.payload_to_bytes() == legacy_filter_payload(envelope), envelope.payload_to_bytes()
+        assert envelope.to_secom_dict() == legacy_filter_dict(envelope)
+
+    envelope = envelopes[-2]
+
+    # A signing round: the payload is built to sign, again to log, and the dict to send
+    def legacy_round() -> None:
+        legacy_filter_payload(envelope)
+        legacy_filter_payload(envelope)
+        json.dumps(legacy_filter_dict(envelope))
+
+    def spec_round() -> None:
+        envelope.payload_to_bytes()
+        json.dumps(envelope.to_secom_dict())
+
+    def spec_round_after_change() -> None:
+        envelope.query.name = "Service Name"
+        spec_round()
+
+    print(f"{'':>24} {'us/op':>10} {'peak KiB':>10}")
+    measure("legacy", legacy_round, args.iterations)
+    measure("field spec, cached", spec_round, args.iterations)
+    measure("field spec, rebuilt", spec_round_after_change, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
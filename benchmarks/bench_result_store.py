@@ -0,0 +1,135 @@
+"""
+    Time the result history queries on a large synthetic history
+
+    Fills a temporary database with --runs runs of every test against --targets
+    MSRs spread over a year, then times the latest run of every MSR and the
+    trend of a test, overall and for one MSR. Prints the SQLite query plans so a
+    query that stops using its index shows up as a table scan. Before timing
+    anything it checks that the blob store the responses are kept in gives back
+    what was stored, including responses that look like its own split lists.
+
+    Usage: python -m benchmarks.bench_result_store [--runs 100000] [--targets 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+from app.model.test_result import TestResult
+from app.model.test_results import TestResults
+from app.services.blob_store import BlobStore
+from app.services.result_store import ResultStore
+
+TEST_KEYS = ["empty_search", "instance_id_search", "status_search", "geometry_search", "bad_signature",
+             "unauthorised_search", "invalid_status", "no_results", "imo_only", "mmsi_only", "global_search",
+             "random_transaction_id", "retrieve_results", "retrieve_results"]
+
+YEAR = 365 * 86400.0
+
+
+def fill(store : ResultStore, runs : int, targets : int) -> None:
+    """
+    Record synthetic runs
+    :param store: The store to fill
+    :param runs: The number of runs
+    :param targets: The number of MSRs they are spread over
+    """
+    generator = random.Random(0)
+    now = time.time()
+    for index in range(runs):
+        results = TestResults(results=[TestResult(test_name=f"{test_key} {index}", test_key=test_key,
+                                                  test_success=generator.random() > 0.1, full_response={},
+                                                  elapsed=generator.expovariate(20))
+                                       for test_key in TEST_KEYS])
+        store.record(f"https://msr{index % targets}.example.com/", f"{index % targets:064x}", "0" * 64,
+                     now - YEAR + YEAR * index / runs, 2.0, results)
+
+
+def check_blob_store(directory : str) -> int:
+    """
+    Store responses in a blob store, with and without split lists, and check each
+    one comes back unchanged, before and after pruning
+    :param directory: An empty directory for the store
+    :return: the number of differences
+    """
+    store = BlobStore(directory)
+    instance = {"instanceId" : "urn:mrn:stub:instance:0", "status" : "released"}
+    item_reference = store.put(instance)
+    responses = [
+        {"serviceInstance" : [instance, instance | {"status" : "deprecated"}]},
+        # Shaped like the references a split list is stored as, but sent by the MSR
+        {"serviceInstance" : {"$refs" : [item_reference]}},
+        {"serviceInstance" : [{"$refs" : [item_reference]}], "$refs" : [item_reference]},
+        {"serviceInstance" : "\x00[\"serviceInstance\"]\n{}"},
+        [item_reference],
+    ]
+    references = [store.put(response) for response in responses]
+
+    differences = 0
+    for stage in ("stored", "pruned"):
+        for response, reference in zip(responses, references):
+            if store.get(reference) != response:
+                differences += 1
+                print(f"Blob store, {stage}: {response} came back as {store.get(reference)}")
+        store.prune(set(references), grace=0.0)
+    return differences
+
+
+def timed(label : str, function, repeat : int = 5) -> None:
+    """
+    Print the best time of several calls
+    :param label: What is timed
+    :param function: The call to time
+    :param repeat: The number of calls
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:>40} {best * 1e3:>10.2f} ms {len(result) if isinstance(result, list) else 1:>8} rows")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=100000)
+    parser.add_argument("--targets", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if check_blob_store(os.path.join(directory, "blobs")):
+            sys.exit(1)
+
+        store = ResultStore(os.path.join(directory, "results.db"))
+
+        start = time.perf_counter()
+        fill(store, args.runs, args.targets)
+        elapsed = time.perf_counter() - start
+        print(f"Recorded {args.runs} runs, {args.runs * len(TEST_KEYS)} results in {elapsed:.1f} s "
+              f"({elapsed / args.runs * 1e3:.2f} ms per run)\n")
+
+        now = time.time()
+        timed("latest run of every MSR", store.latest_runs)
+        timed("latest run of one MSR", lambda: store.latest_run("https://msr7.example.com/"))
+        timed("daily trend of a test, all MSRs", lambda: store.test_trend("global_search"))
+        timed("daily trend of a test, last 30 days", lambda: store.test_trend("global_search", since=now - 30 * 86400))
+        timed("daily trend of a test, one MSR", lambda: store.test_trend("global_search", "https://msr7.example.com/"))
+
+        print()
+        connection = store._connection
+        for label, query in [
+            ("latest runs", "SELECT run_id FROM runs WHERE target_id = 1 ORDER BY started_at DESC LIMIT 1"),
+            ("trend", "SELECT COUNT(*), SUM(test_success), AVG(elapsed) FROM results "
+                      "WHERE test_key = 'global_search' AND started_at >= 0"),
+            ("trend per MSR", "SELECT COUNT(*), SUM(test_success), AVG(elapsed) FROM results "
+                              "WHERE target_id = 1 AND test_key = 'global_search' AND started_at >= 0")]:
+            plan = "; ".join(row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {query}"))
+            print(f"{label:>16}: {plan}")
+
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
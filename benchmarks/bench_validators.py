@@ -0,0 +1,236 @@
+"""
+    Check the generated schema validators against openapi_core and compare their speed
+
+    Every compiled schema is given valid samples and mutations of them (each field
+    replaced, removed or joined by an unknown one). The generated validator must
+    accept and reject exactly the same values as openapi_core; any difference is
+    printed and the script exits with status 1 before timing anything. So does
+    an ItemValidation that validates other than its first inline_threshold items
+    in this process, or reports other errors than validating each item would.
+
+    Usage: python -m benchmarks.bench_validators [--schema ./app/schema/MSRv2.json] [--instances 2000]
+"""
+import argparse
+import asyncio
+import copy
+import sys
+import time
+from collections.abc import Iterator
+from typing import Any
+from uuid import uuid4
+
+from app.model.secom.v2.secom_envelope_search_filter import SecomEnvelopeSearchFilter
+from app.model.secom.v2.secom_search_filter import SecomSearchFilter
+from app.model.secom.v2.secom_search_parameters import SecomSearchParameters
+from app.services.item_validation import ItemValidation
+from app.services.openapi_registry import OpenApiRegistry
+from app.services.pki_services import PKIServices
+from app.services.schema_compiler import COMPILED_SCHEMAS
+from benchmarks.certificates import generate_test_data_fields
+from benchmarks.stub_msr import build_service_instance
+
+SCHEMA_PATHS = ["./app/schema/MSRv2.json", "./app/schema/MSRv2-dodgy.json"]
+
+# Values swapped in for every field of the samples
+REPLACEMENTS : list[Any] = [None, True, False, 0, 1, -1, 1.5, 2.0, "", "x", "RELEASED", "OTHER",
+                            "urn:mrn:mcp:instance:test", "550e8400-e29b-41d4-a716-446655440000",
+                            "550e8400-e29b-41d4-a716-44665544000g", "https://example.com/x", "ftp://a",
+                            "not a uri", "S-124", "S124", "2026-01-01T00:00:00Z", "20260101T000000",
+                            [], ["a"], [1], [None], {}, {"a" : 1}]
+
+
+def full_service_instance(index : int) -> dict:
+    """
+    Build a service instance with every optional field set
+    :param index: The index of the instance
+    :return: the service instance as a dictionary
+    """
+    instance = build_service_instance(index, str(uuid4()))
+    instance.update({
+        "dataProductType" : ["S-124"],
+        "endpointType" : ["REST"],
+        "unlocode" : ["GBSOU"],
+        "implementsDesigns" : ["urn:mrn:mcp:design:benchmark"],
+        "apiDoc" : "https://example.com/api",
+        "instanceAsXml" : "<xml/>",
+        "imo" : 1234567,
+        "mmsi" : 123456789,
+        "certificates" : ["MIIB"],
+        "unsupportedParams" : ["geometry"],
+    })
+    return instance
+
+
+def build_search_filter() -> dict:
+    """
+    Build a signed search filter as the validator sends it
+    :return: the search filter as a dictionary
+    """
+    fields = generate_test_data_fields()
+    pki_services = PKIServices(public_cert=fields["certificate"],
+                               private_cert=fields["private_key"],
+                               root_cert=fields["root_certificate"])
+    try:
+        search_filter = SecomSearchFilter()
+        search_filter.envelope = SecomEnvelopeSearchFilter()
+        search_filter.envelope.query = SecomSearchParameters(name="Benchmark", status="RELEASED",
+                                                             keywords=["benchmark"], mmsi="123456789")
+        search_filter.envelope.geometry = "POLYGON((0 0, 1 0, 1 1, 0 0))"
+        search_filter.envelope, search_filter.envelope_signature = \
+            pki_services.sign_envelope_object(search_filter.envelope)
+        return search_filter.to_secom_dict()
+    finally:
+        pki_services.cleanup()
+
+
+def build_samples(spec : dict) -> dict[str, list[Any]]:
+    """
+    Build valid samples for each compiled schema
+    :param spec: The OpenAPI document
+    :return: the samples by schema name
+    """
+    schemas = spec["components"]["schemas"]
+    return {
+        "SearchResult" : [{"serviceInstance" : [build_service_instance(0, str(uuid4())), full_service_instance(1)]},
+                          {"serviceInstance" : []}],
+        "ServiceInstanceObject" : [build_service_instance(0, str(uuid4())), full_service_instance(1)],
+        "ServiceInstanceStatus" : list(schemas["ServiceInstanceStatus"].get("enum", ["RELEASED"])),
+        "MaritimeServiceType" : list(schemas["MaritimeServiceType"].get("enum", ["OTHER"])),
+        "SearchFilterObject" : [build_search_filter()],
+    }
+
+
+def mutations(value : Any) -> Iterator[Any]:
+    """
+    Yield the value itself and copies with one field replaced, removed or added
+    :param value: A valid sample
+    :return: the mutated values
+    """
+    yield value
+    yield from REPLACEMENTS
+
+    def paths(node : Any, path : tuple) -> Iterator[tuple]:
+        if isinstance(node, dict):
+            yield path + ("<extra>",)
+            for key, child in node.items():
+                yield path + (key,)
+                yield from paths(child, path + (key,))
+        elif isinstance(node, list):
+            for index, child in enumerate(node):
+                yield path + (index,)
+                yield from paths(child, path + (index,))
+
+    for path in paths(value, ()):
+        for replacement in REPLACEMENTS + ["<delete>"]:
+            mutated = copy.deepcopy(value)
+            parent = mutated
+            for part in path[:-1]:
+                parent = parent[part]
+            if replacement == "<delete>":
+                if isinstance(parent, dict) and path[-1] in parent:
+                    del parent[path[-1]]
+                else:
+                    continue
+            else:
+                parent[path[-1]] = replacement
+            yield mutated
+
+
+def check(schema_path : str, samples : dict[str, list[Any]]) -> int:
+    """
+    Compare the verdicts of the generated and the openapi_core validators
+    :param schema_path: The path of the OpenAPI schema file
+    :param samples: The valid samples by schema name
+    :return: the number of differences
+    """
+    compiled = OpenApiRegistry.get_compiled_validators(schema_path)
+    differences = 0
+
+    for schema_name in COMPILED_SCHEMAS:
+        if schema_name not in compiled:
+            print(f"{schema_path} {schema_name}: not compiled, openapi_core is used")
+            continue
+
+        interpreted = OpenApiRegistry.get_schema_validator(schema_path, schema_name).validator
+        checked = rejected = 0
+        for sample in samples[schema_name]:
+            for value in mutations(sample):
+                compiled_valid = not compiled[schema_name](value)
+                interpreted_valid = next(interpreted.iter_errors(value), None) is None
+                checked += 1
+                rejected += not interpreted_valid
+                if compiled_valid != interpreted_valid:
+                    differences += 1
+                    print(f"{schema_path} {schema_name}: compiled {'accepts' if compiled_valid else 'rejects'} "
+                          f"{value!r} but openapi_core does not")
+
+        print(f"{schema_path} {schema_name}: {checked} values, {rejected} rejected by both")
+
+    return differences
+
+
+def check_item_validation(schema_path : str) -> int:
+    """
+    Submit a streamed search result in uneven batches and check where its items were
+    validated and that every invalid item is reported, in this process and in the pool
+    :param schema_path: The path of the OpenAPI schema file
+    :return: the number of differences
+    """
+    items = [full_service_instance(index) for index in range(300)]
+    for index in (5, 40, 299):
+        items[index] = items[index] | {"status" : "NOT A STATUS"}
+    validator = OpenApiRegistry.get_compiled_validator(schema_path, "ServiceInstanceObject")
+    expected = sorted(index for index, item in enumerate(items) for _ in validator(item))
+
+    validation = ItemValidation(schema_path, "ServiceInstanceObject", chunk_size=64, inline_threshold=32)
+    start = 0
+    for size in (10, 50, 7, 3, 100, 1, 129):
+        validation.submit(items[start:start + size])
+        start += size
+    errors = asyncio.run(validation.errors())
+
+    differences = 0
+    if (validation.inline_count, validation.pool_count) != (32, len(items) - 32):
+        differences += 1
+        print(f"{schema_path} ItemValidation: {validation.inline_count} items validated in this process and "
+              f"{validation.pool_count} in the pool, expected 32 and {len(items) - 32}")
+    if [index for index, _ in errors] != expected:
+        differences += 1
+        print(f"{schema_path} ItemValidation: errors in items {[index for index, _ in errors]}, expected {expected}")
+
+    return differences
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schema", nargs="+", default=SCHEMA_PATHS)
+    parser.add_argument("--instances", type=int, default=2000)
+    args = parser.parse_args()
+
+    for schema_path in args.schema:
+        samples = build_samples(OpenApiRegistry.get(schema_path).spec.contents())
+        if check(schema_path, samples) or check_item_validation(schema_path):
+            sys.exit(1)
+
+    instances = [full_service_instance(index) for index in range(args.instances)]
+    print(f"\n{'schema':>32} {'openapi_core us':>16} {'compiled us':>12}")
+    for schema_path in args.schema:
+        interpreted = OpenApiRegistry.get_schema_validator(schema_path, "ServiceInstanceObject").validator
+        compiled = OpenApiRegistry.get_compiled_validator(schema_path, "ServiceInstanceObject")
+
+        start = time.perf_counter()
+        for instance in instances:
+            list(interpreted.iter_errors(instance))
+        interpreted_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for instance in instances:
+            compiled(instance)
+        compiled_time = time.perf_counter() - start
+
+        print(f"{schema_path:>32} {interpreted_time / len(instances) * 1e6:>16.1f} "
+              f"{compiled_time / len(instances) * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+    Generate throwaway ECDSA P-384 certificates for the benchmarks
+"""
+import base64
+import ipaddress
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+# The names the stub MSR's server certificate is valid for
+SERVER_NAMES = ("localhost", "127.0.0.1")
+
+
+def _build_certificate(subject_name : str, public_key, issuer_name : str, issuer_key,
+                       is_ca : bool, usages : list[x509.ObjectIdentifier] | None = None,
+                       server_names : tuple[str, ...] = ()) -> x509.Certificate:
+    """
+    Build a certificate for the given key signed by the issuer key
+    :return: the signed certificate
+    """
+    now = datetime.now(timezone.utc)
+    builder = (x509.CertificateBuilder()
+               .subject_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, subject_name)]))
+               .issuer_name(x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, issuer_name)]))
+               .public_key(public_key)
+               .serial_number(x509.random_serial_number())
+               .not_valid_before(now - timedelta(days=1))
+               .not_valid_after(now + timedelta(days=30))
+               .add_extension(x509.BasicConstraints(ca=is_ca, path_length=None), critical=True)
+               .add_extension(x509.KeyUsage(digital_signature=True, content_commitment=False,
+                                            key_encipherment=False, data_encipherment=False,
+                                            key_agreement=False, key_cert_sign=is_ca, crl_sign=is_ca,
+                                            encipher_only=False, decipher_only=False), critical=True)
+               .add_extension(x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
+               .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key(issuer_key.public_key()),
+                              critical=False))
+
+    if usages:
+        builder = builder.add_extension(x509.ExtendedKeyUsage(usages), critical=False)
+
+    if server_names:
+        names = []
+        for name in server_names:
+            try:
+                names.append(x509.IPAddress(ipaddress.ip_address(name)))
+            except ValueError:
+                names.append(x509.DNSName(name))
+        builder = builder.add_extension(x509.SubjectAlternativeName(names), critical=False)
+
+    return builder.sign(issuer_key, hashes.SHA384())
+
+
+def _private_key_pem(key : ec.EllipticCurvePrivateKey) -> bytes:
+    return key.private_bytes(serialization.Encoding.PEM,
+                             serialization.PrivateFormat.TraditionalOpenSSL,
+                             serialization.NoEncryption())
+
+
+def generate_test_credentials() -> dict[str, bytes]:
+    """
+    Generate a root CA, a client certificate signed by it and a server certificate
+    for the stub MSR signed by it
+    :return: the PEM encoded CA certificate, client certificate and key, and server certificate and key
+    """
+    ca_key = ec.generate_private_key(ec.SECP384R1())
+    ca_certificate = _build_certificate("MSR Benchmark Root CA", ca_key.public_key(),
+                                        "MSR Benchmark Root CA", ca_key, True)
+
+    client_key = ec.generate_private_key(ec.SECP384R1())
+    client_certificate = _build_certificate("urn:mrn:mcp:device:benchmark:client", client_key.public_key(),
+                                            "MSR Benchmark Root CA", ca_key, False,
+                                            [ExtendedKeyUsageOID.CLIENT_AUTH])
+
+    server_key = ec.generate_private_key(ec.SECP384R1())
+    server_certificate = _build_certificate("localhost", server_key.public_key(),
+                                            "MSR Benchmark Root CA", ca_key, False,
+                                            [ExtendedKeyUsageOID.SERVER_AUTH], SERVER_NAMES)
+
+    return {
+        "root_certificate" : ca_certificate.public_bytes(serialization.Encoding.PEM),
+        "certificate" : client_certificate.public_bytes(serialization.Encoding.PEM),
+        "private_key" : _private_key_pem(client_key),
+        "server_certificate" : server_certificate.public_bytes(serialization.Encoding.PEM),
+        "server_private_key" : _private_key_pem(server_key),
+    }
+
+
+def generate_test_data_fields(credentials : dict[str, bytes] | None = None) -> dict[str, str]:
+    """
+    Encode credentials the way the TestData model expects them
+    :param credentials: Credentials from generate_test_credentials, new ones when None
+    :return: the base64 encoded certificate, private key and root certificate
+    """
+    if credentials is None:
+        credentials = generate_test_credentials()
+    return {name : base64.b64encode(credentials[name]).decode()
+            for name in ("certificate", "private_key", "root_certificate")}
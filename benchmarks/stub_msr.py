@@ -0,0 +1,398 @@
+"""
+    A local stand-in for an MSR used by the benchmarks
+"""
+import json
+import multiprocessing
+import os
+import random
+import ssl
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+from cryptography.hazmat.primitives.hashes import SHA256
+from cryptography.x509 import load_pem_x509_certificate
+
+from app.model.secom.enums.data_product_type import DataProductType
+from app.model.secom.secom_constants import SecomConstants
+from app.model.secom.v2.secom_envelope_search_filter import SecomEnvelopeSearchFilter
+from app.model.secom.v2.secom_search_parameters import SecomSearchParameters
+from app.services.crypto_backends import get_crypto_backend
+
+# The hash functions of the signature references the stub accepts
+SIGNATURE_HASHES = ("sha3_384", "sha384")
+
+
+def build_service_instance(index : int, transaction_id : str) -> dict:
+    """
+    Build a service instance that conforms to the MSR schema
+    :param index: The index of the instance, used to make the identifiers unique
+    :param transaction_id: The transaction id of the search
+    :return: the service instance as a dictionary
+    """
+    return {
+        "transactionId" : transaction_id,
+        "instanceId" : f"urn:mrn:mcp:instance:benchmark:service-{index}",
+        "version" : "1.0.0",
+        "name" : f"Benchmark Service {index}",
+        "status" : "RELEASED",
+        "description" : "Service instance served by the benchmark stub MSR",
+        "organizationId" : "urn:mrn:mcp:org:benchmark",
+        "endpointUri" : f"https://example.com/service/{index}",
+        "keywords" : ["benchmark"],
+        "coverageArea" : ["POLYGON((-10 50, 2 50, 2 60, -10 60, -10 50))"],
+    }
+
+
+def envelope_payload(envelope : dict) -> bytes:
+    """
+    Rebuild the signing payload of a search filter envelope from its Secom dictionary
+    :param envelope: The envelope as sent by the client
+    :return: the payload the envelope signature covers
+    """
+    query = SecomSearchParameters()
+    for field in SecomSearchParameters._secom_fields:
+        value = envelope.get("query", {}).get(field.secom_key)
+        if value is not None and field.attribute == "data_product_type":
+            value = DataProductType[value]
+        setattr(query, field.attribute, value)
+
+    search_filter = SecomEnvelopeSearchFilter()
+    search_filter.query = query
+    search_filter.geometry = envelope.get("geometry")
+    search_filter.include_xml = envelope.get("includeXml")
+    search_filter.local_only = envelope.get("localOnly")
+    search_filter.envelope_signature_certificate = envelope.get("envelopeSignatureCertificate") or []
+    search_filter.envelope_root_certificate_thumbprint = envelope.get("envelopeRootCertificateThumbprint")
+    search_filter.envelope_signature_time = datetime.strptime(envelope["envelopeSignatureTime"],
+                                                              SecomConstants.DATETIME_FORMAT_v2)
+    search_filter.envelope_signature_reference = envelope.get("envelopeSignatureReference")
+    return search_filter.payload_to_bytes()
+
+
+class StubMsr:
+    """
+        Serves searchService and retrieveResults on a local port, over mutual TLS
+        when it is given credentials from benchmarks.certificates. Like an MSR it
+        then answers requests without a client certificate with a 401, and
+        searches whose envelope signature does not verify, or whose root
+        certificate thumbprint is not that of its CA, with a 400.
+
+        retrieve_count: The number of retrieve results requests answered for known transactions
+        error_rate: The fraction of requests answered with error_status instead
+        check_signatures: Whether envelope signatures are verified, turn off to
+                          stand in for an MSR that ignores them
+    """
+
+    latency : float
+    result_size : int
+    retrieve_count : int
+    error_rate : float
+    error_status : int
+    check_signatures : bool
+
+    _server : ThreadingHTTPServer
+    _thread : threading.Thread
+    _transactions : set[str]
+    _random : random.Random
+    _tls : bool
+    _ca_file : str | None
+    _ca_thumbprint : str | None
+    _directory : tempfile.TemporaryDirectory | None
+
+    def __init__(self, latency : float = 0.0, result_size : int = 5, port : int = 0,
+                 credentials : dict[str, bytes] | None = None, error_rate : float = 0.0,
+                 error_status : int = 500, check_signatures : bool = True, seed : int | None = None) -> None:
+        """
+        Create a new stub MSR
+        :param latency: Seconds to wait before answering each request
+        :param result_size: The number of service instances returned by a search
+        :param port: The port to listen on, 0 picks a free port
+        :param credentials: The CA and server certificates to serve mutual TLS with, None for plain HTTP
+        :param error_rate: The fraction of requests that fail with error_status
+        :param error_status: The status code of the failed requests
+        :param check_signatures: Whether to verify the envelope signatures of searches
+        :param seed: Seeds the choice of the failed requests
+        """
+        self.latency = latency
+        self.result_size = result_size
+        self.retrieve_count = 0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.check_signatures = check_signatures
+        self._transactions = set()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._build_handler())
+        self._server.daemon_threads = True
+
+        self._tls = credentials is not None
+        self._ca_file = None
+        self._ca_thumbprint = None
+        self._directory = None
+        if credentials is not None:
+            self._serve_tls(credentials)
+
+    def _serve_tls(self, credentials : dict[str, bytes]) -> None:
+        """
+        Wrap the listening socket so connections use TLS, asking for a client
+        certificate signed by the CA
+        :param credentials: The CA certificate and the server certificate and key
+        """
+        self._directory = tempfile.TemporaryDirectory()
+        paths = {}
+        for name in ("root_certificate", "server_certificate", "server_private_key"):
+            paths[name] = os.path.join(self._directory.name, f"{name}.pem")
+            with open(paths[name], "wb") as file:
+                file.write(credentials[name])
+        self._ca_file = paths["root_certificate"]
+        self._ca_thumbprint = load_pem_x509_certificate(credentials["root_certificate"]) \
+            .fingerprint(SHA256()).hex()
+
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(paths["server_certificate"], paths["server_private_key"])
+        context.load_verify_locations(cafile=self._ca_file)
+        # Requests without a certificate get through the handshake and are refused with a 401
+        context.verify_mode = ssl.CERT_OPTIONAL
+
+        # The handshake happens on the first read in the handler thread, so a slow
+        # client does not hold up the accept loop
+        self._server.socket = context.wrap_socket(self._server.socket, server_side=True,
+                                                  do_handshake_on_connect=False)
+
+    @property
+    def url(self) -> str:
+        scheme = "https" if self._tls else "http"
+        return f"{scheme}://127.0.0.1:{self._server.server_address[1]}/"
+
+    @property
+    def ca_file(self) -> str | None:
+        """
+        The PEM file of the CA the server certificate is signed by, None for plain HTTP
+        """
+        return self._ca_file
+
+    def _build_handler(self) -> type[BaseHTTPRequestHandler]:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+            def handle(self) -> None:
+                try:
+                    super().handle()
+                except (ssl.SSLError, ConnectionError):
+                    # A failed handshake or a client that went away
+                    self.close_connection = True
+
+            def _refuse(self) -> bool:
+                """
+                Answer the request with an error if it should fail
+                :return: whether the request was answered
+                """
+                if stub._tls and not self.connection.getpeercert():
+                    self._send(401, {"message" : "A client certificate is required"})
+                    return True
+                if stub.error_rate and stub.should_fail():
+                    self._send(stub.error_status, {"message" : "Simulated failure"})
+                    return True
+                return False
+
+            def _send(self, status : int, body : dict | str) -> None:
+                content = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_POST(self) -> None:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                time.sleep(stub.latency)
+
+                if self._refuse():
+                    return
+
+                if not self.path.endswith("/api/secom/v2/searchService"):
+                    self._send(404, {"message" : "Not found"})
+                    return
+
+                status, body = stub.search(request.get("envelope", {}), request.get("envelopeSignature", ""))
+                self._send(status, body)
+
+            def do_GET(self) -> None:
+                time.sleep(stub.latency)
+
+                if self._refuse():
+                    return
+
+                if "/api/secom/v2/retrieveResults/" not in self.path:
+                    self._send(404, {"message" : "Not found"})
+                    return
+
+                status, body = stub.retrieve(self.path.rsplit("/", 1)[-1])
+                self._send(status, body)
+
+        return Handler
+
+    def should_fail(self) -> bool:
+        """
+        Decide whether a request fails
+        :return: True for about error_rate of the requests
+        """
+        return self._random.random() < self.error_rate
+
+    def verify_envelope(self, envelope : dict, signature : str) -> str:
+        """
+        Check the envelope signature of a search the way an MSR does
+        :param envelope: The envelope of the search filter
+        :param signature: The hex encoded envelope signature
+        :return: why the envelope was rejected, an empty string if it was accepted
+        """
+        if self._ca_thumbprint is not None \
+                and envelope.get("envelopeRootCertificateThumbprint") != self._ca_thumbprint:
+            return "Unknown root certificate thumbprint"
+
+        hash_name = envelope.get("envelopeSignatureReference")
+        if hash_name not in SIGNATURE_HASHES:
+            return "Unsupported signature reference"
+
+        try:
+            certificate = load_pem_x509_certificate(b"-----BEGIN CERTIFICATE-----\n" +
+                                                    envelope["envelopeSignatureCertificate"][0].encode() +
+                                                    b"\n-----END CERTIFICATE-----\n")
+            crypto_backend = get_crypto_backend()
+            if crypto_backend.verify(crypto_backend.load_verifying_key(certificate.public_key()),
+                                     envelope_payload(envelope), bytes.fromhex(signature), hash_name):
+                return ""
+        except (KeyError, IndexError, TypeError, ValueError):
+            pass
+        return "Invalid envelope signature"
+
+    def search(self, envelope : dict, signature : str = "") -> tuple[int, dict]:
+        """
+        Answer a search request
+        :param envelope: The envelope of the search filter
+        :param signature: The hex encoded envelope signature
+        :return: the status code and the response body
+        """
+        if self.check_signatures:
+            reason = self.verify_envelope(envelope, signature)
+            if reason:
+                return 400, {"message" : reason}
+
+        query = envelope.get("query", {})
+
+        if query.get("status") not in (None, "PROVISIONAL", "RELEASED", "DEPRECATED", "DELETED"):
+            return 400, {"message" : "Invalid status"}
+
+        if ("imo" in query) != ("mmsi" in query):
+            return 400, {"message" : "IMO and MMSI must be provided together"}
+
+        if query.get("name", "").startswith("INVALID"):
+            return 404, {"message" : "No results found"}
+
+        transaction_id = str(uuid4())
+        self._transactions.add(transaction_id)
+        instances = [build_service_instance(i, transaction_id) for i in range(self.result_size)]
+
+        if "instanceId" in query:
+            instances = [instance for instance in instances if instance["instanceId"] == query["instanceId"]]
+
+        return 200, {"serviceInstance" : instances}
+
+    def retrieve(self, transaction_id : str) -> tuple[int, dict | str]:
+        """
+        Answer a retrieve results request
+        :param transaction_id: The transaction id of the global search
+        :return: the status code and the response body
+        """
+        if transaction_id not in self._transactions:
+            return 404, "Unknown transaction id"
+
+        self.retrieve_count += 1
+        return 200, {"serviceInstance" : [build_service_instance(i, transaction_id)
+                                          for i in range(self.result_size)]}
+
+    def start(self) -> "StubMsr":
+        """
+        Start serving requests on a background thread
+        :return: the running stub
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving requests
+        :return: None
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._directory is not None:
+            self._directory.cleanup()
+
+
+def _serve(connection : "multiprocessing.connection.Connection", options : dict) -> None:
+    """
+    Run a stub MSR until the parent process asks it to stop
+    :param connection: Receives the stop request, sends the URL and CA file of the stub
+    :param options: The arguments of StubMsr
+    """
+    stub = StubMsr(**options).start()
+    connection.send((stub.url, stub.ca_file))
+    try:
+        connection.recv()
+    except EOFError:
+        pass
+    stub.stop()
+
+
+class StubMsrProcess:
+    """
+        Runs a StubMsr in a child process, so that in the end to end benchmarks
+        the stub's request handling and TLS handshakes do not compete with the
+        endorsement runs for the GIL
+    """
+
+    url : str
+    ca_file : str | None
+
+    _options : dict
+    _connection : "multiprocessing.connection.Connection"
+    _process : multiprocessing.Process
+
+    def __init__(self, **options) -> None:
+        """
+        Create a new stub MSR process
+        :param options: The arguments of StubMsr
+        """
+        self._options = options
+
+    def start(self) -> "StubMsrProcess":
+        """
+        Start the process and wait until the stub is serving requests
+        :return: the running stub process
+        """
+        context = multiprocessing.get_context("spawn")
+        self._connection, child_connection = context.Pipe()
+        self._process = context.Process(target=_serve, args=(child_connection, self._options), daemon=True)
+        self._process.start()
+        self.url, self.ca_file = self._connection.recv()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop the stub and wait for the process to exit
+        :return: None
+        """
+        self._connection.send(None)
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
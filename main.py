@@ -1,10 +1,29 @@
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException, Query, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
+from app.controllers.validate_msr_controller import ValidateMsrController
+from app.model.batch_test_data import BatchTestData
+from app.model.batch_test_results import BatchTestResults
+from app.model.exceptions.key_mismatch_exception import KeyMismatchException
+from app.model.job import Job
+from app.model.stored_run import StoredRun
 from app.model.test_results import TestResults
+from app.model.test_trend_point import TestTrendPoint
+from app.services.blob_store import BlobStore
+from app.services.event_stream import NDJSON_MEDIA_TYPE, SSE_MEDIA_TYPE, encode_event, negotiate_media_type
+from app.services.http_client_pool import HttpClientPool
+from app.services.job_queue import JobQueue
+from app.services.job_store import JobStore
+from app.services.openapi_registry import OpenApiRegistry
+from app.services.result_store import ResultStore
+from app.services.retention import Retention
+from app.services.test_metrics import TestMetrics
 from app.test_scripts.msr_openapi_validator import MsrOpenApiValidator
-from app.model.test_data import TestData
+from app.model.test_data import ProfileMode, TestData
 
 
 description = """
@@ -20,12 +39,65 @@ tags_metadata = [
     }
 ]
 
-app = FastAPI(openapi_tags=tags_metadata, title="MSR Validator", description=description)
+SCHEMA_PATH = "./app/schema/MSRv2-dodgy.json"
+JOB_DATABASE_PATH = "./data/jobs.db"
+RESULT_DATABASE_PATH = "./data/results.db"
+BLOB_STORE_PATH = "./data/responses"
+
+# Runs, their responses, finished jobs and profiles are kept for this many seconds
+RETENTION_SECONDS = 30 * 86400.0
+
+# Request header that turns on profiling, overriding TestData.profiling
+PROFILE_HEADER = "X-MSR-Profile"
+
+
+@asynccontextmanager
+async def lifespan(application : FastAPI):
+    # Compile the schema and load the generated validators once per worker
+    # before the first request arrives
+    OpenApiRegistry.get(SCHEMA_PATH)
+    OpenApiRegistry.get_compiled_validators(SCHEMA_PATH)
+
+    # The stores are opened here rather than on import, so importing the
+    # module creates no files
+    result_store = ResultStore(RESULT_DATABASE_PATH)
+    blob_store = BlobStore(BLOB_STORE_PATH)
+    job_store = JobStore(JOB_DATABASE_PATH)
+    job_queue = JobQueue(job_store, SCHEMA_PATH, result_store=result_store, blob_store=blob_store)
+    retention = Retention(result_store, blob_store, job_store, max_age=RETENTION_SECONDS)
+
+    application.state.result_store = result_store
+    application.state.blob_store = blob_store
+    application.state.job_queue = job_queue
+    job_queue.start()
+    retention.start()
+    try:
+        yield
+    finally:
+        await retention.stop()
+        await job_queue.stop()
+        await HttpClientPool.aclose()
+        job_store.close()
+        result_store.close()
+
+app = FastAPI(openapi_tags=tags_metadata, title="MSR Validator", description=description, lifespan=lifespan)
 logging.basicConfig(level=logging.INFO)
 
 
+@app.exception_handler(KeyMismatchException)
+async def key_mismatch_handler(_request : Request, exc : KeyMismatchException) -> JSONResponse:
+    """
+    Reject a private key that does not belong to its certificate as invalid input
+
+    :return:
+    """
+
+    return JSONResponse(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, content={"detail" : str(exc)})
+
+
 @app.post("/api/testServiceRegistry/", tags=["testServiceRegistry"])
-async def test_service_registry(data : TestData) -> TestResults:
+async def test_service_registry(data : TestData, request : Request,
+                                profile : ProfileMode | None = Header(None, alias=PROFILE_HEADER)) -> TestResults:
     """
     Test a given URL against the MSR OpenAPI schema
 
@@ -33,6 +105,150 @@ async def test_service_registry(data : TestData) -> TestResults:
     """
 
     logging.info(f"Test URL: {data.test_url}")
-    validate_msr = MsrOpenApiValidator(data, "./app/schema/MSRv2-dodgy.json")
+    if profile is not None:
+        data.profiling = profile
+    validate_msr = MsrOpenApiValidator(data, SCHEMA_PATH, request.app.state.result_store, request.app.state.blob_store)
+
+    return await validate_msr.validate_msr_async()
+
+
+@app.post("/api/testServiceRegistry/stream/", tags=["testServiceRegistry"], response_class=StreamingResponse,
+          responses={200 : {"content" : {NDJSON_MEDIA_TYPE : {}, SSE_MEDIA_TYPE : {}}}})
+async def stream_test_service_registry(data : TestData, request : Request, accept : str | None = Header(None),
+                                       profile : ProfileMode | None = Header(None, alias=PROFILE_HEADER)) -> StreamingResponse:
+    """
+    Test a given URL against the MSR OpenAPI schema, sending each test result as
+    soon as its test finishes. The results are sent as Server-Sent Events when the
+    client accepts text/event-stream, otherwise as newline delimited JSON. Closing
+    the connection stops the tests.
+
+    :return:
+    """
+
+    logging.info(f"Stream test URL: {data.test_url}")
+    if profile is not None:
+        data.profiling = profile
+    media_type = negotiate_media_type(accept)
+    controller = ValidateMsrController(SCHEMA_PATH, result_store=request.app.state.result_store,
+                                       blob_store=request.app.state.blob_store)
+
+    async def events():
+        async for event, payload in controller.stream(data):
+            yield encode_event(media_type, event, payload)
+
+    return StreamingResponse(events(), media_type=media_type, headers={"Cache-Control" : "no-cache"})
+
+
+@app.post("/api/testServiceRegistries/", tags=["testServiceRegistry"])
+async def test_service_registries(data : BatchTestData, request : Request,
+                                  profile : ProfileMode | None = Header(None, alias=PROFILE_HEADER)) -> BatchTestResults:
+    """
+    Test several URLs against the MSR OpenAPI schema at once
+
+    :return:
+    """
+
+    logging.info(f"Test URLs: {', '.join(target.test_url for target in data.targets)}")
+    if profile is not None:
+        for target in data.targets:
+            target.profiling = profile
+    controller = ValidateMsrController(SCHEMA_PATH, data.max_concurrency, data.max_per_host,
+                                       request.app.state.result_store, request.app.state.blob_store)
+
+    return await controller.validate(data.targets)
+
+
+@app.post("/api/testServiceRegistry/jobs/", tags=["testServiceRegistry"], status_code=status.HTTP_202_ACCEPTED)
+async def submit_test_service_registry_job(data : TestData, request : Request,
+                                           profile : ProfileMode | None = Header(None, alias=PROFILE_HEADER)) -> Job:
+    """
+    Queue a test of a given URL against the MSR OpenAPI schema. Poll the job for
+    its status and the results of the tests that have finished so far.
+
+    :return:
+    """
+
+    logging.info(f"Queue test URL: {data.test_url}")
+    if profile is not None:
+        data.profiling = profile
+    return await request.app.state.job_queue.submit(data)
+
+
+@app.get("/api/testServiceRegistry/jobs/{job_id}", tags=["testServiceRegistry"])
+async def get_test_service_registry_job(job_id : str, request : Request) -> Job:
+    """
+    Return the status and results of a queued test
+
+    :return:
+    """
+
+    job = await request.app.state.job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No job {job_id}")
+
+    return job
+
+
+@app.get("/api/testServiceRegistry/history/", tags=["testServiceRegistry"])
+async def get_latest_runs(request : Request) -> list[StoredRun]:
+    """
+    Return the latest run of every MSR that has been tested, most recent first
+
+    :return:
+    """
+
+    return await asyncio.to_thread(request.app.state.result_store.latest_runs)
+
+
+@app.get("/api/testServiceRegistry/history/latest", tags=["testServiceRegistry"])
+async def get_latest_run(test_url : str, request : Request) -> StoredRun:
+    """
+    Return the latest run of an MSR with its test results
+
+    :return:
+    """
+
+    run = await asyncio.to_thread(request.app.state.result_store.latest_run, test_url)
+    if run is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No runs of {test_url}")
+
+    return run
+
+
+@app.get("/api/testServiceRegistry/history/trend", tags=["testServiceRegistry"])
+async def get_test_trend(test_key : str, request : Request, test_url : str | None = None, since : float | None = None,
+                         until : float | None = None, bucket : float = Query(86400.0, gt=0)) -> list[TestTrendPoint]:
+    """
+    Return the pass rate and latency of a test per interval of bucket seconds. The
+    test_key is the test_key of its results, for example global_search.
+
+    :return:
+    """
+
+    return await asyncio.to_thread(request.app.state.result_store.test_trend, test_key, test_url, since, until, bucket)
+
+
+@app.get("/api/testServiceRegistry/responses/{response_ref}", tags=["testServiceRegistry"])
+async def get_test_response(response_ref : str, request : Request) -> dict:
+    """
+    Return the full response of a test result from its response_ref
+
+    :return:
+    """
+
+    response = await asyncio.to_thread(request.app.state.blob_store.get, response_ref)
+    if response is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No response {response_ref}")
+
+    return response
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """
+    Return the test latency histograms of this worker in the Prometheus text format
+
+    :return:
+    """
 
-    return validate_msr.validate_msr()
\ No newline at end of file
+    return PlainTextResponse(TestMetrics.render(), media_type="text/plain; version=0.0.4")